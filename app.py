@@ -1,33 +1,62 @@
 import os
-import openai
+import time
 import gradio as gr
 from dotenv import load_dotenv
 from vectorize import load_vector_store
-from rag_setup import user_prompt
-from config import OPENAI_MODEL, SYSTEM_PROMPT, MAX_TOKENS, TEMPERATURE, UI_CSS
+from rag_setup import auser_prompt, build_retriever
+from clients import get_async_openai_client
+from caching import SemanticAnswerCache, cache_query_embeddings, replay_answer, source_set
+from history import HistoryManager
+from sessions import SessionStore
+from config import (OPENAI_MODEL, SYSTEM_PROMPT, MAX_TOKENS, TEMPERATURE, UI_CSS, DB_PATH,
+                    SEMANTIC_CACHE_ENABLED, GRADIO_CONCURRENCY_LIMIT, SOURCE_SELECTOR_ENABLED)
 
 
-def chat(user_input, history):
+async def chat(user_input, history, sources=None, request: gr.Request = None):
     """
     Handles a chat interaction by building the conversation context, generating the assistant's 
     response in a streaming manner, and updating the chat history.
 
+    The handler is asynchronous end to end (retrieval and the OpenAI stream), so waiting on the
+    network never holds a Gradio worker thread and many conversations can stream at once.
+
     Args:
         user_input (str): The user's input message or question.
         history (list): The chat history in "messages" format, where each message is a dictionary 
                         with "role" (e.g., "user", "assistant") and "content" keys.
+        sources (list, optional): Sources selected in the UI to restrict the search to.
+        request (gr.Request): The Gradio request, injected by Gradio to identify the user's session.
 
     Yields:
         list: The updated chat history in "messages" format, including the streaming response.
     """
+    start_time = time.perf_counter()
+
+    # Questions without prior context can be answered from the semantic answer cache
+    use_semantic_cache = semantic_cache is not None and not history
+    if use_semantic_cache:
+        question_vector = await vector_store.embeddings.aembed_query(user_input)
+        retrieved_sources = source_set(await retriever.ainvoke(user_input, sources=sources))
+        cached_answer = semantic_cache.lookup(
+            question_vector, retrieved_sources)
+        if cached_answer is not None:
+            # Replay the cached answer through the same streaming flow as a fresh response
+            history += [{"role": "user", "content": user_input}]
+            for response in replay_answer(cached_answer):
+                yield history + [{"role": "assistant", "content": response}]
+            return
+
     # Initialize the messages list with the system prompt
     messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-    # Add the existing history and the current user input with retrieval context to the messages list
-    messages += history + \
-        [{"role": "user", "content": user_prompt(user_input, retriever)}]
-
-    # Create the chat completion stream using OpenAI's API
-    stream = openai.chat.completions.create(
+    # Add the token-budgeted history (recent turns verbatim, older turns summarized)
+    # and the current user input with retrieval context to the messages list
+    history_manager = history_managers.get(
+        request.session_hash if request else "default")
+    messages += history_manager.window(history) + \
+        [{"role": "user", "content": await auser_prompt(user_input, retriever, sources)}]
+
+    # Create the chat completion stream using OpenAI's async API (shared connection pool)
+    stream = await get_async_openai_client().chat.completions.create(
         model=OPENAI_MODEL,         # The model to use (e.g., "gpt-4")
         messages=messages,          # The full conversation context
         stream=True,                # Enable streaming for real-time responses
@@ -40,13 +69,20 @@ def chat(user_input, history):
 
     # Initialize an empty string to accumulate the assistant's response
     response = ""
-    for chunk in stream:
+    async for chunk in stream:
         # Extract the content of the current chunk and append it to the response
+        if not response and chunk.choices[0].delta.content:
+            print(
+                f"⏱️ Time to first token: {time.perf_counter() - start_time:.2f}s")
         response += chunk.choices[0].delta.content or ""
 
         # Yield the updated chat history with the current partial response
         yield history + [{"role": "assistant", "content": response}]
 
+    # Cache the complete answer for similar questions asked later
+    if use_semantic_cache:
+        semantic_cache.store(question_vector, retrieved_sources, response)
+
 
 # Build the Gradio interface with Blocks
 def launch_app():
@@ -80,10 +116,22 @@ def launch_app():
             with gr.Column(scale=1):  # Scale the Button to 1 part
                 send_button = gr.Button("Send", elem_id="send-button")
 
+        # Optional selector restricting the search to some authors or books
+        chat_inputs = [user_input, chatbot]
+        if SOURCE_SELECTOR_ENABLED:
+            with gr.Row():
+                source_selector = gr.Dropdown(
+                    choices=retriever.get_catalog().choices(),
+                    multiselect=True,
+                    label="Sources (optional)",
+                    info="Only search these authors or books. Leave empty to search the whole knowledge base.",
+                )
+            chat_inputs.append(source_selector)
+
         # Link both the Enter key and Send button to the chat function
         user_input.submit(
             fn=chat,
-            inputs=[user_input, chatbot],
+            inputs=chat_inputs,
             outputs=[chatbot],
             show_progress=True,
         ).then(
@@ -95,7 +143,7 @@ def launch_app():
 
         send_button.click(
             fn=chat,
-            inputs=[user_input, chatbot],
+            inputs=chat_inputs,
             outputs=[chatbot],
             show_progress=True,
         ).then(
@@ -105,7 +153,8 @@ def launch_app():
             outputs=[user_input]
         )
 
-    # Launch the interface
+    # Launch the interface, processing up to GRADIO_CONCURRENCY_LIMIT chat events at once
+    ui.queue(default_concurrency_limit=GRADIO_CONCURRENCY_LIMIT)
     ui.launch(inbrowser=True)
 
 
@@ -136,7 +185,15 @@ if __name__ == "__main__":
         # Load the vector store and create a retriever at app startup
         print("\n🔄 Loading the vector store and initializing the retriever...\n")
         vector_store = load_vector_store()
-        retriever = vector_store.as_retriever()
+        # Cache query embeddings and retrieval results so repeated questions skip the
+        # embedding round trip and the vector search (invalidated when the store is rebuilt)
+        cache_query_embeddings(vector_store)
+        retriever = build_retriever(vector_store, cached=True)
+        # Optionally reuse answers to near-duplicate questions (see SEMANTIC_CACHE_ENABLED)
+        semantic_cache = SemanticAnswerCache(
+            db_path=DB_PATH) if SEMANTIC_CACHE_ENABLED else None
+        # Keep one history manager (rolling summary state) per user session
+        history_managers = SessionStore(HistoryManager)
         print("✅ Vector store and retriever successfully initialized!\n")
     except Exception as error:
         raise Exception(
@@ -0,0 +1,432 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import openai
+from dotenv import load_dotenv
+
+from config import (BENCHMARK_QUESTIONS_PATH, BENCHMARK_RESULTS_DIR, BENCHMARK_REPEATS,
+                    BENCHMARK_LATENCY_TOLERANCE, BENCHMARK_QUALITY_TOLERANCE, DB_PATH, CHUNK_SIZE,
+                    CHUNK_OVERLAP, K_RESULTS, HYBRID_SEARCH_ENABLED, RERANK_ENABLED, RERANK_TOP_N,
+                    SOURCE_FILTER_ENABLED, VECTOR_PCA_DIMENSIONS, OPENAI_MODEL, OPENAI_EMBEDDINGS_MODEL,
+                    HF_EMBEDDINGS_MODEL, SYSTEM_PROMPT, MAX_TOKENS, TEMPERATURE)
+
+# Latency increases smaller than this are treated as noise when comparing runs
+MIN_LATENCY_DELTA_MS = 5.0
+
+# Compared metrics: (path in the store results, True if higher is better, tolerance is relative)
+COMPARED_METRICS = [
+    ("recall_at_k", True, False),
+    ("mrr", True, False),
+    ("retrieval_ms.p50", False, True),
+    ("retrieval_ms.p95", False, True),
+    ("prompt_tokens.mean", False, True),
+    ("first_token_ms.p95", False, True),
+    ("end_to_end_ms.p95", False, True),
+]
+
+
+def percentiles(seconds):
+    """
+    Summarizes latencies in milliseconds.
+
+    Args:
+        seconds (list): The measured latencies, in seconds.
+
+    Returns:
+        dict: The mean and the 50th, 90th, 95th and 99th percentiles, in ms (None if there is no measure).
+    """
+    if not seconds:
+        return None
+
+    values = np.asarray(seconds) * 1000
+    return {"mean": float(values.mean()),
+            **{f"p{q}": float(np.percentile(values, q)) for q in (50, 90, 95, 99)}}
+
+
+def load_questions(path=BENCHMARK_QUESTIONS_PATH):
+    """
+    Loads the benchmark questions.
+
+    Args:
+        path (Path): JSON file with a list of {"question", "relevant_books"} objects.
+
+    Returns:
+        list: The questions.
+    """
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def retrieval_quality(documents, relevant_books):
+    """
+    Scores retrieved documents against the books labeled as relevant to a question.
+
+    Args:
+        documents (list): The retrieved documents, best first.
+        relevant_books (list): The relevant book names.
+
+    Returns:
+        Tuple:
+            - recall (float): Fraction of the relevant books found among the documents.
+            - rank (int or None): Rank of the first document from a relevant book.
+    """
+    books = [doc.metadata.get("book") for doc in documents]
+    recall = len(set(relevant_books).intersection(books)) / len(relevant_books)
+    rank = next((rank for rank, book in enumerate(books, start=1) if book in relevant_books), None)
+
+    return recall, rank
+
+
+async def answer_question(question, retriever, client):
+    """
+    Answers a question like `app.chat` (retrieval, prompt, streamed completion) and times it.
+
+    Args:
+        question (str): The question.
+        retriever: The retriever.
+        client (openai.AsyncOpenAI): The OpenAI client.
+
+    Returns:
+        Tuple:
+            - first_token (float or None): Time to the first answer token, in seconds.
+            - total (float): Time to the complete answer, in seconds.
+    """
+    from rag_setup import auser_prompt
+
+    start_time = time.perf_counter()
+    messages = [{"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": await auser_prompt(question, retriever)}]
+    stream = await client.chat.completions.create(
+        model=OPENAI_MODEL, messages=messages, stream=True,
+        max_tokens=MAX_TOKENS, temperature=TEMPERATURE)
+
+    first_token = None
+    async for chunk in stream:
+        if first_token is None and chunk.choices and chunk.choices[0].delta.content:
+            first_token = time.perf_counter() - start_time
+
+    return first_token, time.perf_counter() - start_time
+
+
+async def measure_answers(questions, retriever, repeats):
+    """
+    Times end-to-end answers to questions.
+
+    The questions are answered in one event loop with one client, so connections are reused
+    as in the app; the client is closed at the end, since it cannot outlive its event loop.
+
+    Returns:
+        Tuple:
+            - first_tokens (list): Times to the first token, in seconds.
+            - totals (list): Times to the complete answers, in seconds.
+    """
+    first_tokens, totals = [], []
+    async with openai.AsyncOpenAI() as client:
+        for question in questions:
+            for _ in range(repeats):
+                first_token, total = await answer_question(question["question"], retriever, client)
+                if first_token is not None:
+                    first_tokens.append(first_token)
+                totals.append(total)
+
+    return first_tokens, totals
+
+
+def evaluate_store(vector_store, db_path, questions, repeats=BENCHMARK_REPEATS, answers=True):
+    """
+    Benchmarks the retrieval (and optionally the answers) of one vector store.
+
+    The retriever is the one the apps use (see `rag_setup.build_retriever`), without result
+    caching, so every repeat measures a full retrieval. Questions whose relevant books are
+    not in the store are skipped.
+
+    Args:
+        vector_store (Chroma): The vector store.
+        db_path (Path): Directory of the vector store.
+        questions (list): The labeled questions (see `load_questions`).
+        repeats (int): Number of timed runs per question.
+        answers (bool): If True, also time end-to-end answers from the chat model.
+
+    Returns:
+        dict: The metrics of the store and the results of every question.
+    """
+    from rag_setup import build_retriever, format_user_prompt
+    from tokens import count_tokens
+
+    retriever = build_retriever(vector_store, db_path=db_path)
+    stored_books = set(retriever.get_catalog().books)
+    labeled = [question for question in questions
+               if stored_books.intersection(question["relevant_books"])]
+
+    # Warm up (model loading, lexical index, first connections) before timing
+    if labeled:
+        retriever.invoke(labeled[0]["question"])
+
+    latencies, results = [], []
+    for question in labeled:
+        relevant_books = [book for book in question["relevant_books"] if book in stored_books]
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            documents = retriever.invoke(question["question"])
+            latencies.append(time.perf_counter() - start_time)
+
+        recall, rank = retrieval_quality(documents, relevant_books)
+        prompt = format_user_prompt(question["question"], documents)
+        results.append({
+            "question": question["question"],
+            "recall": recall,
+            "rank": rank,
+            "prompt_tokens": count_tokens(SYSTEM_PROMPT) + count_tokens(prompt),
+            "books": [doc.metadata.get("book") for doc in documents],
+        })
+
+    first_tokens, totals = [], []
+    if answers and labeled:
+        first_tokens, totals = asyncio.run(measure_answers(labeled, retriever, repeats))
+
+    prompt_tokens = [result["prompt_tokens"] for result in results]
+    return {
+        "questions": len(labeled),
+        "skipped": len(questions) - len(labeled),
+        "chunks": vector_store._collection.count(),
+        "recall_at_k": float(np.mean([result["recall"] for result in results])) if results else None,
+        "mrr": float(np.mean([1 / result["rank"] if result["rank"] else 0.0 for result in results]))
+        if results else None,
+        "retrieval_ms": percentiles(latencies),
+        "prompt_tokens": {"mean": float(np.mean(prompt_tokens)), "max": int(max(prompt_tokens))}
+        if prompt_tokens else None,
+        "first_token_ms": percentiles(first_tokens),
+        "end_to_end_ms": percentiles(totals),
+        "results": results,
+    }
+
+
+def run_benchmark(stores=("openai", "hf"), questions_path=BENCHMARK_QUESTIONS_PATH,
+                  repeats=BENCHMARK_REPEATS, answers=True):
+    """
+    Runs the benchmark against the OpenAI and/or Hugging Face vector stores.
+
+    Args:
+        stores (list): The stores to benchmark ("openai", "hf").
+        questions_path (Path): The labeled questions.
+        repeats (int): Number of timed runs per question.
+        answers (bool): If True, also time end-to-end answers from the chat model.
+
+    Returns:
+        dict: The run settings and the metrics of every store (or the error that prevented its benchmark).
+    """
+    from vectorize import load_vector_store, load_vector_store_hf
+
+    questions = load_questions(questions_path)
+    loaders = {"openai": (load_vector_store, DB_PATH),
+               "hf": (load_vector_store_hf, Path(f"{str(DB_PATH)}_hf"))}
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "settings": {
+            "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "k_results": K_RESULTS,
+            "hybrid_search": HYBRID_SEARCH_ENABLED, "rerank": RERANK_ENABLED,
+            "rerank_top_n": RERANK_TOP_N, "source_filter": SOURCE_FILTER_ENABLED,
+            "pca_dimensions": VECTOR_PCA_DIMENSIONS, "chat_model": OPENAI_MODEL,
+            "openai_embeddings_model": OPENAI_EMBEDDINGS_MODEL, "hf_embeddings_model": HF_EMBEDDINGS_MODEL,
+            "openai_base_url": os.getenv("OPENAI_BASE_URL"), "repeats": repeats,
+            "questions": str(questions_path),
+        },
+        "stores": {},
+    }
+
+    for name in stores:
+        loader, db_path = loaders[name]
+        print(f"\n📏 Benchmarking the {name} vector store ({db_path})...")
+        try:
+            vector_store = loader()
+            if vector_store is None or not (Path(db_path) / "chroma.sqlite3").exists():
+                raise FileNotFoundError(f"No vector store found in {db_path}")
+            results["stores"][name] = evaluate_store(vector_store, db_path, questions, repeats, answers)
+        except Exception as error:
+            print(f"❌ [Error]: {name} store: {error}")
+            results["stores"][name] = {"error": str(error)}
+
+    return results
+
+
+def save_results(results, path=None):
+    """
+    Saves benchmark results as JSON (by default in BENCHMARK_RESULTS_DIR, named after the run time).
+
+    Returns:
+        Path: The results file.
+    """
+    if path is None:
+        path = Path(BENCHMARK_RESULTS_DIR) / \
+            f"benchmark_{results['created'].replace(':', '').replace('-', '')}.json"
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+    return path
+
+
+def metric(store_results, path):
+    """
+    Reads a metric such as "retrieval_ms.p95" from the results of a store (None if missing).
+    """
+    value = store_results
+    for key in path.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+
+    return value
+
+
+def compare_results(baseline, current, latency_tolerance=BENCHMARK_LATENCY_TOLERANCE,
+                    quality_tolerance=BENCHMARK_QUALITY_TOLERANCE):
+    """
+    Compares two benchmark runs and lists the regressions.
+
+    Quality metrics (recall@k, MRR) regress when they drop by more than `quality_tolerance`
+    (absolute); latencies and prompt tokens regress when they grow by more than
+    `latency_tolerance` (relative; latency changes under MIN_LATENCY_DELTA_MS are ignored).
+
+    Args:
+        baseline (dict): The reference results.
+        current (dict): The new results.
+        latency_tolerance (float): Allowed relative growth of latencies and prompt tokens.
+        quality_tolerance (float): Allowed absolute drop of recall@k and MRR.
+
+    Returns:
+        Tuple:
+            - rows (list): (store, metric, baseline value, current value, regressed) per compared metric.
+            - regressions (list): Descriptions of the regressions.
+    """
+    rows, regressions = [], []
+    for store, baseline_store in baseline["stores"].items():
+        current_store = current["stores"].get(store)
+        if "error" in baseline_store:
+            continue
+        if current_store is None or "error" in current_store:
+            regressions.append(f"{store}: not benchmarked ({(current_store or {}).get('error', 'missing')})")
+            continue
+
+        for path, higher_is_better, relative in COMPARED_METRICS:
+            before, after = metric(baseline_store, path), metric(current_store, path)
+            if before is None or after is None:
+                continue
+            if higher_is_better:
+                regressed = after < before - quality_tolerance
+            else:
+                slack = MIN_LATENCY_DELTA_MS if path.endswith(("_ms.p50", "_ms.p95")) else 0.0
+                regressed = after > before * (1 + latency_tolerance) + slack
+            rows.append((store, path, before, after, regressed))
+            if regressed:
+                regressions.append(f"{store}: {path} {before:,.3f} -> {after:,.3f}")
+
+    return rows, regressions
+
+
+def print_summary(results):
+    """
+    Prints the main metrics of a benchmark run.
+    """
+    for name, store in results["stores"].items():
+        print(f"\n{'=' * 60}\n{name} vector store\n{'=' * 60}")
+        if "error" in store:
+            print(f"- Error: {store['error']}")
+            continue
+        print(f"- Questions: {store['questions']} ({store['skipped']} skipped, "
+              f"relevant books not in the store), {store['chunks']:,} chunks")
+        if not store["questions"]:
+            continue
+        print(f"- Recall@k: {store['recall_at_k']:.1%}, MRR: {store['mrr']:.3f}")
+        latency = store["retrieval_ms"]
+        print(f"- Retrieval: p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, "
+              f"p99 {latency['p99']:.1f} ms")
+        print(f"- Prompt tokens: {store['prompt_tokens']['mean']:,.0f} mean, "
+              f"{store['prompt_tokens']['max']:,} max")
+        if store["first_token_ms"]:
+            print(f"- First token: p50 {store['first_token_ms']['p50']:.1f} ms, "
+                  f"p95 {store['first_token_ms']['p95']:.1f} ms")
+        if store["end_to_end_ms"]:
+            print(f"- End to end: p50 {store['end_to_end_ms']['p50']:.1f} ms, "
+                  f"p95 {store['end_to_end_ms']['p95']:.1f} ms")
+
+
+def main(argv=None):
+    """
+    Command-line entry point: runs the benchmark and/or compares runs.
+
+    Returns:
+        int: The exit code (1 if a regression was found, 0 otherwise).
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark retrieval and answers of the CalisMind vector stores.")
+    parser.add_argument("--stores", nargs="+", choices=["openai", "hf"], default=["openai", "hf"])
+    parser.add_argument("--questions", type=Path, default=BENCHMARK_QUESTIONS_PATH,
+                        help="JSON file of questions labeled with their relevant books.")
+    parser.add_argument("--repeats", type=int, default=BENCHMARK_REPEATS,
+                        help="Timed runs per question.")
+    parser.add_argument("--no-answers", action="store_true",
+                        help="Only benchmark retrieval (no chat model calls).")
+    parser.add_argument("--stub", action="store_true",
+                        help="Serve the embeddings and chat model from the local deterministic stub.")
+    parser.add_argument("--stub-dimensions", type=int, default=1536,
+                        help="Dimensions of the stub embeddings (must match the OpenAI store).")
+    parser.add_argument("--output", type=Path, help="Results file (default: in BENCHMARK_RESULTS_DIR).")
+    parser.add_argument("--results", type=Path,
+                        help="Compare these existing results instead of running the benchmark.")
+    parser.add_argument("--baseline", type=Path,
+                        help="Results to compare against; exits with 1 on regressions.")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    if args.stub:
+        import embeddings
+        from stub_openai import run_server
+        server = run_server(port=0, dimensions=args.stub_dimensions, block=False)
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+        os.environ["OPENAI_API_KEY"] = "stub"
+        # Keep the stub's fake vectors out of the persistent embedding cache
+        cache_dir = tempfile.TemporaryDirectory(prefix="calismind_stub_cache_")
+        embeddings.EMBEDDING_CACHE_PATH = Path(cache_dir.name) / "embeddings.sqlite3"
+
+    if args.results:
+        with open(args.results, "r", encoding="utf-8") as file:
+            results = json.load(file)
+    else:
+        results = run_benchmark(args.stores, args.questions, args.repeats, not args.no_answers)
+        path = save_results(results, args.output)
+        print_summary(results)
+        print(f"\n💾 Results saved to {path}")
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as file:
+        baseline = json.load(file)
+    rows, regressions = compare_results(baseline, results)
+    print(f"\n📊 Comparison with {args.baseline}:")
+    for store, path, before, after, regressed in rows:
+        print(f"   {'❌' if regressed else '✅'} {store:<7} {path:<20} {before:>12,.3f} -> {after:>12,.3f}")
+    if regressions:
+        print(f"\n❌ [Regression]: {len(regressions)} metric(s) regressed.")
+        return 1
+
+    print("\n✅ [Success]: No regression.")
+    return 0
+
+
+if __name__ == "__main__":
+    """
+    Entry point, e.g.:
+
+        python benchmark.py --stub --stub-dimensions 1536
+        python benchmark.py --stores openai --baseline benchmark_results/benchmark_20250101T120000.json
+    """
+    sys.exit(main())
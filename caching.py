@@ -0,0 +1,378 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+from config import (DB_PATH, INDEX_MANIFEST_NAME, LEXICAL_INDEX_NAME, QUERY_CACHE_SIZE, QUERY_CACHE_TTL,
+                    SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MIN_SOURCE_OVERLAP, SEMANTIC_CACHE_SIZE)
+
+
+def normalize_question(text):
+    """
+    Normalizes a question so that trivially different phrasings share a cache entry.
+
+    Lowercases the text, collapses whitespace and strips surrounding punctuation,
+    e.g. "  Benefits of PULL-UPS? " -> "benefits of pull-ups".
+
+    Args:
+        text (str): The question text.
+
+    Returns:
+        str: The normalized question.
+    """
+    return re.sub(r"\s+", " ", text.lower()).strip(" \t\n?!.,;:")
+
+
+def store_version(db_path=DB_PATH):
+    """
+    Returns a version token for a persisted vector store that changes whenever it is rebuilt or updated.
+
+    The token is built from the modification times of the Chroma database file, the
+    index manifest and the lexical index, so checking it costs three `stat` calls.
+
+    Args:
+        db_path (Path): Directory of the vector store.
+
+    Returns:
+        tuple: The version token.
+    """
+    version = []
+    for name in ("chroma.sqlite3", INDEX_MANIFEST_NAME, LEXICAL_INDEX_NAME):
+        path = Path(db_path) / name
+        version.append(path.stat().st_mtime_ns if path.exists() else None)
+
+    return tuple(version)
+
+
+class TTLCache:
+    """
+    A thread-safe, in-process LRU cache whose entries also expire after a time-to-live.
+
+    Hit and miss counters are kept to measure the cache's effectiveness.
+    """
+
+    def __init__(self, max_size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        """
+        Args:
+            max_size (int): Maximum number of entries; the least recently used entry is evicted beyond it.
+            ttl (float): Time-to-live of an entry, in seconds.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the cached value for a key, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        """
+        Stores a value, evicting the least recently used entry if the cache is full.
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes all entries (the hit and miss counters are kept).
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the cache statistics.
+
+        Returns:
+            dict: Number of entries, hits, misses and hit rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / total if total else 0.0}
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an embeddings object with an in-process LRU/TTL cache of query embeddings.
+
+    Query embeddings depend only on the question and the embedding model, so they stay
+    valid across vector store rebuilds. Document embeddings are passed through.
+    """
+
+    def __init__(self, embeddings, cache=None):
+        """
+        Args:
+            embeddings (Embeddings): The embeddings object used on cache misses.
+            cache (TTLCache, optional): The cache to use (a new one by default).
+        """
+        self.embeddings = embeddings
+        self.cache = cache or TTLCache()
+
+    def embed_documents(self, texts):
+        """
+        Embeds documents with the wrapped embeddings object (not cached here).
+        """
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        """
+        Embeds a query, serving repeated (normalized) questions from the cache.
+        """
+        key = normalize_question(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(key, vector)
+
+        return vector
+
+    async def aembed_query(self, text):
+        """
+        Embeds a query asynchronously, serving repeated (normalized) questions from the cache.
+        """
+        key = normalize_question(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self.cache.put(key, vector)
+
+        return vector
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    Wraps a retriever with an in-process LRU/TTL cache of top-k retrieval results.
+
+    Results are keyed by the normalized question and the version of the persisted vector
+    store, and the cache is cleared automatically as soon as the store is rebuilt or updated.
+    """
+
+    retriever: BaseRetriever
+    db_path: Path = DB_PATH
+    cache: Any = None
+    version: Any = None
+
+    def model_post_init(self, __context):
+        if self.cache is None:
+            self.cache = TTLCache()
+
+    def _cache_key(self, query, **kwargs):
+        """
+        Builds the cache key for a query, clearing the cache if the store changed.
+        """
+        version = store_version(self.db_path)
+        if version != self.version:
+            self.cache.clear()
+            self.version = version
+
+        return (normalize_question(query), version, repr(sorted(kwargs.items())))
+
+    def _get_relevant_documents(self, query, *, run_manager, **kwargs):
+        key = self._cache_key(query, **kwargs)
+        documents = self.cache.get(key)
+        if documents is None:
+            documents = self.retriever.invoke(query, **kwargs)
+            self.cache.put(key, documents)
+
+        return list(documents)
+
+    async def _aget_relevant_documents(self, query, *, run_manager, **kwargs):
+        key = self._cache_key(query, **kwargs)
+        documents = self.cache.get(key)
+        if documents is None:
+            documents = await self.retriever.ainvoke(query, **kwargs)
+            self.cache.put(key, documents)
+
+        return list(documents)
+
+    def stats(self):
+        """
+        Returns the hit-rate counters of the retrieval result cache.
+        """
+        return self.cache.stats()
+
+
+def cache_query_embeddings(vector_store):
+    """
+    Enables the query embedding cache on a loaded vector store.
+
+    Args:
+        vector_store (Chroma): The vector store whose query embeddings should be cached.
+
+    Returns:
+        CachedQueryEmbeddings: The caching wrapper now used by the vector store.
+    """
+    embeddings = vector_store._embedding_function
+    if not isinstance(embeddings, CachedQueryEmbeddings):
+        embeddings = CachedQueryEmbeddings(embeddings)
+        vector_store._embedding_function = embeddings
+
+    return embeddings
+
+
+def source_set(documents):
+    """
+    Returns the set of (author, book) sources of retrieved documents.
+
+    Args:
+        documents (list): Retrieved documents with `author` and `book` metadata.
+
+    Returns:
+        frozenset: The distinct (author, book) pairs.
+    """
+    return frozenset((doc.metadata.get("author", "Unknown Author"), doc.metadata.get("book", "Unknown Book"))
+                     for doc in documents)
+
+
+def replay_answer(answer, words_per_step=3):
+    """
+    Replays a complete answer as a stream of growing partial responses, like a streamed LLM reply.
+
+    Args:
+        answer (str): The full answer text.
+        words_per_step (int): Number of words added per step.
+
+    Yields:
+        str: The answer so far.
+    """
+    # Split on whitespace but keep it, so the replayed text is identical to the original
+    parts = re.split(r"(\s+)", answer)
+    step = words_per_step * 2
+    for end in range(step, len(parts) + step, step):
+        yield "".join(parts[:end])
+
+
+class SemanticAnswerCache:
+    """
+    An in-process cache of answers to previously asked questions, matched by meaning.
+
+    Each entry stores the question embedding, the set of sources retrieved for it and the
+    answer. A new question reuses a cached answer when the cosine similarity of the question
+    embeddings reaches `threshold` and the retrieved sources overlap enough, so near-duplicate
+    questions skip the LLM call. Only use it for questions without prior conversation context.
+    The cache is cleared when the vector store is rebuilt or updated.
+    """
+
+    def __init__(self, db_path=DB_PATH, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 min_source_overlap=SEMANTIC_CACHE_MIN_SOURCE_OVERLAP, max_size=SEMANTIC_CACHE_SIZE):
+        """
+        Args:
+            db_path (Path): Directory of the vector store the answers are grounded in.
+            threshold (float): Minimum cosine similarity between question embeddings.
+            min_source_overlap (float): Minimum Jaccard overlap between the retrieved source sets.
+            max_size (int): Maximum number of cached answers; the least recently used is evicted beyond it.
+        """
+        self.db_path = db_path
+        self.threshold = threshold
+        self.min_source_overlap = min_source_overlap
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._entries = []  # (sources, answer, last_used) per row of self._vectors
+        self._version = None
+        self._lock = threading.Lock()
+
+    def lookup(self, question_vector, sources):
+        """
+        Returns the cached answer for a question similar to the given one, if any.
+
+        Args:
+            question_vector (list): The question embedding.
+            sources (frozenset): The sources retrieved for the question (see `source_set`).
+
+        Returns:
+            str or None: The cached answer, or None on a cache miss.
+        """
+        with self._lock:
+            self._check_version()
+            if self._entries:
+                similarities = self._vectors @ self._normalize(question_vector)
+                for row in np.argsort(-similarities):
+                    if similarities[row] < self.threshold:
+                        break
+                    cached_sources, answer, _ = self._entries[row]
+                    if self._overlap(sources, cached_sources) >= self.min_source_overlap:
+                        self._entries[row] = (
+                            cached_sources, answer, time.monotonic())
+                        self.hits += 1
+                        return answer
+            self.misses += 1
+            return None
+
+    def store(self, question_vector, sources, answer):
+        """
+        Caches the answer to a question.
+
+        Args:
+            question_vector (list): The question embedding.
+            sources (frozenset): The sources retrieved for the question.
+            answer (str): The generated answer.
+        """
+        vector = self._normalize(question_vector)[np.newaxis, :]
+        with self._lock:
+            self._check_version()
+            if len(self._entries) >= self.max_size:
+                # Evict the least recently used answer
+                oldest = min(range(len(self._entries)),
+                             key=lambda row: self._entries[row][2])
+                self._vectors = np.delete(self._vectors, oldest, axis=0)
+                del self._entries[oldest]
+            self._vectors = vector if self._vectors is None or not self._entries else np.vstack(
+                [self._vectors, vector])
+            self._entries.append((sources, answer, time.monotonic()))
+
+    def stats(self):
+        """
+        Returns the cache statistics.
+
+        Returns:
+            dict: Number of cached answers, hits, misses and hit rate.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / total if total else 0.0}
+
+    def _check_version(self):
+        """
+        Clears the cache if the vector store changed since the answers were cached.
+        Must be called with the lock held.
+        """
+        version = store_version(self.db_path)
+        if version != self._version:
+            self._vectors, self._entries = None, []
+            self._version = version
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    @staticmethod
+    def _overlap(sources, cached_sources):
+        if not sources and not cached_sources:
+            return 1.0
+        return len(sources & cached_sources) / len(sources | cached_sources)
@@ -0,0 +1,212 @@
+import re
+import threading
+from pathlib import Path
+from typing import Any
+from langchain_core.retrievers import BaseRetriever
+
+from caching import store_version
+from config import DB_PATH, INGEST_BATCH_SIZE, SOURCE_FILTER_ENABLED
+
+# Surnames shorter than this are too ambiguous to be matched on their own (e.g., "Low")
+MIN_SURNAME_LENGTH = 4
+
+
+def normalize_name(text):
+    """
+    Normalizes a name or question for mention matching ("Paul Wade's" -> "paul wade").
+    """
+    return re.sub(r"[^a-z0-9]+", " ", re.sub(r"'s\b", "", text.lower())).strip()
+
+
+class SourceCatalog:
+    """
+    The in-memory catalog of the authors and books stored in a vector store.
+
+    It is built once from the chunk metadata (`author` and `book`, see `add_metadata`)
+    and is used to detect the sources a question refers to and to turn them into
+    Chroma `where` filters.
+    """
+
+    def __init__(self, books):
+        """
+        Args:
+            books (dict): Maps each book name to its author name.
+        """
+        self.books = dict(sorted(books.items()))
+        self.authors = sorted(set(self.books.values()))
+        self._book_patterns = {book: f" {normalize_name(book)} " for book in self.books}
+        self._author_patterns = {author: f" {normalize_name(author)} " for author in self.authors}
+
+    def __len__(self):
+        return len(self.books)
+
+    @classmethod
+    def from_vector_store(cls, vector_store, batch_size=INGEST_BATCH_SIZE):
+        """
+        Builds the catalog from the metadata of the chunks in a vector store.
+
+        Args:
+            vector_store (Chroma): The vector store.
+            batch_size (int): Number of chunks read per batch.
+
+        Returns:
+            SourceCatalog: The catalog.
+        """
+        books, offset = {}, 0
+        while True:
+            stored = vector_store.get(
+                include=["metadatas"], limit=batch_size, offset=offset)
+            if not stored["ids"]:
+                break
+            for metadata in stored["metadatas"]:
+                if metadata and metadata.get("book"):
+                    books[metadata["book"]] = metadata.get(
+                        "author", "Unknown Author")
+            offset += len(stored["ids"])
+
+        return cls(books)
+
+    def detect(self, question):
+        """
+        Detects the authors and books a question mentions.
+
+        Books and full author names are matched case-insensitively; an author's surname
+        alone is matched only when it is capitalized inside the question ("What does Wade
+        recommend?") and long enough not to be an ordinary word.
+
+        Args:
+            question (str): The user's question.
+
+        Returns:
+            Tuple:
+                - authors (list): The mentioned authors whose books are not mentioned.
+                - books (list): The mentioned books.
+        """
+        text = f" {normalize_name(question)} "
+        books = [book for book, pattern in self._book_patterns.items()
+                 if pattern in text]
+
+        authors = []
+        for author, pattern in self._author_patterns.items():
+            surname = author.split()[-1]
+            if pattern in text or (len(surname) >= MIN_SURNAME_LENGTH and
+                                   re.search(rf"(?<=\w\W){re.escape(surname)}\b", question)):
+                authors.append(author)
+        # A mentioned book already narrows the search to its author
+        authors = [author for author in authors
+                   if not any(self.books[book] == author for book in books)]
+
+        return authors, books
+
+    @staticmethod
+    def where(authors=(), books=()):
+        """
+        Builds the Chroma `where` filter restricting a search to some authors and books.
+
+        Args:
+            authors (list): Author names.
+            books (list): Book names.
+
+        Returns:
+            dict or None: The filter, or None if no source is given.
+        """
+        conditions = []
+        if books:
+            conditions.append({"book": {"$in": sorted(books)}})
+        if authors:
+            conditions.append({"author": {"$in": sorted(authors)}})
+        if not conditions:
+            return None
+
+        return conditions[0] if len(conditions) == 1 else {"$or": conditions}
+
+    def choices(self):
+        """
+        Returns the sources as (label, value) choices for a Gradio source selector.
+
+        Returns:
+            list: One choice per author ("author:<name>") and per book ("book:<name>").
+        """
+        return ([(f"👤 {author}", f"author:{author}") for author in self.authors] +
+                [(f"📖 {book} ({author})", f"book:{book}") for book, author in self.books.items()])
+
+    @staticmethod
+    def parse_choices(values):
+        """
+        Splits selected source choices (see `choices`) into authors and books.
+
+        Returns:
+            Tuple:
+                - authors (list): The selected authors.
+                - books (list): The selected books.
+        """
+        values = values or []
+        return ([value.split(":", 1)[1] for value in values if value.startswith("author:")],
+                [value.split(":", 1)[1] for value in values if value.startswith("book:")])
+
+
+class SourceFilterRetriever(BaseRetriever):
+    """
+    Restricts retrieval to the sources a question is about.
+
+    The sources are either selected explicitly (`sources` invoke argument or field, with
+    values from `SourceCatalog.choices`) or detected from author and book mentions in the
+    question. They are pushed down to the wrapped retriever as a Chroma `where` filter
+    (`filter` invoke argument), so only the chunks of those books are searched. Questions
+    that mention no source search the whole collection.
+
+    The catalog is rebuilt automatically when the vector store is updated.
+    """
+
+    retriever: BaseRetriever
+    vectorstore: Any
+    db_path: Path = DB_PATH
+    sources: tuple = ()
+    detect_mentions: bool = SOURCE_FILTER_ENABLED
+    catalog: Any = None
+    version: Any = None
+
+    def model_post_init(self, __context):
+        self._lock = threading.Lock()
+
+    def get_catalog(self):
+        """
+        Returns the source catalog of the vector store, rebuilding it if the store changed.
+        """
+        with self._lock:
+            version = store_version(self.db_path)
+            if self.catalog is None or version != self.version:
+                self.catalog = SourceCatalog.from_vector_store(self.vectorstore)
+                self.version = version
+
+            return self.catalog
+
+    def get_filter(self, query, sources=None):
+        """
+        Returns the `where` filter for a question (None if it is not restricted to some sources).
+
+        Args:
+            query (str): The question.
+            sources (list, optional): Explicitly selected sources; they take precedence over mentions.
+        """
+        sources = sources or self.sources
+        if sources:
+            return SourceCatalog.where(*SourceCatalog.parse_choices(sources))
+        if self.detect_mentions:
+            return SourceCatalog.where(*self.get_catalog().detect(query))
+
+        return None
+
+    def _get_relevant_documents(self, query, *, run_manager, sources=None, **kwargs):
+        where = self.get_filter(query, sources)
+        if where is not None:
+            kwargs["filter"] = where
+
+        return self.retriever.invoke(query, **kwargs)
+
+    async def _aget_relevant_documents(self, query, *, run_manager, sources=None, **kwargs):
+        where = self.get_filter(query, sources)
+        if where is not None:
+            kwargs["filter"] = where
+
+        return await self.retriever.ainvoke(query, **kwargs)
@@ -0,0 +1,39 @@
+from functools import lru_cache
+import httpx
+import openai
+
+from config import OPENAI_MAX_CONNECTIONS, OPENAI_MAX_KEEPALIVE_CONNECTIONS
+
+
+@lru_cache(maxsize=None)
+def get_async_http_client():
+    """
+    Returns the HTTP client (and connection pool) shared by all async requests to OpenAI.
+
+    Reusing one pool lets concurrent conversations share keep-alive connections instead of
+    opening a new TLS connection per request, while capping the number of open connections.
+    The client must be used from a single event loop (e.g., Gradio's).
+
+    Returns:
+        httpx.AsyncClient: The shared HTTP client.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS,
+                            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS),
+        timeout=httpx.Timeout(600.0, connect=10.0),
+        follow_redirects=True
+    )
+
+
+@lru_cache(maxsize=None)
+def get_async_openai_client():
+    """
+    Returns the async OpenAI client shared by the chat handlers, on top of the shared connection pool.
+
+    The client is created on first use, so the API key and base URL are read from the
+    environment after the .env file has been loaded.
+
+    Returns:
+        openai.AsyncOpenAI: The shared async client.
+    """
+    return openai.AsyncOpenAI(http_client=get_async_http_client())
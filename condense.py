@@ -0,0 +1,87 @@
+import re
+from langchain.chains import LLMChain
+
+from config import CONDENSE_SKIP_STANDALONE
+
+# Words that refer back to earlier turns ("is it safe?", "what about those?")
+REFERRING_WORDS = {
+    "it", "its", "it's", "this", "that", "these", "those", "they", "them", "their", "theirs",
+    "he", "him", "his", "she", "her", "hers", "ones", "above", "previous", "earlier",
+    "before", "same", "former", "latter", "else", "again", "another", "other", "others",
+    "more", "instead", "there", "then"
+}
+
+# Openings of follow-up questions that only make sense with the previous turns
+FOLLOW_UP_OPENINGS = ("and ", "but ", "also ", "so ", "or ", "then ", "what about", "how about",
+                      "why", "ok", "okay", "thanks", "what else", "anything else", "same ",
+                      "can you elaborate", "tell me more", "explain more", "give me more")
+
+# Questions shorter than this (in words) are assumed to depend on the conversation
+MIN_STANDALONE_WORDS = 4
+
+
+def is_standalone_question(question):
+    """
+    Tells with cheap heuristics whether a follow-up question can be understood without the chat history.
+
+    A question is considered standalone when it is long enough, does not open like a
+    follow-up ("and...", "what about...", "why?") and contains no word referring back to
+    earlier turns (pronouns such as "it" or "those", "again", "more", ...). The heuristics
+    are conservative: a question wrongly flagged as a follow-up is simply condensed.
+
+    Args:
+        question (str): The user's question.
+
+    Returns:
+        bool: True if the question can be sent to retrieval as is.
+    """
+    text = question.strip().lower()
+    words = re.findall(r"[a-z']+", text)
+
+    if len(words) < MIN_STANDALONE_WORDS:
+        return False
+    if text.startswith(FOLLOW_UP_OPENINGS):
+        return False
+
+    return not REFERRING_WORDS.intersection(words)
+
+
+class StandaloneAwareQuestionChain(LLMChain):
+    """
+    The question-condensing step of a ConversationalRetrievalChain that skips the LLM call
+    for follow-up questions that are already standalone (see `is_standalone_question`).
+
+    Skipped questions are passed to retrieval unchanged. Counters of skipped and condensed
+    turns show how often the extra LLM round trip is saved.
+    """
+
+    skip_standalone: bool = CONDENSE_SKIP_STANDALONE
+    skipped: int = 0
+    condensed: int = 0
+
+    def _call(self, inputs, run_manager=None):
+        if self.skip_standalone and is_standalone_question(inputs["question"]):
+            self.skipped += 1
+            return {self.output_key: inputs["question"]}
+
+        self.condensed += 1
+        return super()._call(inputs, run_manager=run_manager)
+
+    async def _acall(self, inputs, run_manager=None):
+        if self.skip_standalone and is_standalone_question(inputs["question"]):
+            self.skipped += 1
+            return {self.output_key: inputs["question"]}
+
+        self.condensed += 1
+        return await super()._acall(inputs, run_manager=run_manager)
+
+    def stats(self):
+        """
+        Returns the condense step counters.
+
+        Returns:
+            dict: Number of follow-up turns whose condense step was skipped or run, and the skip rate.
+        """
+        total = self.skipped + self.condensed
+        return {"skipped": self.skipped, "condensed": self.condensed,
+                "skip_rate": self.skipped / total if total else 0.0}
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 
@@ -12,12 +13,24 @@ HF_EMBEDDINGS_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 # - "sentence-transformers/all-mpnet-base-v2": Higher accuracy but more resource-intensive.
 # - Replace this value with any HuggingFace model suitable for your use case.
 
+# Runtime options for the HuggingFace embeddings model.
+# The model is loaded once per process and shared by every caller.
+HF_DEVICE = "cpu"  # e.g., "cpu", "cuda" or "mps"
+HF_NUM_THREADS = None  # Number of PyTorch CPU threads (None keeps PyTorch's default)
+HF_BATCH_SIZE = 32  # Number of texts encoded per forward pass
+HF_WARMUP_ON_STARTUP = False  # Load the model when the vectorize CLI starts instead of on first use
+
 # Define paths for storing the vector database and knowledge base
 # Path to store the vector database (Chroma store)
 DB_PATH = Path("./calismind_db")
 # Root directory for the knowledge base (PDFs, etc.)
 KNOWLEDGE_BASE_DIR = Path("./calisthenics_knowledge_base")
 
+# Name of the manifest file kept inside each vector store directory.
+# It records the size, modification time, content hash and chunk IDs of every indexed book,
+# so incremental updates only embed new or changed books and remove chunks of deleted ones.
+INDEX_MANIFEST_NAME = "index_manifest.json"
+
 # Define chunking parameters for document processing
 CHUNK_SIZE = 1000  # Number of characters per chunk
 CHUNK_OVERLAP = 200  # Number of overlapping characters between consecutive chunks
@@ -42,8 +55,99 @@ Recommended Chunking Values for Common Use Cases:
     . Overlap: 150-250
 """
 
+# Text splitter used to cut pages into chunks:
+# - "character": splits on blank lines only (pages without blank lines can give oversized chunks).
+# - "recursive": splits on paragraphs, then lines, sentences and words, so chunks fit CHUNK_SIZE.
+# - "sentence": like "recursive", but cuts at sentence ends rather than inside sentences.
+# - "token": sentence-aware, with chunks of CHUNK_SIZE_TOKENS tokens (overlap CHUNK_OVERLAP_TOKENS)
+#   counted with the tokenizer of the embedding model (SPLITTER_TOKENIZER: "openai" or "hf").
+#   Hugging Face models truncate long inputs (256 tokens for all-MiniLM-L6-v2), so token-based
+#   sizing keeps whole chunks embedded.
+# The splitter settings are recorded per book, so changing them re-indexes the books on the next update.
+TEXT_SPLITTER = "recursive"
+CHUNK_SIZE_TOKENS = 256
+CHUNK_OVERLAP_TOKENS = 50
+SPLITTER_TOKENIZER = "openai"
+
+# (CHUNK_SIZE, CHUNK_OVERLAP) pairs compared by the chunk settings sweep of the vectorize CLI.
+# Each one gets a throwaway vector store that is benchmarked with the benchmark questions.
+CHUNK_SWEEP_CONFIGS = [(500, 100), (800, 150), (1000, 200), (1500, 300)]
+
+# Directory of the page-text cache: the text extracted from each PDF, keyed by file content
+# hash, so books are parsed only once however often they are re-split.
+PAGE_CACHE_DIR = Path("./calismind_cache/pages")
+
+# Cache the pages extracted from PDFs (see PAGE_CACHE_DIR) when loading and indexing documents,
+# so unchanged books go straight from the cache to splitting.
+PAGE_CACHE_ENABLED = True
+
+# Library used to extract the text of PDF pages:
+# - "pypdf": pure Python, always installed (default).
+# - "pymupdf": MuPDF bindings, typically several times faster (`pip install pymupdf`).
+# - "pypdfium2": PDFium bindings, also much faster than pypdf (`pip install pypdfium2`).
+# Backends extract slightly different text, so pages are cached per backend. Books already
+# indexed keep the text of their backend until they change or the store is rebuilt.
+PDF_BACKEND = "pypdf"
+
+# Number of worker processes used to parse and split PDFs in parallel during ingestion.
+# PDF parsing is CPU-bound, so using all cores cuts ingestion time roughly by the core count.
+# Set to 1 to load documents serially in the current process.
+INGEST_WORKERS = os.cpu_count() or 1
+
+# Number of chunks embedded and upserted per batch when streaming books into the vector store.
+# Memory use during ingestion is bounded by this batch size instead of the corpus size.
+INGEST_BATCH_SIZE = 256
+
+# OpenAI embeddings model used to build and query the OpenAI vector store.
+# The pre-built store was created with "text-embedding-ada-002"; rebuild it after changing this value.
+OPENAI_EMBEDDINGS_MODEL = "text-embedding-ada-002"
+
+# Batching and concurrency of the OpenAI embeddings client used when building the vector store.
+# Chunks are grouped into requests of at most EMBEDDING_BATCH_MAX_TOKENS tokens and
+# EMBEDDING_BATCH_MAX_INPUTS texts, with up to EMBEDDING_MAX_CONCURRENCY requests in flight.
+# On rate-limit (429) responses the client backs off and lowers its concurrency adaptively.
+EMBEDDING_BATCH_MAX_TOKENS = 100_000
+EMBEDDING_BATCH_MAX_INPUTS = 512
+EMBEDDING_MAX_CONCURRENCY = 8
+EMBEDDING_MAX_RETRIES = 6
+
+# On-disk embedding cache keyed by (embedding model, chunk text hash).
+# Rebuilding a vector store only embeds chunks that were never embedded before;
+# when the cache exceeds EMBEDDING_CACHE_MAX_BYTES, the least recently used vectors are evicted.
+EMBEDDING_CACHE_PATH = Path("./calismind_cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_BYTES = 1024 ** 3  # 1 GB
+
+# HNSW index parameters of the Chroma collections (Chroma's defaults shown).
+# They are applied when a vector store is created, or rebuilt in place with the vectorize CLI.
+# - HNSW_SPACE: Distance metric, "l2", "ip" or "cosine" (OpenAI and MiniLM vectors are normalized,
+#   so all three rank identically; changing it requires a rebuild).
+# - HNSW_M: Links per node; higher improves recall at the cost of memory and build time.
+# - HNSW_CONSTRUCTION_EF: Build-time search width; higher builds a better graph, more slowly.
+# - HNSW_SEARCH_EF: Query-time search width; higher improves recall at the cost of query latency.
+# The rebuild reports recall@RECALL_K against exact search over RECALL_SAMPLE_SIZE sample queries.
+HNSW_SPACE = "l2"
+HNSW_M = 16
+HNSW_CONSTRUCTION_EF = 100
+HNSW_SEARCH_EF = 10
+RECALL_K = 10
+RECALL_SAMPLE_SIZE = 100
+
+# Optional reduced-dimension vector storage. When VECTOR_PCA_DIMENSIONS is set (e.g., 256), new
+# vector stores keep their chunk vectors projected onto that many principal components (a PCA
+# fitted on the chunks, saved next to the store as VECTOR_PROJECTION_NAME), which shrinks the
+# index, the database and the load time proportionally. With VECTOR_RESCORE_ENABLED, vector search
+# candidates (VECTOR_RESCORE_CANDIDATES without hybrid retrieval) are rescored with their
+# full-precision vectors from the embedding cache. The vectorize statistics report the bytes
+# per vector and the recall impact. None keeps full-precision vectors.
+VECTOR_PCA_DIMENSIONS = None
+VECTOR_PROJECTION_NAME = "pca_projection.npz"
+VECTOR_RESCORE_ENABLED = True
+VECTOR_RESCORE_CANDIDATES = 30
+
 # Number of top chunks to retrieve from the vector store for each query.
-K_RESULTS = 25
+# With hybrid retrieval (see below), exact exercise names are matched lexically,
+# so a much smaller k gives the recall that previously required k = 25.
+K_RESULTS = 8
 """
 Suggestions for K_RESULTS:
 - Small Knowledge Base (e.g., < 500 chunks): Use a smaller value like 5-10 to reduce unnecessary retrieval.
@@ -51,8 +155,94 @@ Suggestions for K_RESULTS:
 - Question Answering: A value of 15-30 is recommended to capture enough context without overwhelming the LLM.
 - Summarization: Lower values (5-10) are often sufficient since the focus is on summarizing key points.
 - Experiment: Start with 25 as a baseline and adjust based on retrieval performance and LLM output quality.
+- Hybrid retrieval: 5-10 is usually enough; raise it again if HYBRID_SEARCH_ENABLED is False.
 """
 
+# Hybrid retrieval: vector search and BM25 lexical search, fused with reciprocal rank fusion.
+# The lexical index is built by vectorize.py alongside each vector store and saved in its
+# directory as LEXICAL_INDEX_NAME (stores without one get it built from their chunks on first
+# use). Each search returns HYBRID_FETCH_K candidates before fusion;
+# RRF_K is the rank smoothing constant of the fusion (60 is the usual value).
+HYBRID_SEARCH_ENABLED = True
+LEXICAL_INDEX_NAME = "lexical_index.json.gz"
+HYBRID_FETCH_K = 30
+RRF_K = 60
+
+# Optional reranking of the retrieved chunks with a small cross-encoder running on CPU
+# (requires `sentence-transformers`). RERANK_CANDIDATES chunks are retrieved, scored in
+# batches of RERANK_BATCH_SIZE and the best RERANK_TOP_N are kept. Scoring stops when it would
+# exceed RERANK_BUDGET_MS milliseconds; unscored candidates then keep their retrieval order.
+# Scores of up to RERANK_CACHE_SIZE (question, chunk) pairs are cached.
+RERANK_ENABLED = False
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_DEVICE = "cpu"
+RERANK_CANDIDATES = 20
+RERANK_TOP_N = 5
+RERANK_BUDGET_MS = 150
+RERANK_BATCH_SIZE = 8
+RERANK_CACHE_SIZE = 10_000
+
+# Metadata-filtered retrieval.
+# With SOURCE_FILTER_ENABLED, questions that mention an author or a book of the knowledge base
+# only search the chunks of those sources (Chroma `where` filter on the `author`/`book` metadata).
+# SOURCE_SELECTOR_ENABLED adds a selector to the chat UIs to restrict the search explicitly.
+SOURCE_FILTER_ENABLED = True
+SOURCE_SELECTOR_ENABLED = True
+
+# In-process cache of query embeddings and top-k retrieval results used by the chat apps.
+# Entries are keyed by the normalized question (and the vector store version for retrieval results),
+# evicted least-recently-used beyond QUERY_CACHE_SIZE entries and expire after QUERY_CACHE_TTL seconds.
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_TTL = 3600
+
+# Opt-in semantic answer cache: reuse the answer to a previous question when a new question
+# without prior conversation context is similar enough (cosine similarity of the question
+# embeddings >= SEMANTIC_CACHE_THRESHOLD) and retrieves overlapping sources (Jaccard overlap of
+# the (author, book) sets >= SEMANTIC_CACHE_MIN_SOURCE_OVERLAP). Skips the LLM call entirely.
+SEMANTIC_CACHE_ENABLED = False
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_MIN_SOURCE_OVERLAP = 0.5
+SEMANTIC_CACHE_SIZE = 512
+
+# Per-session conversation state in the chat apps.
+# Each Gradio session gets its own conversation state; sessions idle for SESSION_IDLE_TIMEOUT
+# seconds are evicted, and at most MAX_SESSIONS sessions are kept (least recently used evicted first).
+SESSION_IDLE_TIMEOUT = 30 * 60
+MAX_SESSIONS = 500
+
+# Token-budgeted chat history used by both chat apps.
+# The most recent turns are sent verbatim as long as they fit in HISTORY_TOKEN_BUDGET tokens
+# (counted for OPENAI_MODEL); older turns are folded into a rolling summary written in the
+# background by HISTORY_SUMMARY_MODEL, in at most HISTORY_SUMMARY_MAX_TOKENS tokens.
+HISTORY_TOKEN_BUDGET = 3000
+HISTORY_SUMMARY_MODEL = "gpt-4o-mini"
+HISTORY_SUMMARY_MAX_TOKENS = 300
+
+# Context packing for the prompts of app.py.
+# The text of the retrieved chunks is added to the prompt in order of relevance, with citations,
+# until CONTEXT_TOKEN_BUDGET tokens are used. Chunks whose word 3-grams are mostly
+# (>= CONTEXT_DEDUP_THRESHOLD) already in the context are skipped, and text shared by
+# overlapping chunks of the same page (see CHUNK_OVERLAP) is included only once.
+CONTEXT_TOKEN_BUDGET = 2500
+CONTEXT_DEDUP_THRESHOLD = 0.8
+
+# Async request path of the Gradio apps.
+# GRADIO_CONCURRENCY_LIMIT chat events are processed at the same time; the async handlers
+# wait on the network without holding a worker thread, so this can exceed the thread count.
+# All requests to OpenAI share one HTTP connection pool of at most OPENAI_MAX_CONNECTIONS
+# connections, OPENAI_MAX_KEEPALIVE_CONNECTIONS of which are kept open between requests.
+GRADIO_CONCURRENCY_LIMIT = 64
+OPENAI_MAX_CONNECTIONS = 100
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 20
+
+# Question condensing in langchain_app.py.
+# Follow-up questions are rewritten into standalone questions before retrieval by
+# CONDENSE_QUESTION_MODEL (a cheaper model than OPENAI_MODEL is enough; None reuses OPENAI_MODEL).
+# With CONDENSE_SKIP_STANDALONE, questions that heuristics detect as already standalone
+# (no pronouns referring back, no follow-up opening) skip this extra LLM call.
+CONDENSE_QUESTION_MODEL = "gpt-4o-mini"
+CONDENSE_SKIP_STANDALONE = True
+
 # Defines the maximum number of tokens allowed for the response or input processing.
 MAX_TOKENS = 2000
 
@@ -73,10 +263,27 @@ VECTORIZE_CLI_CHOICES = [
     "Load an existing vector store using a Hugging Face open-source model",         # Option 6
     # Option 7
     "Print detailed statistics about the vector store",
-    # Option 8
+    "Incrementally update the vector store (streamed in batches, resumable)",       # Option 8
+    "Incrementally update the Hugging Face vector store (streamed, resumable)",    # Option 9
+    "Rebuild/compact the HNSW index of the loaded store (reports recall)",         # Option 10
+    "Remove orphaned segments and vacuum the vector stores (reports disk use)",   # Option 11
+    "Compare chunk settings on throwaway stores (CHUNK_SWEEP_CONFIGS)",            # Option 12
+    "Compare the text splitters on the loaded documents (speed and chunk sizes)",  # Option 13
+    # Option 14
     "Exit the application"
 ]
 
+# Benchmark of the vector stores (see benchmark.py): the questions labeled with their relevant
+# books, the directory of the JSON results, and the number of timed runs per question. When
+# comparing with a baseline run, a drop of recall@k or MRR larger than BENCHMARK_QUALITY_TOLERANCE
+# (absolute), or a growth of latency or prompt tokens larger than BENCHMARK_LATENCY_TOLERANCE
+# (relative), is reported as a regression.
+BENCHMARK_QUESTIONS_PATH = Path("./benchmark_questions.json")
+BENCHMARK_RESULTS_DIR = Path("./benchmark_results")
+BENCHMARK_REPEATS = 3
+BENCHMARK_LATENCY_TOLERANCE = 0.2
+BENCHMARK_QUALITY_TOLERANCE = 0.02
+
 # Notes for Developers:
 # - Ensure the `calisthenics_knowledge_base` directory exists and contains the documents (PDFs, etc.) to process.
 # - Adjust `DB_PATH` and `KNOWLEDGE_BASE_DIR` as needed to suit your directory structure.
@@ -92,6 +299,7 @@ Behavior Guidelines
    - Understand the user's input thoroughly and provide accurate responses.
    - Your answers should always be clear and relevant to the user's question.
    - Use simplified explanations when necessary to make the information user-friendly.
+   - Base your answers on the numbered excerpts in the "Context" section provided with the user's input.
 
 2. Citing Sources:
    - At the end of every response, include the sources (book name and author) from which you derived the answer.
@@ -0,0 +1,597 @@
+import asyncio
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import openai
+from langchain_core.embeddings import Embeddings
+from langchain.embeddings import HuggingFaceEmbeddings
+
+from config import (EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_BYTES, OPENAI_EMBEDDINGS_MODEL,
+                    EMBEDDING_BATCH_MAX_TOKENS, EMBEDDING_BATCH_MAX_INPUTS,
+                    EMBEDDING_MAX_CONCURRENCY, EMBEDDING_MAX_RETRIES, HF_EMBEDDINGS_MODEL,
+                    HF_DEVICE, HF_NUM_THREADS, HF_BATCH_SIZE)
+from clients import get_async_openai_client
+from tokens import count_tokens, truncate_tokens
+
+# Maximum number of tokens accepted by the OpenAI embeddings models for a single input
+EMBEDDING_MAX_INPUT_TOKENS = 8191
+
+# Endpoint of the OpenAI API (vectors from other endpoints, e.g. a stub server, are cached apart)
+OPENAI_DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+# Version of the embedding cache layout. Caches written by an older version are emptied
+# when opened: before version 2, vectors from a stub server were cached under the real
+# model's name, with the same dimension, and cannot be told apart from real vectors.
+EMBEDDING_CACHE_VERSION = 2
+
+# Process-wide registry of loaded Hugging Face embedding models, keyed by (model, device, batch size)
+_hf_models = {}
+_hf_models_lock = threading.Lock()
+
+
+def embedding_model_name(embeddings):
+    """
+    Returns a name identifying the model behind an embeddings object.
+
+    Vectors from different models are not interchangeable, so this name is part of
+    the embedding cache key. Models served by another endpoint than the OpenAI API
+    (e.g., the stub server of `stub_openai.py`) are named with their base URL, so their
+    vectors never mix with the real model's.
+
+    Args:
+        embeddings (Embeddings): The embeddings object (e.g., OpenAIEmbeddings, HuggingFaceEmbeddings).
+
+    Returns:
+        str: The model name (with the base URL for other endpoints), or the embeddings class
+             name if the model is unknown.
+    """
+    name = getattr(embeddings, "model", None) or getattr(
+        embeddings, "model_name", None) or type(embeddings).__name__
+    base_url = getattr(embeddings, "base_url", None) or getattr(embeddings, "openai_api_base", None)
+    if base_url and base_url.rstrip("/") != OPENAI_DEFAULT_BASE_URL:
+        name = f"{name}@{base_url.rstrip('/')}"
+
+    return name
+
+
+def get_hf_embedding_model(model_name=HF_EMBEDDINGS_MODEL, device=HF_DEVICE, num_threads=HF_NUM_THREADS,
+                           batch_size=HF_BATCH_SIZE):
+    """
+    Returns a Hugging Face (sentence-transformers) embedding model, loading it only once per process.
+
+    Loading a model dominates the run time of short jobs on CPU-only machines, so every
+    caller asking for the same model, device and batch size shares one loaded instance.
+
+    Args:
+        model_name (str): The sentence-transformers model to load.
+        device (str): Device to run the model on (e.g., "cpu", "cuda", "mps").
+        num_threads (int, optional): Number of CPU threads used by PyTorch (None keeps the default).
+        batch_size (int): Number of texts encoded per forward pass.
+
+    Returns:
+        HuggingFaceEmbeddings: The shared embedding model.
+    """
+    key = (model_name, device, batch_size)
+    with _hf_models_lock:
+        if key not in _hf_models:
+            if num_threads:
+                import torch
+                torch.set_num_threads(num_threads)
+            _hf_models[key] = HuggingFaceEmbeddings(
+                model_name=model_name,
+                model_kwargs={"device": device},
+                encode_kwargs={"batch_size": batch_size}
+            )
+
+    return _hf_models[key]
+
+
+def warm_up_hf_embedding_model(**kwargs):
+    """
+    Loads a Hugging Face embedding model into the registry and runs one encoding pass,
+    so the first real request does not pay for model loading and initialization.
+
+    Args:
+        **kwargs: Options forwarded to `get_hf_embedding_model`.
+
+    Returns:
+        HuggingFaceEmbeddings: The warmed-up shared embedding model.
+    """
+    model = get_hf_embedding_model(**kwargs)
+    model.embed_query("warm up")
+
+    return model
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings object with a persistent, size-bounded on-disk cache.
+
+    Document embeddings are stored in a SQLite database keyed by (model name, SHA-256 of
+    the text), so rebuilding a vector store only pays for chunks that were never embedded
+    before. When the cache grows beyond `max_bytes`, the least recently used vectors are
+    evicted. Query embeddings are passed through uncached.
+
+    Once the model's vector dimension is known (from the first vectors it returns), cached
+    vectors of another dimension are ignored and embedded again. A cache written by an
+    older version (see EMBEDDING_CACHE_VERSION) is emptied when it is opened.
+
+    Hit and miss counters are kept for the current session and accumulated on disk.
+    """
+
+    def __init__(self, embeddings, cache_path=None, max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+        """
+        Opens (or creates) the embedding cache.
+
+        Args:
+            embeddings (Embeddings): The embeddings object used on cache misses.
+            cache_path (Path, optional): Path of the SQLite cache file (default: EMBEDDING_CACHE_PATH,
+                                         read when the cache is opened).
+            max_bytes (int): Maximum total size of the cached vectors, in bytes.
+        """
+        cache_path = cache_path or EMBEDDING_CACHE_PATH
+        self.embeddings = embeddings
+        self.model_name = embedding_model_name(embeddings)
+        self.max_bytes = max_bytes
+        self.dimensions = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(
+            str(cache_path), check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT, text_hash TEXT, vector BLOB, size INTEGER, last_access REAL, "
+                "PRIMARY KEY (model, text_hash))")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache_stats ("
+                "model TEXT PRIMARY KEY, hits INTEGER, misses INTEGER)")
+            # Drop the vectors of older versions, which may hold stub vectors under real model names
+            version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+            if version < EMBEDDING_CACHE_VERSION:
+                self._connection.execute("DELETE FROM embeddings")
+                self._connection.execute("DELETE FROM cache_stats")
+                self._connection.execute(f"PRAGMA user_version = {EMBEDDING_CACHE_VERSION}")
+        self._total_bytes = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def embed_documents(self, texts):
+        """
+        Embeds a list of documents, serving previously seen texts from the cache.
+
+        Args:
+            texts (list): The texts to embed.
+
+        Returns:
+            list: One embedding (list of floats) per text, in input order.
+        """
+        hashes = [hashlib.sha256(text.encode("utf-8")).hexdigest()
+                  for text in texts]
+        cached = self._lookup(set(hashes))
+
+        # Embed each missing text once, even if it appears several times in the batch
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in cached:
+                missing.setdefault(text_hash, text)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            if vectors:
+                self.dimensions = len(vectors[0])
+            new_vectors = dict(zip(missing, vectors))
+            self._store(new_vectors)
+            cached.update(new_vectors)
+
+        self._record(hits=len(texts) - len(missing), misses=len(missing))
+
+        return [cached[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text):
+        """
+        Embeds a single query with the wrapped embeddings object (not cached).
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            list: The query embedding.
+        """
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text):
+        """
+        Embeds a single query asynchronously with the wrapped embeddings object (not cached).
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            list: The query embedding.
+        """
+        return await self.embeddings.aembed_query(text)
+
+    def stats(self):
+        """
+        Returns the cache statistics.
+
+        Returns:
+            dict: Session and cumulative hits/misses, number of cached vectors and cache size.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT hits, misses FROM cache_stats WHERE model = ?", (self.model_name,)).fetchone()
+            entries = self._connection.execute(
+                "SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+        total_hits, total_misses = row or (0, 0)
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": total_hits,
+            "total_misses": total_misses,
+            "entries": entries,
+            "size_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _lookup(self, hashes):
+        """
+        Fetches cached vectors for the given text hashes and marks them as recently used.
+        """
+        found = {}
+        hashes = list(hashes)
+        with self._lock, self._connection:
+            # Stay well below SQLite's limit on the number of query parameters
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    (self.model_name, *batch)).fetchall()
+                for text_hash, blob in rows:
+                    # Skip vectors of another dimension (e.g., cached before the model changed)
+                    if self.dimensions and len(blob) != self.dimensions * 4:
+                        continue
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[text_hash] = vector.tolist()
+                self._connection.execute(
+                    f"UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash IN ({placeholders})",
+                    (time.time(), self.model_name, *batch))
+
+        return found
+
+    def _store(self, vectors):
+        """
+        Stores new vectors in the cache and evicts the least recently used ones if needed.
+        """
+        now = time.time()
+        rows = []
+        for text_hash, vector in vectors.items():
+            blob = array("f", vector).tobytes()
+            rows.append((self.model_name, text_hash, blob, len(blob), now))
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+            self._total_bytes += sum(row[3] for row in rows)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """
+        Deletes least recently used vectors until the cache fits in `max_bytes`.
+        Must be called with the lock held, inside a transaction.
+        """
+        excess = self._total_bytes - self.max_bytes
+        evicted_ids, freed = [], 0
+        for rowid, size in self._connection.execute(
+                "SELECT rowid, size FROM embeddings ORDER BY last_access"):
+            if freed >= excess:
+                break
+            evicted_ids.append((rowid,))
+            freed += size
+        self._connection.executemany(
+            "DELETE FROM embeddings WHERE rowid = ?", evicted_ids)
+        self._total_bytes -= freed
+
+    def _record(self, hits, misses):
+        """
+        Updates the session and cumulative hit/miss counters.
+        """
+        self.hits += hits
+        self.misses += misses
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO cache_stats VALUES (?, ?, ?) ON CONFLICT (model) "
+                "DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                (self.model_name, hits, misses))
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits the number of in-flight requests and adapts the limit to rate-limit responses.
+
+    The limit follows an additive-increase / multiplicative-decrease scheme: it is halved
+    on every rate-limit response and grows back by one slot per `limit` successful requests.
+    A rate-limit response also pauses all new requests until its retry delay has passed.
+    """
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.resume_at = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        """
+        Waits for a free request slot and for any rate-limit pause to end.
+        """
+        async with self._condition:
+            while True:
+                delay = self.resume_at - time.monotonic()
+                if delay > 0:
+                    # Sleep without holding the condition so other tasks can observe the pause
+                    self._condition.release()
+                    try:
+                        await asyncio.sleep(delay)
+                    finally:
+                        await self._condition.acquire()
+                    continue
+                if self.in_flight < max(1, int(self.limit)):
+                    self.in_flight += 1
+                    return
+                await self._condition.wait()
+
+    async def release(self, rate_limited=False, retry_after=0.0):
+        """
+        Frees a request slot and adjusts the concurrency limit.
+
+        Args:
+            rate_limited (bool): Whether the request was rejected with a rate-limit response.
+            retry_after (float): Seconds to pause all requests after a rate-limit response.
+        """
+        async with self._condition:
+            self.in_flight -= 1
+            if rate_limited:
+                self.limit = max(1.0, self.limit / 2)
+                self.resume_at = max(
+                    self.resume_at, time.monotonic() + retry_after)
+            else:
+                self.limit = min(float(self.max_concurrency),
+                                 self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class AsyncOpenAIEmbeddings(Embeddings):
+    """
+    OpenAI embeddings client that batches texts by token budget and embeds the batches
+    concurrently with asyncio.
+
+    Several requests are kept in flight at once; on rate-limit (429) responses the client
+    backs off (honoring the `Retry-After` header when present) and lowers its concurrency,
+    then ramps back up as requests succeed. Throughput of the last and all calls is
+    available from `stats()`.
+
+    The client honors the `OPENAI_BASE_URL` environment variable, so it can be pointed at
+    a local stub server (see `stub_openai.py`) to test it offline.
+    """
+
+    def __init__(self, model=OPENAI_EMBEDDINGS_MODEL, max_batch_tokens=EMBEDDING_BATCH_MAX_TOKENS,
+                 max_batch_inputs=EMBEDDING_BATCH_MAX_INPUTS, max_concurrency=EMBEDDING_MAX_CONCURRENCY,
+                 max_retries=EMBEDDING_MAX_RETRIES, base_url=None, api_key=None):
+        """
+        Args:
+            model (str): The OpenAI embeddings model.
+            max_batch_tokens (int): Maximum number of tokens sent in a single request.
+            max_batch_inputs (int): Maximum number of texts sent in a single request.
+            max_concurrency (int): Maximum number of requests in flight at once.
+            max_retries (int): Maximum number of retries per batch on rate-limit or transient errors.
+            base_url (str, optional): API base URL (defaults to `OPENAI_BASE_URL` or the OpenAI API).
+            api_key (str, optional): API key (defaults to `OPENAI_API_KEY`).
+        """
+        self.model = model
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_inputs = max_batch_inputs
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.api_key = api_key
+        self._query_client = None
+        self._totals = {"chunks": 0, "tokens": 0, "seconds": 0.0,
+                        "requests": 0, "rate_limited": 0}
+        self._last_run = None
+
+    def embed_documents(self, texts):
+        """
+        Embeds a list of documents, running the asynchronous batched client to completion.
+
+        Args:
+            texts (list): The texts to embed.
+
+        Returns:
+            list: One embedding (list of floats) per text, in input order.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aembed_documents(texts))
+
+        # Called from inside a running event loop: run the client on its own loop in a worker thread
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.aembed_documents(texts)).result()
+
+    async def aembed_documents(self, texts):
+        """
+        Embeds a list of documents with batched, concurrent, rate-limit aware requests.
+
+        Args:
+            texts (list): The texts to embed.
+
+        Returns:
+            list: One embedding (list of floats) per text, in input order.
+        """
+        if not texts:
+            return []
+
+        start_time = time.perf_counter()
+        vectors = [None] * len(texts)
+        run_stats = {"chunks": len(texts), "tokens": 0,
+                     "requests": 0, "rate_limited": 0}
+        limiter = AdaptiveConcurrencyLimiter(self.max_concurrency)
+
+        async with openai.AsyncOpenAI(base_url=self.base_url, api_key=self.api_key, max_retries=0) as client:
+            batches = self._make_batches(texts)
+            await asyncio.gather(*(self._embed_batch(client, limiter, batch, vectors, run_stats)
+                                   for batch in batches))
+
+        run_stats["seconds"] = time.perf_counter() - start_time
+        for key in self._totals:
+            self._totals[key] += run_stats[key]
+        self._last_run = run_stats
+
+        return vectors
+
+    def embed_query(self, text):
+        """
+        Embeds a single query with a persistent synchronous client (keeps its connection pool warm).
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            list: The query embedding.
+        """
+        if self._query_client is None:
+            self._query_client = openai.OpenAI(
+                base_url=self.base_url, api_key=self.api_key)
+        response = self._query_client.embeddings.create(
+            model=self.model, input=[truncate_tokens(text, EMBEDDING_MAX_INPUT_TOKENS, self.model)])
+
+        return response.data[0].embedding
+
+    async def aembed_query(self, text):
+        """
+        Embeds a single query with the async OpenAI client shared by the chat handlers
+        (see `clients.get_async_openai_client`), so queries use its connection pool.
+
+        Args:
+            text (str): The query text.
+
+        Returns:
+            list: The query embedding.
+        """
+        client = get_async_openai_client()
+        options = {key: value for key, value in (("base_url", self.base_url), ("api_key", self.api_key))
+                   if value}
+        if options:
+            client = client.with_options(**options)
+        response = await client.embeddings.create(
+            model=self.model, input=[truncate_tokens(text, EMBEDDING_MAX_INPUT_TOKENS, self.model)])
+
+        return response.data[0].embedding
+
+    def stats(self):
+        """
+        Returns the throughput of the last call and of all calls so far.
+
+        Returns:
+            dict: "last_run" and "total" statistics, each with chunks, tokens, seconds, requests,
+                  rate-limited responses, chunks/sec and tokens/sec.
+        """
+        def with_rates(stats):
+            if stats is None:
+                return None
+            seconds = stats["seconds"] or float("inf")
+            return {**stats,
+                    "chunks_per_sec": stats["chunks"] / seconds,
+                    "tokens_per_sec": stats["tokens"] / seconds}
+
+        return {"last_run": with_rates(self._last_run), "total": with_rates(self._totals)}
+
+    def _make_batches(self, texts):
+        """
+        Groups texts into batches that stay within the per-request token and input budgets.
+
+        Returns:
+            list: Batches as lists of (index, text, num_tokens) tuples.
+        """
+        batches, batch, batch_tokens = [], [], 0
+        for index, text in enumerate(texts):
+            # Empty inputs are rejected by the API, and inputs longer than the model's
+            # context are truncated rather than rejected
+            text = text or " "
+            num_tokens = count_tokens(text, self.model)
+            if num_tokens > EMBEDDING_MAX_INPUT_TOKENS:
+                text = truncate_tokens(
+                    text, EMBEDDING_MAX_INPUT_TOKENS, self.model)
+                num_tokens = EMBEDDING_MAX_INPUT_TOKENS
+            if batch and (batch_tokens + num_tokens > self.max_batch_tokens
+                          or len(batch) >= self.max_batch_inputs):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append((index, text, num_tokens))
+            batch_tokens += num_tokens
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    async def _embed_batch(self, client, limiter, batch, vectors, run_stats):
+        """
+        Embeds one batch, retrying with exponential backoff on rate-limit and transient errors.
+        """
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire()
+            try:
+                response = await client.embeddings.create(
+                    model=self.model, input=[text for _, text, _ in batch])
+            except openai.RateLimitError as error:
+                run_stats["rate_limited"] += 1
+                delay = self._retry_delay(error, attempt)
+                await limiter.release(rate_limited=True, retry_after=delay)
+                if attempt == self.max_retries:
+                    raise
+                continue
+            except (openai.APIConnectionError, openai.InternalServerError):
+                await limiter.release()
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self._retry_delay(None, attempt))
+                continue
+
+            await limiter.release()
+            run_stats["requests"] += 1
+            run_stats["tokens"] += response.usage.prompt_tokens if response.usage else sum(
+                num_tokens for _, _, num_tokens in batch)
+            for (index, _, _), item in zip(batch, sorted(response.data, key=lambda item: item.index)):
+                vectors[index] = item.embedding
+            return
+
+    @staticmethod
+    def _retry_delay(error, attempt):
+        """
+        Returns how long to wait before retrying: the server's `Retry-After` when given,
+        otherwise exponential backoff with jitter.
+        """
+        if error is not None and error.response is not None:
+            retry_after = error.response.headers.get("retry-after")
+            try:
+                return float(retry_after)
+            except (TypeError, ValueError):
+                pass
+
+        return min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
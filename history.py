@@ -0,0 +1,142 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import openai
+
+from config import OPENAI_MODEL, HISTORY_TOKEN_BUDGET, HISTORY_SUMMARY_MODEL, HISTORY_SUMMARY_MAX_TOKENS
+from tokens import count_tokens
+
+# Approximate number of tokens OpenAI adds per chat message for role and formatting
+MESSAGE_TOKEN_OVERHEAD = 4
+
+# Summaries are computed off the request path, shared by all conversations
+_summary_executor = ThreadPoolExecutor(
+    max_workers=2, thread_name_prefix="history-summary")
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a user and CalisMind, a calisthenics assistant.
+Update the existing summary with the new messages. Keep the user's goals, level, constraints and any
+facts, exercises, programs or sources already discussed. Be concise and write in the third person.
+"""
+
+
+def summarize_messages(summary, messages, model=HISTORY_SUMMARY_MODEL):
+    """
+    Folds a list of chat messages into a rolling conversation summary with an OpenAI model.
+
+    Args:
+        summary (str): The current summary ("" if there is none yet).
+        messages (list): Chat messages in "messages" format to fold into the summary.
+        model (str): The OpenAI model used to write the summary.
+
+    Returns:
+        str: The updated summary.
+    """
+    transcript = "\n".join(
+        f"{message['role'].title()}: {message['content']}" for message in messages)
+    response = openai.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"}
+        ],
+        max_tokens=HISTORY_SUMMARY_MAX_TOKENS,
+        temperature=0
+    )
+
+    return response.choices[0].message.content.strip()
+
+
+class HistoryManager:
+    """
+    Keeps the chat history sent to the model within a token budget.
+
+    The most recent messages are kept verbatim as long as they fit in `token_budget` tokens
+    (counted with the tokenizer of `model`). Older messages are folded into a rolling summary
+    that is computed in the background, so trimming never delays a response; until a new
+    summary is ready, the previous one is used.
+
+    One manager holds the summary state of one conversation.
+    """
+
+    def __init__(self, model=OPENAI_MODEL, token_budget=HISTORY_TOKEN_BUDGET, summary_model=HISTORY_SUMMARY_MODEL):
+        """
+        Args:
+            model (str): The chat model the history is sent to (used to count tokens).
+            token_budget (int): Maximum number of tokens of verbatim history.
+            summary_model (str): The OpenAI model used to summarize older messages.
+        """
+        self.model = model
+        self.token_budget = token_budget
+        self.summary_model = summary_model
+        self.summary = ""
+        self._summarized_upto = 0  # Number of leading history messages folded into the summary
+        self._first_message = None  # Used to detect that the conversation was restarted
+        self._pending = None
+        # Reentrant: a summary that finishes immediately runs its callback in the submitting thread
+        self._lock = threading.RLock()
+
+    def window(self, history):
+        """
+        Returns the part of the history to send to the model.
+
+        Args:
+            history (list): The full chat history in "messages" format.
+
+        Returns:
+            list: The rolling summary (as a system message, if any) followed by the
+                  most recent messages that fit in the token budget.
+        """
+        messages = [{"role": message["role"], "content": message["content"]}
+                    for message in history if message["role"] in ("user", "assistant")]
+
+        with self._lock:
+            first_message = messages[0] if messages else None
+            if first_message != self._first_message or len(messages) < self._summarized_upto:
+                # A different conversation: forget the summary of the previous one
+                self.summary, self._summarized_upto, self._pending = "", 0, None
+                self._first_message = first_message
+
+            cut = self._window_start(messages)
+            if cut > self._summarized_upto and self._pending is None:
+                # Fold the messages that fell out of the window into the summary, off the request path
+                self._pending = _summary_executor.submit(
+                    summarize_messages, self.summary, messages[self._summarized_upto:cut], self.summary_model)
+                self._pending.add_done_callback(
+                    lambda future, upto=cut: self._apply_summary(future, upto))
+
+            window = messages[cut:]
+            if self.summary:
+                window = [{"role": "system",
+                           "content": f"Summary of the earlier conversation:\n{self.summary}"}] + window
+
+            return window
+
+    def _window_start(self, messages):
+        """
+        Returns the index of the first message that is kept verbatim.
+        """
+        used, cut = 0, len(messages)
+        for index in range(len(messages) - 1, -1, -1):
+            used += count_tokens(messages[index]["content"],
+                                 self.model) + MESSAGE_TOKEN_OVERHEAD
+            if used > self.token_budget:
+                break
+            cut = index
+
+        # Start the window on a user message so it never opens with an orphaned answer
+        while cut < len(messages) and messages[cut]["role"] != "user":
+            cut += 1
+
+        return cut
+
+    def _apply_summary(self, future, upto):
+        """
+        Stores a finished background summary. Failed summaries are retried on the next turn.
+        """
+        with self._lock:
+            if future is not self._pending:
+                return  # The conversation was reset while summarizing
+            self._pending = None
+            if future.exception() is None:
+                self.summary = future.result()
+                self._summarized_upto = upto
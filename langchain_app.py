@@ -1,11 +1,124 @@
 import os
+import time
 import gradio as gr
 from dotenv import load_dotenv
-from rag_setup import initialize_conversation_chain
-from config import UI_CSS
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from rag_setup import (initialize_shared_components, initialize_condense_llm, build_conversation_chain,
+                       CONDENSE_QUESTION_TAG)
+from caching import SemanticAnswerCache, cache_query_embeddings, replay_answer, source_set
+from history import HistoryManager
+from sessions import SessionStore
+from config import (UI_CSS, DB_PATH, SEMANTIC_CACHE_ENABLED, GRADIO_CONCURRENCY_LIMIT,
+                    SOURCE_SELECTOR_ENABLED)
 
+# Maps chat roles to LangChain message classes
+MESSAGE_CLASSES = {"user": HumanMessage,
+                   "assistant": AIMessage, "system": SystemMessage}
 
-def chat_as_tuples(user_question, history):
+
+def get_chat_history(history, request):
+    """
+    Builds the token-budgeted chat history passed to the conversation chain.
+
+    Each Gradio session has its own history manager, which keeps the most recent turns
+    verbatim within the configured token budget and folds older turns into a rolling
+    summary, so prompts stop growing in long sessions and never mix users.
+
+    Args:
+        history (list): The chat history in "messages" format.
+        request (gr.Request): The Gradio request, identifying the user's session.
+
+    Returns:
+        list: The windowed history as LangChain messages.
+    """
+    session_id = request.session_hash if request else "default"
+    window = sessions.get(session_id).window(history)
+
+    return [MESSAGE_CLASSES[message["role"]](content=message["content"]) for message in window]
+
+
+async def stream_answer(user_question, chat_history, sources=None):
+    """
+    Streams the assistant's answer to a question with the conversation chain.
+
+    The tokens of the question-condensing step and of the final answer are yielded as soon
+    as the model produces them, and the time to first token of every turn is printed.
+
+    Questions without prior conversation context are first looked up in the semantic
+    answer cache (if enabled); on a hit the LLM call is skipped and the cached answer
+    is replayed through the same streaming flow.
+
+    The chain runs asynchronously (async retrieval and OpenAI calls over the shared
+    connection pool), so a pending answer does not hold a Gradio worker thread.
+
+    Args:
+        user_question (str): The user's input question or message.
+        chat_history (list): The windowed chat history as LangChain messages.
+        sources (list, optional): Sources selected in the UI to restrict the search to.
+
+    Yields:
+        Tuple:
+            - step (str): "condense" while the standalone question is written, then "answer".
+            - text (str): The standalone question or the answer generated so far.
+    """
+    start_time = time.perf_counter()
+
+    # Restrict retrieval to the selected sources with a per-request copy of the chain
+    chain = conversation_chain
+    if sources:
+        chain = conversation_chain.model_copy(update={
+            "retriever": conversation_chain.retriever.model_copy(update={"sources": tuple(sources)})})
+
+    use_semantic_cache = semantic_cache is not None and not chat_history
+    if use_semantic_cache:
+        question_vector = await query_embeddings.aembed_query(user_question)
+        retrieved_sources = source_set(await chain.retriever.ainvoke(user_question))
+        cached_answer = semantic_cache.lookup(
+            question_vector, retrieved_sources)
+        if cached_answer is not None:
+            for response in replay_answer(cached_answer):
+                yield "answer", response
+            return
+
+    # Stream the events of the conversation chain and forward the chat model tokens
+    condensed_question, answer, first_token_time = "", "", None
+    async for event in chain.astream_events(
+            {"question": user_question, "chat_history": chat_history}, version="v2"):
+        if event["event"] == "on_chat_model_stream":
+            token = event["data"]["chunk"].content
+            if not token:
+                continue
+            if first_token_time is None:
+                first_token_time = time.perf_counter() - start_time
+            if CONDENSE_QUESTION_TAG in event.get("tags", []):
+                condensed_question += token
+                yield "condense", condensed_question
+            else:
+                answer += token
+                yield "answer", answer
+        elif event["event"] == "on_chain_end" and not event["parent_ids"]:
+            # The complete answer of the chain (also covers models that do not stream)
+            if event["data"]["output"]["answer"] != answer:
+                answer = event["data"]["output"]["answer"]
+                yield "answer", answer
+
+    if first_token_time is not None:
+        print(f"⏱️ Time to first token: {first_token_time:.2f}s "
+              f"(full answer: {time.perf_counter() - start_time:.2f}s)")
+
+    # Report how often follow-up turns skip the question-condensing LLM call
+    if chat_history:
+        condense_stats = conversation_chain.question_generator.stats()
+        print(f"✂️ Condense step: skipped {condense_stats['skipped']} / "
+              f"condensed {condense_stats['condensed']} follow-up turns "
+              f"({condense_stats['skip_rate']:.0%} skipped)")
+
+    # Cache the answer for similar questions asked later
+    if use_semantic_cache:
+        semantic_cache.store(question_vector, retrieved_sources, answer)
+
+
+async def chat_as_tuples(user_question, history, sources=None, request: gr.Request = None):
     """
     Handles chat interactions for Gradio's Chatbot component in the default "tuples" format.
 
@@ -17,25 +130,31 @@ def chat_as_tuples(user_question, history):
         user_question (str): The user's input question or message.
         history (list): The chat history represented as a list of tuples 
                         (e.g., [(user_message, ai_response), ...]).
+        sources (list, optional): Sources selected in the UI to restrict the search to.
+        request (gr.Request): The Gradio request, injected by Gradio to identify the user's session.
 
-    Returns:
-        list: The updated chat history, including the user's input and the assistant's response,
-              formatted as a list of tuples.
+    Yields:
+        list: The updated chat history, including the user's input and the assistant's streaming
+              response, formatted as a list of tuples.
     """
-    # Generate the assistant's response by invoking the conversation chain
-    result = conversation_chain.invoke({"question": user_question})
-    answer = result["answer"]
-
-    # Add the user's question and the assistant's response as a tuple to the history
-    history.append((user_question, answer))
+    # Generate the assistant's response with the session's token-budgeted history
+    # (or reuse a cached answer to a similar question)
+    messages = []
+    for user_message, ai_response in history:
+        messages += [{"role": "user", "content": user_message},
+                     {"role": "assistant", "content": ai_response}]
+    chat_history = get_chat_history(messages, request)
 
-    # Return the updated history in the "tuples" format
-    return history
+    async for step, text in stream_answer(user_question, chat_history, sources):
+        # While the standalone question is written, show it in place of the answer
+        response = f"🔎 {text}" if step == "condense" else text
+        # Yield the history with the user's question and the current partial response as a tuple
+        yield history + [(user_question, response)]
     # Note: Gradio's gr.Chatbot component defaults to this "tuples" format unless
     # the "type" parameter is explicitly set to "messages".
 
 
-def chat_as_messages(user_question, history):
+async def chat_as_messages(user_question, history, sources=None, request: gr.Request = None):
     """
     Handles chat interactions for Gradio's Chatbot component in the "messages" format.
 
@@ -51,23 +170,28 @@ def chat_as_messages(user_question, history):
         user_question (str): The user's input question or message.
         history (list): The chat history represented as a list of dictionaries, 
                         each with a "role" and "content" key.
+        sources (list, optional): Sources selected in the UI to restrict the search to.
+        request (gr.Request): The Gradio request, injected by Gradio to identify the user's session.
 
-    Returns:
-        list: The updated chat history, including the user's input and the assistant's response, 
-              formatted as a list of dictionaries.
+    Yields:
+        list: The updated chat history, including the user's input and the assistant's streaming
+              response, formatted as a list of dictionaries.
     """
-    # Add the user's question as a dictionary with role "user" to the history
-    history.append({"role": "user", "content": user_question})
-
-    # Generate the assistant's response by invoking the conversation chain
-    result = conversation_chain.invoke({"question": user_question})
-    answer = result["answer"]
+    # Generate the assistant's response with the session's token-budgeted history
+    # (or reuse a cached answer to a similar question)
+    chat_history = get_chat_history(history, request)
 
-    # Add the assistant's response as a dictionary with role "assistant" to the history
-    history.append({"role": "assistant", "content": answer})
+    # Add the user's question as a dictionary with role "user" to the history
+    history = history + [{"role": "user", "content": user_question}]
 
-    # Return the updated history in the "messages" format
-    return history
+    async for step, text in stream_answer(user_question, chat_history, sources):
+        if step == "condense":
+            # Show the standalone question being written as a titled message, until the answer starts
+            yield history + [{"role": "assistant", "content": text,
+                              "metadata": {"title": "🔎 Standalone question"}}]
+        else:
+            # Yield the history with the assistant's current partial response
+            yield history + [{"role": "assistant", "content": text}]
     # Note: When using gr.Chatbot(type="messages") or gr.ChatInterface(type="messages"),
     # this "messages" format is required for proper functionality and compatibility.
 
@@ -108,10 +232,22 @@ def launch_app():
             with gr.Column(scale=1):  # Scale the Button to 1 part
                 send_button = gr.Button("Send", elem_id="send-button")
 
+        # Optional selector restricting the search to some authors or books
+        chat_inputs = [user_input, chatbot]
+        if SOURCE_SELECTOR_ENABLED:
+            with gr.Row():
+                source_selector = gr.Dropdown(
+                    choices=conversation_chain.retriever.get_catalog().choices(),
+                    multiselect=True,
+                    label="Sources (optional)",
+                    info="Only search these authors or books. Leave empty to search the whole knowledge base.",
+                )
+            chat_inputs.append(source_selector)
+
         # Link both the Enter key and Send button to the chat function
         user_input.submit(
             fn=chat_as_messages,
-            inputs=[user_input, chatbot],
+            inputs=chat_inputs,
             outputs=[chatbot],
             show_progress=True,
         ).then(
@@ -123,7 +259,7 @@ def launch_app():
 
         send_button.click(
             fn=chat_as_messages,
-            inputs=[user_input, chatbot],
+            inputs=chat_inputs,
             outputs=[chatbot],
             show_progress=True,
         ).then(
@@ -133,7 +269,8 @@ def launch_app():
             outputs=[user_input]
         )
 
-    # Launch the interface
+    # Launch the interface, processing up to GRADIO_CONCURRENCY_LIMIT chat events at once
+    ui.queue(default_concurrency_limit=GRADIO_CONCURRENCY_LIMIT)
     ui.launch(inbrowser=True)
 
 
@@ -161,9 +298,22 @@ if __name__ == "__main__":
     print("✅ OpenAI API key successfully loaded.\n")
 
     try:
-        # Initialize the conversation chain
+        # Initialize the shared chat model, retriever and conversation chain once; each user
+        # session only keeps its own history manager (see get_chat_history)
         print("\n🔄 Initializing the conversation chain...\n")
-        conversation_chain = initialize_conversation_chain()
+        # Optionally reuse answers to near-duplicate questions (see SEMANTIC_CACHE_ENABLED).
+        # Query embeddings and retrieval results are cached so the cache lookup and the
+        # chain share a single vector search.
+        llm, retriever = initialize_shared_components(
+            cached=SEMANTIC_CACHE_ENABLED)
+        semantic_cache, query_embeddings = None, None
+        if SEMANTIC_CACHE_ENABLED:
+            query_embeddings = cache_query_embeddings(retriever.vectorstore)
+            semantic_cache = SemanticAnswerCache(db_path=DB_PATH)
+
+        conversation_chain = build_conversation_chain(
+            llm, retriever, use_memory=False, condense_llm=initialize_condense_llm(llm))
+        sessions = SessionStore(HistoryManager)
         print("\n✅ Conversation chain successfully initialized!\n")
     except Exception as error:
         raise Exception(
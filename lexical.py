@@ -0,0 +1,396 @@
+import gzip
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import run_in_executor
+
+from caching import store_version
+from quantization import find_projected_embeddings
+from config import (DB_PATH, LEXICAL_INDEX_NAME, K_RESULTS, HYBRID_FETCH_K, RRF_K, VECTOR_RESCORE_ENABLED,
+                    INGEST_BATCH_SIZE)
+
+# Words too common to help lexical matching
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how",
+    "i", "if", "in", "is", "it", "me", "my", "of", "on", "or", "should", "so", "that", "the",
+    "this", "to", "was", "what", "when", "which", "who", "why", "will", "with", "you", "your"
+}
+
+# Words, keeping hyphenated exercise names ("l-sit", "muscle-up") together
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+# BM25 parameters (term frequency saturation and document length normalization)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def normalize_term(term):
+    """
+    Reduces simple plurals to their singular form ("planches" -> "planche", "pullups" -> "pullup").
+    """
+    if len(term) > 3 and term.endswith("s") and not term.endswith(("ss", "us", "is")):
+        return term[:-1]
+    return term
+
+
+def tokenize(text):
+    """
+    Splits a text into the terms of the lexical index.
+
+    Hyphenated names are indexed both as one term and as their parts, so "L-sit" matches
+    "L-sit", "Lsit" and "L sit", and "pull-ups" matches "pull-up".
+
+    Args:
+        text (str): The text to tokenize.
+
+    Returns:
+        list: The terms of the text.
+    """
+    terms = []
+    for word in TOKEN_PATTERN.findall(text.lower()):
+        parts = word.split("-")
+        if len(parts) > 1:
+            terms.append(normalize_term("".join(parts)))
+        terms += [normalize_term(part)
+                  for part in parts if part not in STOPWORDS]
+
+    return terms
+
+
+class LexicalIndex:
+    """
+    An in-memory BM25 inverted index over the chunks of a vector store.
+
+    Chunks are identified by the same stable IDs as in the Chroma collection, so the index
+    is updated incrementally alongside it and search results are resolved to documents
+    through the vector store. Only term frequencies are persisted (a compressed JSON file
+    in the vector store directory); postings are rebuilt in memory when the index is loaded.
+    """
+
+    def __init__(self):
+        self.doc_terms = {}  # chunk ID -> {term: frequency}
+        self.doc_lengths = {}  # chunk ID -> number of terms
+        self.postings = defaultdict(dict)  # term -> {chunk ID: frequency}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+    def add(self, ids, documents):
+        """
+        Adds (or replaces) chunks in the index.
+
+        Args:
+            ids (list): The chunk IDs.
+            documents (list): The chunks, in the same order as `ids`.
+        """
+        for id_, doc in zip(ids, documents):
+            self.remove([id_])
+            frequencies = Counter(tokenize(doc.page_content))
+            self._add_terms(id_, dict(frequencies))
+
+    def remove(self, ids):
+        """
+        Removes chunks from the index (unknown IDs are ignored).
+
+        Args:
+            ids (list): The chunk IDs.
+        """
+        for id_ in ids:
+            frequencies = self.doc_terms.pop(id_, None)
+            if frequencies is None:
+                continue
+            self.total_length -= self.doc_lengths.pop(id_)
+            for term in frequencies:
+                postings = self.postings[term]
+                postings.pop(id_, None)
+                if not postings:
+                    del self.postings[term]
+
+    def clear(self):
+        """
+        Removes all chunks from the index.
+        """
+        self.doc_terms.clear()
+        self.doc_lengths.clear()
+        self.postings.clear()
+        self.total_length = 0
+
+    def search(self, query, k, allowed_ids=None):
+        """
+        Ranks the indexed chunks against a query with BM25.
+
+        Args:
+            query (str): The query text.
+            k (int): Maximum number of results.
+            allowed_ids (set, optional): If given, only these chunks are ranked (e.g., the
+                                         chunks of the books a question is restricted to).
+
+        Returns:
+            list: (chunk ID, score) pairs, best first.
+        """
+        if not self.doc_terms:
+            return []
+
+        num_docs = len(self.doc_terms)
+        average_length = self.total_length / num_docs or 1.0
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_docs - len(postings) + 0.5) /
+                           (len(postings) + 0.5))
+            for id_, frequency in postings.items():
+                if allowed_ids is not None and id_ not in allowed_ids:
+                    continue
+                length_ratio = self.doc_lengths[id_] / average_length
+                scores[id_] += idf * frequency * (BM25_K1 + 1) / (
+                    frequency + BM25_K1 * (1 - BM25_B + BM25_B * length_ratio))
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, db_path):
+        """
+        Persists the index atomically to the vector store directory.
+
+        Args:
+            db_path (Path): Directory of the vector store.
+        """
+        path = Path(db_path) / LEXICAL_INDEX_NAME
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as file:
+            json.dump({"docs": self.doc_terms}, file, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, db_path):
+        """
+        Loads the index of a vector store.
+
+        Args:
+            db_path (Path): Directory of the vector store.
+
+        Returns:
+            LexicalIndex or None: The index, or None if the store has no lexical index yet.
+        """
+        path = Path(db_path) / LEXICAL_INDEX_NAME
+        if not path.exists():
+            return None
+
+        index = cls()
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            for id_, frequencies in json.load(file)["docs"].items():
+                index._add_terms(id_, frequencies)
+
+        return index
+
+    @classmethod
+    def from_documents(cls, ids, documents):
+        """
+        Builds an index from chunks.
+
+        Args:
+            ids (list): The chunk IDs.
+            documents (list): The chunks, in the same order as `ids`.
+
+        Returns:
+            LexicalIndex: The index.
+        """
+        index = cls()
+        index.add(ids, documents)
+
+        return index
+
+    def _add_terms(self, id_, frequencies):
+        self.doc_terms[id_] = frequencies
+        self.doc_lengths[id_] = sum(frequencies.values())
+        self.total_length += self.doc_lengths[id_]
+        for term, frequency in frequencies.items():
+            self.postings[term][id_] = frequency
+
+
+def load_lexical_index(vector_store, db_path, batch_size=INGEST_BATCH_SIZE):
+    """
+    Loads the lexical (BM25) index of a vector store, building it from the stored chunks if
+    the store has none yet (e.g., it was created before lexical indexes existed).
+
+    The built index is saved next to the collection; if the store directory is read-only,
+    it is only kept in memory.
+
+    Args:
+        vector_store (Chroma): The vector store.
+        db_path (Path): Directory of the vector store (holds the lexical index).
+        batch_size (int): Number of chunks read per batch when building the index.
+
+    Returns:
+        LexicalIndex: The lexical index, in sync with the vector store.
+    """
+    lexical_index = LexicalIndex.load(db_path)
+    if lexical_index is None:
+        print(f"⚠️ [Warning]: No lexical index found in {db_path}, building it from the stored chunks...")
+        lexical_index = LexicalIndex()
+        offset = 0
+        while True:
+            stored = vector_store.get(
+                include=["documents"], limit=batch_size, offset=offset)
+            if not stored["ids"]:
+                break
+            lexical_index.add(stored["ids"], [Document(page_content=text or "")
+                                              for text in stored["documents"]])
+            offset += len(stored["ids"])
+        try:
+            lexical_index.save(db_path)
+        except OSError as error:
+            print(f"⚠️ [Warning]: Could not save the lexical index to {db_path}: {error}")
+
+    return lexical_index
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=RRF_K):
+    """
+    Fuses several rankings of the same items with reciprocal rank fusion (RRF).
+
+    Each item scores the sum of 1 / (rrf_k + rank) over the rankings it appears in, so items
+    ranked well by several retrievers come first, without having to calibrate their scores.
+
+    Args:
+        rankings (list): Lists of item IDs, best first.
+        rrf_k (int): Smoothing constant; larger values flatten the contribution of top ranks.
+
+    Returns:
+        list: (item ID, fused score) pairs, best first.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] += 1.0 / (rrf_k + rank)
+
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieves chunks with both vector search and BM25 lexical search, fused with reciprocal rank fusion.
+
+    Lexical matching catches exact exercise names ("L-sit", "planche lean") that embeddings
+    match poorly, so a small `k` is enough for good recall. The fused score is stored in
+    the `relevance_score` metadata of the returned documents. The lexical index is reloaded
+    automatically when the vector store is updated.
+
+    A Chroma `where` filter (`filter` invoke argument, e.g. from `SourceFilterRetriever`)
+    restricts both searches to the matching chunks.
+
+    If the store keeps reduced-dimension vectors (see `quantization.ProjectedEmbeddings`),
+    the vector candidates are reordered by their full-precision similarity before fusion.
+    """
+
+    vectorstore: Any
+    db_path: Path = DB_PATH
+    k: int = K_RESULTS
+    fetch_k: int = HYBRID_FETCH_K
+    rrf_k: int = RRF_K
+    rescore: bool = VECTOR_RESCORE_ENABLED
+    lexical_index: Any = None
+    version: Any = None
+
+    def model_post_init(self, __context):
+        self._lock = threading.Lock()
+        self._filtered_ids = {}  # repr(where filter) -> IDs of the matching chunks
+
+    def get_lexical_index(self):
+        """
+        Returns the lexical index of the vector store, (re)loading it if the store changed.
+
+        A store without a lexical index gets one built from its chunks on first use, so
+        hybrid retrieval never silently degrades to vector search only.
+        """
+        with self._lock:
+            version = store_version(self.db_path)
+            if self.lexical_index is None or version != self.version:
+                self.lexical_index = load_lexical_index(self.vectorstore, self.db_path)
+                self._filtered_ids.clear()
+                # Building the index saves it, which changes the version
+                self.version = store_version(self.db_path)
+
+            return self.lexical_index
+
+    def get_filtered_ids(self, where):
+        """
+        Returns the IDs of the chunks matching a `where` filter (cached until the store changes).
+        """
+        self.get_lexical_index()
+        key = repr(where)
+        with self._lock:
+            if key not in self._filtered_ids:
+                self._filtered_ids[key] = set(
+                    self.vectorstore.get(where=where, include=[])["ids"])
+
+            return self._filtered_ids[key]
+
+    def search(self, query, query_embedding, filter=None):
+        """
+        Runs the vector and lexical searches for an embedded query and fuses their results.
+
+        Args:
+            query (str): The query.
+            query_embedding (list): The query vector, from the vector store's embedding function.
+            filter (dict, optional): A Chroma `where` filter restricting both searches.
+
+        Returns:
+            list: The `k` best chunks (Documents), with their fused score.
+        """
+        # Both searches return more candidates than needed, so fusion can reorder them.
+        # The collection is queried directly to get the chunk IDs of the vector results.
+        results = self.vectorstore._collection.query(
+            query_embeddings=[query_embedding],
+            n_results=self.fetch_k,
+            where=filter,
+            include=["documents", "metadatas"]
+        )
+        documents = {id_: Document(id=id_, page_content=text, metadata=metadata or {})
+                     for id_, text, metadata in zip(results["ids"][0], results["documents"][0],
+                                                    results["metadatas"][0])}
+        vector_ids = results["ids"][0]
+        projected = find_projected_embeddings(self.vectorstore._embedding_function)
+        if self.rescore and projected is not None:
+            ranking = projected.rescore(query, results["documents"][0])
+            vector_ids = [vector_ids[index] for index, _ in ranking]
+
+        allowed_ids = self.get_filtered_ids(filter) if filter else None
+        lexical_ids = [id_ for id_, _ in self.get_lexical_index().search(
+            query, self.fetch_k, allowed_ids)]
+
+        fused = reciprocal_rank_fusion(
+            [vector_ids, lexical_ids], self.rrf_k)[:self.k]
+
+        # Chunks found only by the lexical search are fetched from the vector store
+        missing_ids = [id_ for id_, _ in fused if id_ not in documents]
+        if missing_ids:
+            found = self.vectorstore.get(
+                ids=missing_ids, include=["documents", "metadatas"])
+            for id_, text, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+                documents[id_] = Document(
+                    id=id_, page_content=text, metadata=metadata or {})
+
+        return [Document(id=id_, page_content=documents[id_].page_content,
+                         metadata={**documents[id_].metadata, "relevance_score": score})
+                for id_, score in fused if id_ in documents]
+
+    def _get_relevant_documents(self, query, *, run_manager, filter=None, **kwargs):
+        return self.search(query, self.vectorstore._embedding_function.embed_query(query), filter)
+
+    async def _aget_relevant_documents(self, query, *, run_manager, filter=None, **kwargs):
+        # The query is embedded without blocking a thread; searching is CPU- and disk-bound,
+        # so only that part runs in a worker thread
+        query_embedding = await self.vectorstore._embedding_function.aembed_query(query)
+        return await run_in_executor(None, self.search, query, query_embedding, filter)
@@ -0,0 +1,356 @@
+import shutil
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+import numpy as np
+
+from config import (HNSW_SPACE, HNSW_M, HNSW_CONSTRUCTION_EF, HNSW_SEARCH_EF, RECALL_K, RECALL_SAMPLE_SIZE,
+                    INGEST_BATCH_SIZE)
+
+
+def hnsw_metadata():
+    """
+    Returns the Chroma collection metadata that sets the HNSW index parameters from the configuration.
+
+    Chroma reads these parameters only when a collection is created, so they apply to new
+    stores and to stores rebuilt with `rebuild_index`.
+
+    Returns:
+        dict: The "hnsw:*" collection metadata.
+    """
+    return {
+        "hnsw:space": HNSW_SPACE,
+        "hnsw:M": HNSW_M,
+        "hnsw:construction_ef": HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": HNSW_SEARCH_EF,
+    }
+
+
+def index_parameters(vector_store):
+    """
+    Returns the HNSW parameters a vector store's collection was created with.
+
+    Args:
+        vector_store (Chroma): The vector store.
+
+    Returns:
+        dict: The space, M, construction_ef and search_ef (Chroma's defaults where not set).
+    """
+    metadata = vector_store._collection.metadata or {}
+
+    return {
+        "space": metadata.get("hnsw:space", "l2"),
+        "M": metadata.get("hnsw:M", 16),
+        "construction_ef": metadata.get("hnsw:construction_ef", 100),
+        "search_ef": metadata.get("hnsw:search_ef", 10),
+    }
+
+
+def iter_stored_batches(collection, include, batch_size=INGEST_BATCH_SIZE):
+    """
+    Reads all the records of a Chroma collection batch by batch.
+
+    Args:
+        collection (Collection): The Chroma collection.
+        include (list): The fields to read (e.g., ["embeddings", "documents", "metadatas"]).
+        batch_size (int): Number of records per batch.
+
+    Yields:
+        dict: The next batch, as returned by `Collection.get`.
+    """
+    offset = 0
+    while True:
+        batch = collection.get(include=include, limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return
+        yield batch
+        offset += len(batch["ids"])
+
+
+def exact_search(matrix, query, k, space):
+    """
+    Returns the row indices of the `k` nearest vectors by exhaustive search.
+
+    Args:
+        matrix (np.ndarray): The stored vectors, one per row.
+        query (np.ndarray): The query vector.
+        k (int): Number of neighbors.
+        space (str): The distance ("l2", "ip" or "cosine"), as in Chroma.
+
+    Returns:
+        np.ndarray: The indices of the nearest rows, closest first.
+    """
+    if space == "cosine":
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        distances = 1.0 - matrix @ query / np.where(norms == 0, 1.0, norms)
+    elif space == "ip":
+        distances = 1.0 - matrix @ query
+    else:
+        distances = np.sum((matrix - query) ** 2, axis=1)
+
+    k = min(k, len(distances))
+    nearest = np.argpartition(distances, k - 1)[:k]
+
+    return nearest[np.argsort(distances[nearest])]
+
+
+def index_recall(vector_store, k=RECALL_K, sample_size=RECALL_SAMPLE_SIZE, seed=0):
+    """
+    Measures the recall of a vector store's HNSW index against exact search.
+
+    A fixed random sample of stored chunk vectors is used as queries. For each, the top `k`
+    of the approximate index is compared with the exact top `k`; query latencies of both
+    are measured, so index parameters can trade accuracy for speed knowingly.
+
+    Args:
+        vector_store (Chroma): The vector store.
+        k (int): Number of neighbors compared per query.
+        sample_size (int): Number of sample queries.
+        seed (int): Seed of the query sample, so runs are comparable.
+
+    Returns:
+        dict: recall@k, number of queries, and mean ANN and exact latency per query in ms
+              (None if the store is empty).
+    """
+    collection = vector_store._collection
+    ids, vectors = [], []
+    for batch in iter_stored_batches(collection, ["embeddings"]):
+        ids += batch["ids"]
+        vectors += list(batch["embeddings"])
+    if not ids:
+        return None
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    space = index_parameters(vector_store)["space"]
+    sample = np.random.default_rng(seed).choice(
+        len(ids), size=min(sample_size, len(ids)), replace=False)
+
+    hits, ann_seconds, exact_seconds = 0, 0.0, 0.0
+    for row in sample:
+        start_time = time.perf_counter()
+        exact_ids = {ids[index] for index in exact_search(matrix, matrix[row], k, space)}
+        exact_seconds += time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        ann_ids = collection.query(query_embeddings=[matrix[row].tolist()], n_results=min(k, len(ids)),
+                                   include=[])["ids"][0]
+        ann_seconds += time.perf_counter() - start_time
+
+        hits += len(exact_ids.intersection(ann_ids)) / len(exact_ids)
+
+    return {"k": k, "queries": len(sample), "recall": hits / len(sample),
+            "ann_ms": ann_seconds * 1000 / len(sample), "exact_ms": exact_seconds * 1000 / len(sample)}
+
+
+def collection_names(client):
+    """
+    Returns the names of the collections of a Chroma client.
+    """
+    return {getattr(collection, "name", collection) for collection in client.list_collections()}
+
+
+def recover_interrupted_rebuild(vector_store):
+    """
+    Restores a vector store whose index rebuild was interrupted (see `rebuild_index`).
+
+    A rebuild keeps a complete copy of the records until it has finished: the original
+    collection (renamed `{name}_old` during the swap) or the rebuilt one (`{name}_rebuild`).
+    If the store's collection is missing or empty (reopening a store whose collection was
+    renamed away creates an empty one), the complete copy is renamed back, preferring the
+    original; leftovers of a rebuild are removed otherwise.
+
+    Args:
+        vector_store (Chroma): The vector store; it is switched to the restored collection.
+
+    Returns:
+        bool: True if a leftover collection was found.
+    """
+    client = vector_store._client
+    name = vector_store._collection.name
+    old_name, rebuild_name = f"{name}_old", f"{name}_rebuild"
+    names = collection_names(client)
+    leftovers = [leftover for leftover in (old_name, rebuild_name) if leftover in names]
+    if not leftovers:
+        return False
+
+    if name not in names or client.get_collection(name).count() == 0:
+        # The swap was interrupted: the leftover is the only complete copy of the store
+        if name in names:
+            client.delete_collection(name)
+        client.get_collection(leftovers[0]).modify(name=name)
+        leftovers = leftovers[1:]
+        print(f"⚠️ [Warning]: Restored the '{name}' collection from an interrupted index rebuild.")
+
+    # The store's collection is complete: the other copies are leftovers
+    for leftover in leftovers:
+        client.delete_collection(leftover)
+    vector_store._collection = client.get_collection(name)
+
+    return True
+
+
+def rebuild_index(vector_store, batch_size=INGEST_BATCH_SIZE):
+    """
+    Rebuilds the HNSW index of a vector store in place with the configured parameters.
+
+    The stored embeddings, documents and metadata are copied into a new collection created
+    with `hnsw_metadata()` (nothing is re-embedded), which then replaces the old collection
+    under the same name. This applies new index parameters and compacts the index, dropping
+    the space left by deleted chunks.
+
+    The swap keeps a complete copy of the records at every step (the old collection is
+    renamed `{name}_old` and deleted last), so an interrupted rebuild is recovered by
+    `recover_interrupted_rebuild`, which runs first.
+
+    Args:
+        vector_store (Chroma): The vector store; it is switched to the rebuilt collection.
+        batch_size (int): Number of records copied per batch.
+
+    Returns:
+        Chroma: The vector store.
+    """
+    recover_interrupted_rebuild(vector_store)
+    client = vector_store._client
+    old_collection = vector_store._collection
+    name = old_collection.name
+
+    # Step 1: Copy the records into a new collection with the configured index parameters
+    metadata = {key: value for key, value in (old_collection.metadata or {}).items()
+                if not key.startswith("hnsw:")}
+    new_collection = client.create_collection(
+        f"{name}_rebuild", metadata={**metadata, **hnsw_metadata()})
+    for batch in iter_stored_batches(old_collection, ["embeddings", "documents", "metadatas"], batch_size):
+        new_collection.add(ids=batch["ids"], embeddings=batch["embeddings"],
+                           documents=batch["documents"], metadatas=batch["metadatas"])
+
+    # Step 2: Swap the collections, deleting the old one only once the new one is in place
+    old_collection.modify(name=f"{name}_old")
+    new_collection.modify(name=name)
+    client.delete_collection(f"{name}_old")
+    vector_store._collection = new_collection
+
+    return vector_store
+
+
+def directory_size(path):
+    """
+    Returns the total size of the files in a directory tree, in bytes.
+    """
+    return sum(file.stat().st_size for file in Path(path).rglob("*") if file.is_file())
+
+
+def is_segment_directory(path):
+    """
+    Tells whether a path is a Chroma segment directory (named after the UUID of its segment).
+    """
+    try:
+        return path.is_dir() and str(uuid.UUID(path.name)) == path.name
+    except ValueError:
+        return False
+
+
+def read_segments(db_path):
+    """
+    Reads the segments of the collections of a persisted Chroma store from its SQLite database.
+
+    Args:
+        db_path (Path): Directory of the vector store.
+
+    Returns:
+        dict: Maps each segment ID to (collection name, segment scope, number of stored records).
+    """
+    connection = sqlite3.connect(f"file:{Path(db_path) / 'chroma.sqlite3'}?mode=ro", uri=True)
+    try:
+        segments = connection.execute(
+            "SELECT segments.id, collections.name, segments.scope, COUNT(embeddings.id) "
+            "FROM segments JOIN collections ON segments.collection = collections.id "
+            "LEFT JOIN embeddings ON embeddings.segment_id = segments.id "
+            "GROUP BY segments.id").fetchall()
+    finally:
+        connection.close()
+
+    return {segment_id: (name, scope, count) for segment_id, name, scope, count in segments}
+
+
+def store_footprint(db_path):
+    """
+    Returns the on-disk size of a persisted Chroma store, per collection.
+
+    The size of a collection is that of its vector index (its segment directory); the
+    SQLite database, shared by all the collections, and orphaned segment directories
+    are reported separately.
+
+    Args:
+        db_path (Path): Directory of the vector store.
+
+    Returns:
+        dict: The collections (name -> {"records", "bytes"}), and the database, orphaned and total sizes in bytes.
+    """
+    db_path = Path(db_path)
+    segments = read_segments(db_path)
+    collections = {}
+    for name, scope, count in segments.values():
+        collection = collections.setdefault(name, {"records": 0, "bytes": 0})
+        if scope == "METADATA":
+            collection["records"] = count
+
+    orphaned = 0
+    for path in filter(is_segment_directory, db_path.iterdir()):
+        if path.name in segments:
+            collections[segments[path.name][0]]["bytes"] += directory_size(path)
+        else:
+            orphaned += directory_size(path)
+
+    return {"collections": collections, "database": (db_path / "chroma.sqlite3").stat().st_size,
+            "orphaned": orphaned, "total": directory_size(db_path)}
+
+
+def orphaned_segments(db_path):
+    """
+    Returns the segment directories of a persisted Chroma store that no live collection references.
+
+    Deleting a collection (e.g., when a vector store is recreated or its index rebuilt)
+    removes its records from the database but leaves its segment directory on disk.
+
+    Args:
+        db_path (Path): Directory of the vector store.
+
+    Returns:
+        list: The orphaned segment directories.
+    """
+    segments = read_segments(db_path)
+
+    return [path for path in Path(db_path).iterdir()
+            if is_segment_directory(path) and path.name not in segments]
+
+
+def collect_garbage(db_path):
+    """
+    Removes the orphaned segment directories of a persisted Chroma store and vacuums its database.
+
+    Args:
+        db_path (Path): Directory of the vector store.
+
+    Returns:
+        dict: The number of removed segments, the freed bytes, and the store footprint
+              before and after (see `store_footprint`).
+    """
+    before = store_footprint(db_path)
+
+    # Step 1: Remove the segment directories of deleted collections
+    orphans = orphaned_segments(db_path)
+    for path in orphans:
+        shutil.rmtree(path)
+
+    # Step 2: Reclaim the pages left free in the database by deleted records
+    connection = sqlite3.connect(Path(db_path) / "chroma.sqlite3", timeout=30)
+    try:
+        connection.execute("VACUUM")
+    finally:
+        connection.close()
+
+    after = store_footprint(db_path)
+
+    return {"removed": len(orphans), "freed": before["total"] - after["total"],
+            "before": before, "after": after}
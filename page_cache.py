@@ -0,0 +1,86 @@
+import gzip
+import json
+import os
+from pathlib import Path
+from langchain_core.documents import Document
+
+from config import PAGE_CACHE_DIR, PDF_BACKEND
+
+
+class PageTextCache:
+    """
+    On-disk cache of the pages extracted from PDF files, keyed by the SHA-256 hash of the file
+    content and the PDF backend that extracted them.
+
+    The pages of each file (text and loader metadata) are stored in one gzip-compressed JSON
+    file, so a book is parsed only once no matter how often it is re-split (e.g., with other
+    chunk settings). The source path is not part of the cached metadata, so moved or renamed
+    files are still served from the cache.
+    """
+
+    def __init__(self, cache_dir=PAGE_CACHE_DIR, backend=PDF_BACKEND):
+        """
+        Args:
+            cache_dir (Path): Directory of the cached page files.
+            backend (str): The PDF backend whose pages are cached (see PDF_BACKEND in config.py).
+        """
+        self.cache_dir = Path(cache_dir)
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, file_hash):
+        """
+        Returns the path of the cached pages of a file.
+        """
+        return self.cache_dir / f"{file_hash}.{self.backend}.json.gz"
+
+    def get(self, file_hash):
+        """
+        Returns the cached pages of a file.
+
+        Args:
+            file_hash (str): SHA-256 hash of the file content.
+
+        Returns:
+            list or None: The page documents (without `source` metadata), or None on a cache miss.
+        """
+        path = self.path(file_hash)
+        if not path.exists():
+            self.misses += 1
+            return None
+
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            pages = json.load(file)["pages"]
+        self.hits += 1
+
+        return [Document(page_content=page["text"], metadata=page["metadata"]) for page in pages]
+
+    def put(self, file_hash, pages):
+        """
+        Caches the pages of a file atomically (safe with several worker processes).
+
+        Args:
+            file_hash (str): SHA-256 hash of the file content.
+            pages (list): The page documents; their `source` metadata is not cached.
+        """
+        path = self.path(file_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as file:
+            json.dump({"pages": [{"text": page.page_content,
+                                  "metadata": {key: value for key, value in page.metadata.items()
+                                               if key != "source"}}
+                                 for page in pages]}, file, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def stats(self):
+        """
+        Returns the cache statistics.
+
+        Returns:
+            dict: Session hits/misses, number of cached files and total size in bytes.
+        """
+        files = list(self.cache_dir.glob("*.json.gz")) if self.cache_dir.exists() else []
+        return {"hits": self.hits, "misses": self.misses, "files": len(files),
+                "size_bytes": sum(file.stat().st_size for file in files)}
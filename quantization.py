@@ -0,0 +1,328 @@
+import os
+from pathlib import Path
+from typing import Any
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import run_in_executor
+
+from caching import TTLCache
+from maintenance import exact_search, iter_stored_batches
+from config import (VECTOR_PROJECTION_NAME, VECTOR_RESCORE_CANDIDATES,
+                    K_RESULTS, RECALL_K, RECALL_SAMPLE_SIZE)
+
+# Maximum number of chunk vectors used to fit a projection (more adds little accuracy)
+PCA_FIT_MAX_SAMPLES = 20_000
+
+
+def normalize_rows(matrix):
+    """
+    Scales the rows of a matrix to unit length (zero rows are left unchanged).
+    """
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+class PCAProjection:
+    """
+    A PCA projection of embeddings onto their top principal components.
+
+    Most of the variance of sentence embeddings lies in a few hundred directions, so
+    projecting 1536-dimensional OpenAI vectors onto, e.g., 256 components keeps their
+    nearest neighbors mostly intact while storing 6x fewer floats per chunk. Projected
+    vectors are normalized, so they can be compared with any HNSW space.
+    """
+
+    def __init__(self, mean, components):
+        """
+        Args:
+            mean (np.ndarray): Mean of the fitted vectors (full dimensionality).
+            components (np.ndarray): The principal components, one per row.
+        """
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+
+    @property
+    def dimensions(self):
+        """
+        Number of dimensions of the projected vectors.
+        """
+        return self.components.shape[0]
+
+    @property
+    def full_dimensions(self):
+        """
+        Number of dimensions of the original vectors.
+        """
+        return self.components.shape[1]
+
+    @classmethod
+    def fit(cls, vectors, dimensions, seed=0):
+        """
+        Fits a projection on a set of embeddings.
+
+        Args:
+            vectors (list): The embeddings (e.g., of all the chunks of a store).
+            dimensions (int): Number of principal components to keep (capped by the number
+                              and the dimensionality of the vectors).
+            seed (int): Seed of the sample used for fitting when there are many vectors.
+
+        Returns:
+            PCAProjection: The fitted projection.
+        """
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if len(matrix) > PCA_FIT_MAX_SAMPLES:
+            sample = np.random.default_rng(seed).choice(
+                len(matrix), size=PCA_FIT_MAX_SAMPLES, replace=False)
+            matrix = matrix[sample]
+
+        mean = matrix.mean(axis=0)
+        _, _, components = np.linalg.svd(matrix - mean, full_matrices=False)
+
+        return cls(mean, components[:min(dimensions, len(components))])
+
+    def transform(self, vectors):
+        """
+        Projects embeddings onto the principal components.
+
+        Args:
+            vectors (list): The embeddings, one per row.
+
+        Returns:
+            np.ndarray: The normalized projected vectors, one per row.
+        """
+        matrix = np.asarray(vectors, dtype=np.float32)
+        return normalize_rows((matrix - self.mean) @ self.components.T)
+
+    def save(self, db_path):
+        """
+        Persists the projection atomically to the vector store directory.
+
+        Args:
+            db_path (Path): Directory of the vector store.
+        """
+        path = Path(db_path) / VECTOR_PROJECTION_NAME
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as file:
+            np.savez(file, mean=self.mean, components=self.components)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, db_path):
+        """
+        Loads the projection of a vector store.
+
+        Args:
+            db_path (Path): Directory of the vector store.
+
+        Returns:
+            PCAProjection or None: The projection, or None if the store keeps full vectors.
+        """
+        path = Path(db_path) / VECTOR_PROJECTION_NAME
+        if not path.exists():
+            return None
+
+        with np.load(path) as data:
+            return cls(data["mean"], data["components"])
+
+
+class ProjectedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings object so the vectors it returns are projected with a `PCAProjection`.
+
+    Vector stores created with reduced dimensions embed through this wrapper, so chunks
+    added later and queries are projected the same way. It can also rescore search
+    candidates with their full-precision vectors: those come from the wrapped embeddings,
+    normally backed by the on-disk embedding cache, so rescoring stored chunks costs no
+    embedding calls. Full query vectors are kept briefly, so a query is embedded once
+    for both the search and the rescoring.
+    """
+
+    def __init__(self, embeddings, projection, query_cache=None):
+        """
+        Args:
+            embeddings (Embeddings): The embeddings object producing full-precision vectors.
+            projection (PCAProjection): The projection applied to them.
+            query_cache (TTLCache, optional): Cache of full query vectors (a new one by default).
+        """
+        self.embeddings = embeddings
+        self.projection = projection
+        self.query_cache = query_cache or TTLCache()
+
+    def embed_documents(self, texts):
+        """
+        Embeds documents and projects their vectors.
+        """
+        return self.projection.transform(self.embeddings.embed_documents(texts)).tolist()
+
+    def embed_query(self, text):
+        """
+        Embeds a query and projects its vector.
+        """
+        return self.projection.transform(self.embed_full_query(text)).tolist()
+
+    async def aembed_query(self, text):
+        """
+        Embeds a query asynchronously and projects its vector.
+        """
+        return self.projection.transform(await self.aembed_full_query(text)).tolist()
+
+    def embed_full_query(self, text):
+        """
+        Embeds a query at full precision (cached briefly, see the class docstring).
+        """
+        vector = self.query_cache.get(text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.query_cache.put(text, vector)
+
+        return vector
+
+    async def aembed_full_query(self, text):
+        """
+        Embeds a query at full precision asynchronously (cached briefly, see the class docstring).
+        """
+        vector = self.query_cache.get(text)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self.query_cache.put(text, vector)
+
+        return vector
+
+    def rescore(self, query, texts):
+        """
+        Ranks candidate texts by exact cosine similarity of their full-precision vectors to a query.
+
+        Args:
+            query (str): The query.
+            texts (list): The candidate texts (e.g., of the chunks found in the reduced space).
+
+        Returns:
+            list: (candidate index, similarity) pairs, most similar first.
+        """
+        if not texts:
+            return []
+
+        query_vector = normalize_rows(np.asarray(self.embed_full_query(query), dtype=np.float32))
+        matrix = normalize_rows(np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32))
+        similarities = matrix @ query_vector
+
+        return [(int(index), float(similarities[index])) for index in np.argsort(-similarities, kind="stable")]
+
+
+def find_projected_embeddings(embeddings):
+    """
+    Returns the `ProjectedEmbeddings` among an embeddings object and the ones it wraps, if any.
+
+    Args:
+        embeddings (Embeddings): The embedding function of a vector store (possibly wrapped
+                                 by caches, see `caching.cache_query_embeddings`).
+
+    Returns:
+        ProjectedEmbeddings or None: The projected embeddings, or None if vectors are stored at full precision.
+    """
+    while embeddings is not None and not isinstance(embeddings, ProjectedEmbeddings):
+        embeddings = getattr(embeddings, "embeddings", None)
+
+    return embeddings
+
+
+def store_embeddings(embeddings, db_path):
+    """
+    Returns the embedding function a vector store must be opened with.
+
+    Args:
+        embeddings (Embeddings): The full-precision embeddings.
+        db_path (Path): Directory of the vector store.
+
+    Returns:
+        Embeddings: `embeddings`, wrapped in `ProjectedEmbeddings` if the store keeps reduced vectors.
+    """
+    projection = PCAProjection.load(db_path)
+
+    return embeddings if projection is None else ProjectedEmbeddings(embeddings, projection)
+
+
+class RescoringRetriever(BaseRetriever):
+    """
+    Rescores the candidates of a vector store retriever with full-precision vectors and keeps the top `k`.
+
+    Used when a store keeps reduced vectors and hybrid retrieval is disabled (`HybridRetriever`
+    rescores its vector candidates itself). The exact cosine similarity is stored in the
+    `relevance_score` metadata of the returned documents.
+    """
+
+    retriever: BaseRetriever
+    embeddings: Any
+    k: int = K_RESULTS
+
+    @property
+    def vectorstore(self):
+        """
+        The vector store of the wrapped retriever.
+        """
+        return self.retriever.vectorstore
+
+    def _get_relevant_documents(self, query, *, run_manager, **kwargs):
+        documents = self.retriever.invoke(query, **kwargs)
+        ranking = self.embeddings.rescore(query, [doc.page_content for doc in documents])
+
+        return [Document(id=documents[index].id, page_content=documents[index].page_content,
+                         metadata={**documents[index].metadata, "relevance_score": score})
+                for index, score in ranking[:self.k]]
+
+    async def _aget_relevant_documents(self, query, *, run_manager, **kwargs):
+        # Rescoring may read the embedding cache from disk, so it runs in a worker thread
+        return await run_in_executor(None, self._get_relevant_documents, query,
+                                     run_manager=run_manager.get_sync(), **kwargs)
+
+
+def projection_recall(vector_store, embeddings, k=RECALL_K, sample_size=RECALL_SAMPLE_SIZE,
+                      candidates=VECTOR_RESCORE_CANDIDATES, seed=0):
+    """
+    Measures how much reduced-dimension storage changes the nearest neighbors of a vector store.
+
+    A fixed random sample of chunks is used as queries. For each, the exact top `k` over the
+    full-precision vectors is compared with the exact top `k` over the stored (projected)
+    vectors, and with the top `k` after rescoring the top `candidates` of the projected
+    search with full-precision vectors. The HNSW index is left out, so only the effect
+    of the projection is measured (see `maintenance.index_recall` for the index).
+
+    Args:
+        vector_store (Chroma): The vector store.
+        embeddings (ProjectedEmbeddings): The embedding function of the store.
+        k (int): Number of neighbors compared per query.
+        sample_size (int): Number of sample queries.
+        candidates (int): Number of candidates rescored per query.
+        seed (int): Seed of the query sample, so runs are comparable.
+
+    Returns:
+        dict: recall@k without and with rescoring, and the number of queries (None if the store is empty).
+    """
+    texts, stored = [], []
+    for batch in iter_stored_batches(vector_store._collection, ["documents", "embeddings"]):
+        texts += batch["documents"]
+        stored += list(batch["embeddings"])
+    if not texts:
+        return None
+
+    # Full-precision chunk vectors come from the embedding cache
+    full = normalize_rows(np.asarray(embeddings.embeddings.embed_documents(texts), dtype=np.float32))
+    reduced = np.asarray(stored, dtype=np.float32)
+    sample = np.random.default_rng(seed).choice(
+        len(texts), size=min(sample_size, len(texts)), replace=False)
+
+    hits, rescored_hits = 0.0, 0.0
+    for row in sample:
+        exact = set(exact_search(full, full[row], k, "cosine").tolist())
+        query = embeddings.projection.transform(full[row])
+        approximate = exact_search(reduced, query, max(k, candidates), "cosine")
+        rescored = approximate[np.argsort(-(full[approximate] @ full[row]), kind="stable")]
+
+        hits += len(exact.intersection(approximate[:k].tolist())) / len(exact)
+        rescored_hits += len(exact.intersection(rescored[:k].tolist())) / len(exact)
+
+    return {"k": k, "queries": len(sample), "recall": hits / len(sample),
+            "rescored_recall": rescored_hits / len(sample)}
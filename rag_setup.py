@@ -1,39 +1,99 @@
+import re
 from langchain_openai import ChatOpenAI
 from langchain.memory import ConversationBufferMemory
 from langchain.chains import ConversationalRetrievalChain
 from vectorize import load_vector_store
-from config import OPENAI_MODEL, K_RESULTS
+from tokens import count_tokens, truncate_tokens
+from clients import get_async_http_client
+from condense import StandaloneAwareQuestionChain
+from lexical import HybridRetriever
+from rerank import RerankingRetriever
+from catalog import SourceFilterRetriever
+from quantization import RescoringRetriever, find_projected_embeddings
+from caching import CachedRetriever
+from config import (OPENAI_MODEL, K_RESULTS, CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_THRESHOLD,
+                    CONDENSE_QUESTION_MODEL, DB_PATH, HYBRID_SEARCH_ENABLED, RERANK_ENABLED,
+                    RERANK_CANDIDATES, VECTOR_RESCORE_ENABLED, VECTOR_RESCORE_CANDIDATES)
+
+# Tag of the LLM runs that condense a follow-up question into a standalone question,
+# used to tell their streamed tokens apart from those of the answer
+CONDENSE_QUESTION_TAG = "condense_question"
+
+
+def build_retriever(vector_store, db_path=DB_PATH, cached=False):
+    """
+    Creates the retriever over a vector store.
 
+    With HYBRID_SEARCH_ENABLED, vector search is fused with BM25 lexical search over the
+    lexical index stored next to the vector store; otherwise plain vector search is used.
+    With RERANK_ENABLED, RERANK_CANDIDATES chunks are retrieved and reranked by a
+    cross-encoder, keeping the best RERANK_TOP_N. Stores with reduced-dimension vectors
+    rescore their vector candidates with full-precision vectors (VECTOR_RESCORE_ENABLED).
 
-def initialize_conversation_chain():
+    Searches are restricted to the authors or books a question mentions, or to the sources
+    selected in the UI (`sources` invoke argument), through Chroma `where` filters.
+
+    Args:
+        vector_store (Chroma): The vector store.
+        db_path (Path): Directory of the vector store (holds the lexical index).
+        cached (bool): If True, retrieval results are cached per question and sources
+                       (see `CachedRetriever`).
+
+    Returns:
+        SourceFilterRetriever: The retriever, returning the top K_RESULTS (or RERANK_TOP_N) chunks.
     """
-    Initializes a conversational retrieval chain with OpenAI's chat model, 
-    a conversation buffer memory, and a vector store retriever for 
-    Retrieval-Augmented Generation (RAG).
+    k = RERANK_CANDIDATES if RERANK_ENABLED else K_RESULTS
+    if HYBRID_SEARCH_ENABLED:
+        retriever = HybridRetriever(
+            vectorstore=vector_store, db_path=db_path, k=k)
+    elif VECTOR_RESCORE_ENABLED and find_projected_embeddings(vector_store._embedding_function):
+        retriever = RescoringRetriever(
+            retriever=vector_store.as_retriever(
+                search_kwargs={"k": max(k, VECTOR_RESCORE_CANDIDATES)}),
+            embeddings=find_projected_embeddings(vector_store._embedding_function),
+            k=k)
+    else:
+        retriever = vector_store.as_retriever(search_kwargs={"k": k})
+
+    if RERANK_ENABLED:
+        # The cross-encoder is loaded here, so the first question does not pay for it
+        retriever = RerankingRetriever(retriever=retriever)
+
+    if cached:
+        retriever = CachedRetriever(retriever=retriever, db_path=db_path)
+
+    # The source catalog is built here, so the first question does not pay for it
+    retriever = SourceFilterRetriever(
+        retriever=retriever, vectorstore=vector_store, db_path=db_path)
+    retriever.get_catalog()
+
+    return retriever
+
+
+def initialize_shared_components(cached=False):
+    """
+    Initializes the heavy components of the RAG pipeline that can be shared by every
+    conversation: OpenAI's chat model and the vector store retriever.
 
-    This setup enables an LLM-powered conversational agent that retrieves relevant
-    information from a vector store while maintaining conversation context.
+    Args:
+        cached (bool): If True, retrieval results are cached (see `build_retriever`).
 
     Returns:
-        ConversationalRetrievalChain: The initialized conversation chain.
+        Tuple:
+            - llm (ChatOpenAI): The chat model.
+            - retriever (SourceFilterRetriever): The retriever over the vector store.
     """
     # Step 1: Create a ChatOpenAI instance
     # The temperature controls the randomness of responses (lower = more deterministic)
     # Model name is fetched from the configuration (e.g., "gpt-4o")
+    # Async calls (e.g., from the Gradio handlers) share one HTTP connection pool
     llm = ChatOpenAI(
         temperature=0.7,
-        model_name=OPENAI_MODEL
+        model_name=OPENAI_MODEL,
+        http_async_client=get_async_http_client()
     )
 
-    # Step 2: Set up a conversation buffer memory
-    # This memory tracks the conversation history and allows the model to generate responses
-    # with context-awareness.
-    memory = ConversationBufferMemory(
-        memory_key="chat_history",  # Memory key used in the conversation chain
-        return_messages=True       # Ensures the memory returns the full conversation history
-    )
-
-    # Step 3: Load the vector store and retrieve its retriever
+    # Step 2: Load the vector store and retrieve its retriever
     # The vector store is a pre-created database of document embeddings.
     vector_store = load_vector_store()
     if not vector_store:
@@ -41,21 +101,103 @@ def initialize_conversation_chain():
             "[Error] Vector store could not be loaded. Ensure it is created first.")
     # Convert the vector store into a retriever
     # The retriever abstracts the process of searching the vector store for
-    # the top-k most relevant chunks based on a query.
+    # the top-k most relevant chunks based on a query (hybrid vector + lexical search).
     # "k" specifies the number of results to retrieve for each query.
-    retriever = vector_store.as_retriever(search_kwargs={"k": K_RESULTS})
+    retriever = build_retriever(vector_store, cached=cached)
+
+    return llm, retriever
+
+
+def initialize_condense_llm(llm):
+    """
+    Returns the chat model that condenses follow-up questions into standalone questions.
+
+    Rewriting a question is a simple task, so a cheaper model (CONDENSE_QUESTION_MODEL)
+    can be used for it; if none is configured, the main chat model is reused.
+
+    Args:
+        llm (ChatOpenAI): The main chat model.
+
+    Returns:
+        ChatOpenAI: The chat model of the condense step.
+    """
+    if not CONDENSE_QUESTION_MODEL or CONDENSE_QUESTION_MODEL == OPENAI_MODEL:
+        return llm
 
-    # Step 4: Create a Conversational Retrieval Chain
+    return ChatOpenAI(
+        temperature=0,
+        model_name=CONDENSE_QUESTION_MODEL,
+        http_async_client=get_async_http_client()
+    )
+
+
+def build_conversation_chain(llm, retriever, use_memory=True, condense_llm=None):
+    """
+    Builds a conversational retrieval chain with its own conversation buffer memory
+    on top of shared components.
+
+    Building a chain is cheap, so each conversation (e.g., each user session) can get its
+    own chain and memory while reusing the same chat model and retriever.
+
+    Args:
+        llm (ChatOpenAI): The shared chat model.
+        retriever: The shared vector store retriever.
+        use_memory (bool): If False, the chain has no memory and the caller passes the
+                           (e.g., token-budgeted) history as "chat_history" on every call,
+                           so one chain can serve all conversations.
+        condense_llm (ChatOpenAI, optional): The chat model that condenses follow-up questions
+                                             (see `initialize_condense_llm`); defaults to `llm`.
+
+    Returns:
+        ConversationalRetrievalChain: The conversation chain. Runs of the question-condensing
+                                      step are tagged with CONDENSE_QUESTION_TAG.
+    """
+    # Step 1: Set up a conversation buffer memory
+    # This memory tracks the conversation history and allows the model to generate responses
+    # with context-awareness.
+    memory = ConversationBufferMemory(
+        memory_key="chat_history",  # Memory key used in the conversation chain
+        return_messages=True       # Ensures the memory returns the full conversation history
+    ) if use_memory else None
+
+    # Step 2: Create a Conversational Retrieval Chain
     # This combines the language model (LLM), retriever, and memory into a single pipeline
+    # The condensing step is tagged so streamed events can be attributed to it
     conversation_chain = ConversationalRetrievalChain.from_llm(
         llm=llm,
         retriever=retriever,
-        memory=memory
+        memory=memory,
+        condense_question_llm=(condense_llm or llm).with_config(
+            tags=[CONDENSE_QUESTION_TAG])
+    )
+
+    # Step 3: Skip the condensing LLM call for follow-up questions that are already standalone
+    question_generator = conversation_chain.question_generator
+    conversation_chain.question_generator = StandaloneAwareQuestionChain(
+        llm=question_generator.llm,
+        prompt=question_generator.prompt
     )
 
     return conversation_chain
 
 
+def initialize_conversation_chain():
+    """
+    Initializes a conversational retrieval chain with OpenAI's chat model, 
+    a conversation buffer memory, and a vector store retriever for 
+    Retrieval-Augmented Generation (RAG).
+
+    This setup enables an LLM-powered conversational agent that retrieves relevant
+    information from a vector store while maintaining conversation context.
+
+    Returns:
+        ConversationalRetrievalChain: The initialized conversation chain.
+    """
+    llm, retriever = initialize_shared_components()
+
+    return build_conversation_chain(llm, retriever, condense_llm=initialize_condense_llm(llm))
+
+
 def test_conversation_chain(question):
     """
     Tests the conversational retrieval chain by asking a question and printing the response.
@@ -93,46 +235,194 @@ def test_conversation_chain(question):
         print(f"\n[Error] - {str(e)}\n")
 
 
-def user_prompt(user_input, retriever):
+def shingles(text, size=3):
+    """
+    Returns the set of word n-grams (shingles) of a text, used to detect near-duplicate chunks.
+
+    Args:
+        text (str): The text to shingle.
+        size (int): Number of words per shingle.
+
+    Returns:
+        set: The shingles of the text.
+    """
+    words = re.findall(r"\w+", text.lower())
+
+    return {" ".join(words[index:index + size]) for index in range(max(1, len(words) - size + 1))}
+
+
+def trim_overlap(doc, text, selected_docs):
+    """
+    Removes the text a chunk shares with already selected chunks of the same page.
+
+    Consecutive chunks of a page overlap by up to CHUNK_OVERLAP characters; using the chunk
+    offsets (`start_index` metadata), the shared prefix or suffix is cut so the overlapping
+    text is not sent to the model twice.
+
+    Args:
+        doc: The candidate chunk.
+        text (str): The candidate chunk's text.
+        selected_docs (list): Chunks already selected for the context.
+
+    Returns:
+        str: The remaining text ("" if the chunk is fully covered by selected chunks).
+    """
+    start = doc.metadata.get("start_index")
+    if start is None:
+        return text
+
+    end = start + len(text)
+    for other in selected_docs:
+        other_start = other.metadata.get("start_index")
+        if (other_start is None or other.metadata.get("source") != doc.metadata.get("source")
+                or other.metadata.get("page") != doc.metadata.get("page")):
+            continue
+        other_end = other_start + len(other.page_content)
+        if other_start <= start < other_end:
+            # The chunk starts inside a selected chunk: drop the shared prefix
+            text, start = text[other_end - start:], other_end
+        elif start < other_start < end:
+            # The chunk ends inside a selected chunk: drop the shared suffix
+            text, end = text[:other_start - start], other_start
+        if start >= end:
+            return ""
+
+    return text.strip()
+
+
+def pack_context(documents, token_budget=CONTEXT_TOKEN_BUDGET, dedup_threshold=CONTEXT_DEDUP_THRESHOLD):
+    """
+    Packs retrieved chunks into a numbered, cited context block within a token budget.
+
+    Chunks are taken in order of relevance (by `relevance_score` metadata when present,
+    otherwise in retrieval order, which is best-first). Near-duplicates are skipped: chunks
+    whose shingles are mostly contained in already selected text, and text shared with
+    overlapping chunks of the same page (see `trim_overlap`). Chunks are added until the
+    token budget is used up, so the prompt carries only as much context as fits.
+
+    Args:
+        documents (list): The retrieved chunks.
+        token_budget (int): Maximum number of tokens of the context block.
+        dedup_threshold (float): Fraction of a chunk's shingles already present in the
+                                 selected text above which the chunk is skipped.
+
+    Returns:
+        Tuple:
+            - context (str): The context block ("" if nothing was selected).
+            - selected_docs (list): The chunks included in the context.
+    """
+    ranked = sorted(documents, key=lambda doc: -
+                    doc.metadata.get("relevance_score", 0.0))
+    blocks, selected_docs, seen_shingles, used_tokens = [], [], set(), 0
+
+    for doc in ranked:
+        text = trim_overlap(doc, doc.page_content, selected_docs)
+        if not text:
+            continue
+
+        doc_shingles = shingles(text)
+        if len(doc_shingles & seen_shingles) >= dedup_threshold * len(doc_shingles):
+            continue
+
+        author = doc.metadata.get("author", "Unknown Author")
+        book = doc.metadata.get("book", "Unknown Book")
+        page = doc.metadata.get("page")
+        citation = f'[{len(blocks) + 1}] {author} in "{book}"' + \
+            (f" (page {page + 1})" if isinstance(page, int) else "")
+        block = f"{citation}\n{text}"
+
+        block_tokens = count_tokens(block)
+        if used_tokens + block_tokens > token_budget:
+            if blocks:
+                break
+            # Always keep the best chunk, truncated to the budget if needed
+            block = truncate_tokens(block, token_budget)
+            block_tokens = token_budget
+
+        blocks.append(block)
+        selected_docs.append(doc)
+        seen_shingles |= doc_shingles
+        used_tokens += block_tokens
+
+    return "\n\n".join(blocks), selected_docs
+
+
+def format_user_prompt(user_input, results):
     """
     Generates a formatted prompt based on the user's input question, 
-    incorporating relevant references retrieved from the vector store.
+    incorporating relevant chunks and references retrieved from the vector store.
 
     Args:
         user_input (str): The user's input question or query.
-        retriever: The retriever object used to query the vector store 
-                   and retrieve relevant documents.
+        results (list): The documents retrieved for the question.
 
     Returns:
         str: A formatted string that includes:
              - The user's input as "User Input".
-             - A "Sources" section listing relevant references (author and book name).
-               Each reference is formatted as:
+             - A "Context" section with the text of the most relevant chunks, packed
+               within CONTEXT_TOKEN_BUDGET tokens, each with a numbered citation.
+             - A "Sources" section listing the references (author and book name) of the
+               chunks in the context. Each reference is formatted as:
                '- {author} in "{book}"'
              - If no references are retrieved, only the user's input is returned 
-               without a "Sources" section.
+               without "Context" and "Sources" sections.
     """
-    # Retrieve results from the global retriever using the user input
-    results = retriever.invoke(user_input)
+    # Pack the most relevant, non-duplicate chunks into the context within the token budget
+    context, selected_docs = pack_context(results)
 
     # Handle the case where no results are retrieved from the vector store
-    if not results:
+    if not selected_docs:
         return f"User Input: {user_input}"
 
     # Initialize a list to store formatted references
     retrieved_references = []
-    for doc in results:
+    for doc in selected_docs:
         # Extract metadata from each document, with fallbacks for missing metadata
         author = doc.metadata.get("author", "Unknown Author")
         book = doc.metadata.get("book", "Unknown Book")
         # Append the formatted reference to the list
         retrieved_references.append(f'- {author} in "{book}"')
 
-    # Remove duplicate references and format the list as a string
-    formatted_references = "\n".join(set(retrieved_references))
+    # Remove duplicate references (keeping relevance order) and format the list as a string
+    formatted_references = "\n".join(dict.fromkeys(retrieved_references))
+
+    # Build the final prompt, including the user's input, the context and the sources
+    return f"User Input: {user_input}\n\nContext:\n{context}\n\nSources:\n{formatted_references}."
+
+
+def user_prompt(user_input, retriever, sources=None):
+    """
+    Retrieves the documents relevant to the user's input and builds the prompt (see `format_user_prompt`).
+
+    Args:
+        user_input (str): The user's input question or query.
+        retriever: The retriever object used to query the vector store 
+                   and retrieve relevant documents.
+        sources (list, optional): Sources selected in the UI to restrict the search to
+                                  (see `SourceCatalog.choices`).
+
+    Returns:
+        str: The formatted prompt.
+    """
+    # Retrieve results from the global retriever using the user input
+    kwargs = {"sources": sources} if sources else {}
+    return format_user_prompt(user_input, retriever.invoke(user_input, **kwargs))
+
 
-    # Build the final prompt, including the user's input and the sources
-    return f"User Input: {user_input}\n\nSources:\n{formatted_references}."
+async def auser_prompt(user_input, retriever, sources=None):
+    """
+    Async version of `user_prompt`, retrieving the documents without blocking the event loop.
+
+    Args:
+        user_input (str): The user's input question or query.
+        retriever: The retriever object used to query the vector store.
+        sources (list, optional): Sources selected in the UI to restrict the search to.
+
+    Returns:
+        str: The formatted prompt.
+    """
+    kwargs = {"sources": sources} if sources else {}
+    return format_user_prompt(user_input, await retriever.ainvoke(user_input, **kwargs))
 
 
 def test_retriever(question):
@@ -155,8 +445,8 @@ def test_retriever(question):
     # Load the vector store (assumed to be a prebuilt storage of embedded documents)
     vector_store = load_vector_store()
 
-    # Convert the vector store into a retriever object to perform similarity-based queries
-    retriever = vector_store.as_retriever()
+    # Convert the vector store into a retriever object (hybrid vector + lexical search)
+    retriever = build_retriever(vector_store)
 
     # Print a confirmation message once the vector store and retriever are successfully initialized
     print("✅ Vector store and retriever successfully initialized!\n")
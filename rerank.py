@@ -0,0 +1,137 @@
+import hashlib
+import math
+import threading
+import time
+from typing import Any
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables.config import run_in_executor
+
+from caching import TTLCache, normalize_question
+from config import (RERANK_MODEL, RERANK_DEVICE, RERANK_TOP_N, RERANK_BUDGET_MS, RERANK_BATCH_SIZE,
+                    RERANK_CACHE_SIZE)
+
+# Cross-encoders loaded in this process, keyed by (model name, device)
+_cross_encoders = {}
+_cross_encoders_lock = threading.Lock()
+
+
+def get_cross_encoder(model_name=RERANK_MODEL, device=RERANK_DEVICE):
+    """
+    Returns a sentence-transformers cross-encoder, loading it only once per process.
+
+    Requires the `sentence-transformers` package (also used by the Hugging Face embeddings).
+
+    Args:
+        model_name (str): The cross-encoder model to load.
+        device (str): Device to run the model on (e.g., "cpu").
+
+    Returns:
+        CrossEncoder: The shared cross-encoder.
+    """
+    key = (model_name, device)
+    with _cross_encoders_lock:
+        if key not in _cross_encoders:
+            from sentence_transformers import CrossEncoder
+            _cross_encoders[key] = CrossEncoder(model_name, device=device)
+
+    return _cross_encoders[key]
+
+
+class RerankingRetriever(BaseRetriever):
+    """
+    Reranks the candidates of another retriever with a cross-encoder and keeps the top `top_n`.
+
+    Candidates are scored in batches, in retrieval order, until the millisecond budget would
+    be exceeded; candidates left unscored keep their retrieval order after the scored ones,
+    so a slow machine degrades to plain retrieval order instead of slowing down answers.
+    Scores are cached per (question, chunk text), so repeated questions are reranked for free.
+
+    The cross-encoder score (as a 0-1 probability) is stored in the `relevance_score`
+    metadata of the scored documents and 0 in that of the unscored ones.
+    """
+
+    retriever: BaseRetriever
+    model: Any = None
+    model_name: str = RERANK_MODEL
+    top_n: int = RERANK_TOP_N
+    budget_ms: float = RERANK_BUDGET_MS
+    batch_size: int = RERANK_BATCH_SIZE
+    cache: Any = None
+    reranked: int = 0
+    fallbacks: int = 0
+
+    def model_post_init(self, __context):
+        if self.model is None:
+            self.model = get_cross_encoder(self.model_name)
+        if self.cache is None:
+            self.cache = TTLCache(max_size=RERANK_CACHE_SIZE)
+
+    @property
+    def vectorstore(self):
+        """
+        The vector store of the wrapped retriever.
+        """
+        return self.retriever.vectorstore
+
+    def _get_relevant_documents(self, query, *, run_manager, **kwargs):
+        return self.rerank(query, self.retriever.invoke(query, **kwargs))
+
+    async def _aget_relevant_documents(self, query, *, run_manager, **kwargs):
+        documents = await self.retriever.ainvoke(query, **kwargs)
+        # Scoring is CPU-bound, so it runs in a worker thread
+        return await run_in_executor(None, self.rerank, query, documents)
+
+    def rerank(self, query, documents):
+        """
+        Reranks documents for a query within the time budget.
+
+        Args:
+            query (str): The question.
+            documents (list): The candidate documents, best first according to retrieval.
+
+        Returns:
+            list: The top `top_n` documents after reranking.
+        """
+        start_time = time.perf_counter()
+        question = normalize_question(query)
+        keys = [(self.model_name, question, hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest())
+                for doc in documents]
+        scores = [self.cache.get(key) for key in keys]
+
+        # Score the uncached candidates batch by batch while the next batch fits in the budget
+        pending = [index for index, score in enumerate(scores) if score is None]
+        batch_seconds = 0.0
+        for offset in range(0, len(pending), self.batch_size):
+            elapsed = time.perf_counter() - start_time
+            if (elapsed + batch_seconds) * 1000 > self.budget_ms:
+                self.fallbacks += 1
+                break
+            batch_start = time.perf_counter()
+            batch = pending[offset:offset + self.batch_size]
+            batch_scores = self.model.predict(
+                [(query, documents[index].page_content) for index in batch])
+            for index, score in zip(batch, batch_scores):
+                scores[index] = float(score)
+                self.cache.put(keys[index], scores[index])
+            batch_seconds = time.perf_counter() - batch_start
+        self.reranked += 1
+
+        # Scored candidates by score, then unscored ones in retrieval order (stable sort)
+        order = sorted(range(len(documents)), key=lambda index: (
+            scores[index] is None, -(scores[index] or 0.0)))
+
+        return [Document(id=documents[index].id, page_content=documents[index].page_content,
+                         metadata={**documents[index].metadata,
+                                   "relevance_score": 0.0 if scores[index] is None
+                                   else 1 / (1 + math.exp(-scores[index]))})
+                for index in order[:self.top_n]]
+
+    def stats(self):
+        """
+        Returns the reranking counters.
+
+        Returns:
+            dict: Number of reranked queries, queries that ran out of budget, and the score cache statistics.
+        """
+        return {"reranked": self.reranked, "fallbacks": self.fallbacks, "cache": self.cache.stats()}
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+
+from config import SESSION_IDLE_TIMEOUT, MAX_SESSIONS
+
+
+class SessionStore:
+    """
+    Keeps per-session state (e.g., a conversation chain with its own memory) keyed by session ID.
+
+    State is created on first use with the given factory. Sessions idle for longer than
+    `idle_timeout` seconds are evicted, and when more than `max_sessions` sessions are live
+    the least recently used one is evicted, so memory use stays bounded.
+    """
+
+    def __init__(self, factory, idle_timeout=SESSION_IDLE_TIMEOUT, max_sessions=MAX_SESSIONS):
+        """
+        Args:
+            factory (callable): Creates the state of a new session (called without arguments).
+            idle_timeout (float): Seconds of inactivity after which a session is evicted.
+            max_sessions (int): Maximum number of live sessions.
+        """
+        self.factory = factory
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.evicted = 0
+        self._sessions = OrderedDict()  # session ID -> (last access time, state)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """
+        Returns the state of a session, creating it if needed.
+
+        Args:
+            session_id (str): The session ID (e.g., Gradio's `request.session_hash`).
+
+        Returns:
+            The session state.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            if session_id in self._sessions:
+                state = self._sessions.pop(session_id)[1]
+            else:
+                state = self.factory()
+            # Most recently used sessions are kept at the end
+            self._sessions[session_id] = (now, state)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+
+            return state
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def _evict_idle(self, now):
+        """
+        Evicts sessions idle for longer than the timeout. Must be called with the lock held.
+        """
+        while self._sessions:
+            last_access, _ = next(iter(self._sessions.values()))
+            if now - last_access <= self.idle_timeout:
+                break
+            self._sessions.popitem(last=False)
+            self.evicted += 1
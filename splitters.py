@@ -0,0 +1,146 @@
+import time
+from functools import lru_cache, partial
+from langchain_text_splitters import CharacterTextSplitter, RecursiveCharacterTextSplitter
+
+from tokens import count_tokens
+from config import (TEXT_SPLITTER, CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_SIZE_TOKENS, CHUNK_OVERLAP_TOKENS,
+                    SPLITTER_TOKENIZER, OPENAI_EMBEDDINGS_MODEL, HF_EMBEDDINGS_MODEL)
+
+# Available text splitters (see TEXT_SPLITTER in config.py)
+SPLITTER_KINDS = ("character", "recursive", "sentence", "token")
+
+# Separators of the recursive splitter, from the coarsest to the finest
+RECURSIVE_SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+# Separators of the sentence-aware splitters (regular expressions): paragraphs, sentence
+# ends, then lines and words for sentences that are too long on their own
+SENTENCE_SEPARATORS = [r"\n\s*\n", r"(?<=[.!?])\s+", r"\n", r" ", r""]
+
+
+@lru_cache(maxsize=None)
+def get_hf_tokenizer(model_name=HF_EMBEDDINGS_MODEL):
+    """
+    Returns the tokenizer of a Hugging Face embedding model, loading it only once per process.
+
+    Requires the `transformers` package (installed with `sentence-transformers`).
+    """
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_name)
+
+
+def embedding_token_counter(tokenizer=SPLITTER_TOKENIZER):
+    """
+    Returns a function counting the tokens of a text with the tokenizer of an embedding model.
+
+    Args:
+        tokenizer (str): "openai" (tiktoken encoding of OPENAI_EMBEDDINGS_MODEL) or "hf"
+                         (tokenizer of HF_EMBEDDINGS_MODEL).
+
+    Returns:
+        callable: The token counter.
+    """
+    if tokenizer == "hf":
+        hf_tokenizer = get_hf_tokenizer()
+        return lambda text: len(hf_tokenizer.encode(text, add_special_tokens=False))
+
+    return partial(count_tokens, model=OPENAI_EMBEDDINGS_MODEL)
+
+
+def splitter_settings(kind=TEXT_SPLITTER, chunk_size=None, chunk_overlap=None, tokenizer=SPLITTER_TOKENIZER):
+    """
+    Returns the effective settings of a text splitter (defaults from the configuration).
+
+    The settings are recorded for every indexed book (see `vectorize.build_manifest`), so
+    books chunked with other settings are re-indexed on the next update.
+
+    Returns:
+        dict: The splitter kind, chunk size and overlap (in tokens for "token", characters
+              otherwise) and, for "token", the tokenizer.
+    """
+    if kind not in SPLITTER_KINDS:
+        raise ValueError(f"Unknown text splitter '{kind}' (expected one of {', '.join(SPLITTER_KINDS)}).")
+
+    if kind == "token":
+        return {"kind": kind,
+                "chunk_size": chunk_size or CHUNK_SIZE_TOKENS,
+                "chunk_overlap": CHUNK_OVERLAP_TOKENS if chunk_overlap is None else chunk_overlap,
+                "tokenizer": tokenizer}
+
+    return {"kind": kind,
+            "chunk_size": chunk_size or CHUNK_SIZE,
+            "chunk_overlap": CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap}
+
+
+def create_text_splitter(kind=TEXT_SPLITTER, chunk_size=None, chunk_overlap=None, tokenizer=SPLITTER_TOKENIZER):
+    """
+    Creates a text splitter.
+
+    Every splitter records the character offset of each chunk within its page
+    (`start_index` metadata), which is used to derive stable chunk IDs.
+
+    Args:
+        kind (str): "character", "recursive", "sentence" or "token" (see TEXT_SPLITTER in config.py).
+        chunk_size (int, optional): Maximum size of a chunk (default from the configuration).
+        chunk_overlap (int, optional): Overlap between consecutive chunks (default from the configuration).
+        tokenizer (str): Tokenizer of the "token" splitter ("openai" or "hf").
+
+    Returns:
+        TextSplitter: The configured text splitter.
+    """
+    settings = splitter_settings(kind, chunk_size, chunk_overlap, tokenizer)
+    options = {"chunk_size": settings["chunk_size"], "chunk_overlap": settings["chunk_overlap"],
+               "add_start_index": True}
+
+    if kind == "character":
+        return CharacterTextSplitter(**options)
+    if kind == "recursive":
+        return RecursiveCharacterTextSplitter(separators=RECURSIVE_SEPARATORS, **options)
+    if kind == "sentence":
+        return RecursiveCharacterTextSplitter(
+            separators=SENTENCE_SEPARATORS, is_separator_regex=True, **options)
+
+    return RecursiveCharacterTextSplitter(
+        separators=SENTENCE_SEPARATORS, is_separator_regex=True,
+        length_function=embedding_token_counter(tokenizer), **options)
+
+
+def compare_splitters(pages, kinds=SPLITTER_KINDS, tokenizer=SPLITTER_TOKENIZER):
+    """
+    Splits the same pages with several text splitters and measures their speed and chunk sizes.
+
+    Chunk sizes are measured in tokens of the embedding model, which is what chunks cost
+    to embed and to include in prompts.
+
+    Args:
+        pages (list): The page documents.
+        kinds (list): The splitters to compare (each with its configured sizes).
+        tokenizer (str): Tokenizer used to measure the chunks ("openai" or "hf").
+
+    Returns:
+        list: Per splitter: its settings, the split time, pages/sec, number of chunks, mean, max
+              and total tokens, and the number of chunks larger than the chunk size.
+    """
+    count = embedding_token_counter(tokenizer)
+    results = []
+    for kind in kinds:
+        settings = splitter_settings(kind, tokenizer=tokenizer)
+        splitter = create_text_splitter(kind, tokenizer=tokenizer)
+
+        start_time = time.perf_counter()
+        chunks = splitter.split_documents(pages)
+        seconds = time.perf_counter() - start_time
+
+        tokens = [count(chunk.page_content) for chunk in chunks]
+        sizes = tokens if kind == "token" else [len(chunk.page_content) for chunk in chunks]
+        results.append({
+            **settings,
+            "seconds": seconds,
+            "pages_per_sec": len(pages) / seconds if seconds else 0.0,
+            "chunks": len(chunks),
+            "mean_tokens": sum(tokens) / len(tokens) if tokens else 0.0,
+            "max_tokens": max(tokens, default=0),
+            "total_tokens": sum(tokens),
+            "oversized": sum(size > settings["chunk_size"] for size in sizes),
+        })
+
+    return results
@@ -0,0 +1,247 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def stub_embedding(text, dimensions):
+    """
+    Generates a deterministic, unit-length pseudo-embedding for a text.
+
+    The same text always maps to the same vector, so results are reproducible across runs.
+
+    Args:
+        text (str): The input text.
+        dimensions (int): Number of vector dimensions.
+
+    Returns:
+        list: The embedding as a list of floats.
+    """
+    seed = int.from_bytes(hashlib.sha256(
+        text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+
+    return [value / norm for value in vector]
+
+
+def stub_answer(messages, num_words):
+    """
+    Generates a deterministic answer to a chat conversation.
+
+    The answer repeats the first words of the last user message, so it depends only on
+    the prompt and its length is bounded.
+
+    Args:
+        messages (list): The chat messages of the request.
+        num_words (int): Maximum number of words of the answer.
+
+    Returns:
+        str: The answer.
+    """
+    user_messages = [message.get("content") or "" for message in messages
+                     if message.get("role") == "user"]
+    words = " ".join(user_messages[-1:]).split()[:num_words]
+
+    return "Stub answer: " + " ".join(words)
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    Serves a minimal, deterministic subset of the OpenAI REST API for offline testing.
+
+    Supported endpoints:
+        - POST /v1/embeddings: Returns deterministic embeddings and token usage.
+        - POST /v1/chat/completions: Returns a deterministic answer (see `stub_answer`),
+          streamed word by word with `stream=True`.
+
+    Every `rate_limit_every`-th request is rejected with a 429 response and a
+    `Retry-After` header, to exercise client backoff.
+    """
+
+    # Server options, set by `run_server`
+    dimensions = 1536
+    latency = 0.0
+    rate_limit_every = 0
+    retry_after = 0.1
+    answer_words = 50
+    token_delay = 0.0
+    request_count = 0
+    count_lock = threading.Lock()
+
+    def do_POST(self):
+        """
+        Dispatches a POST request to the matching stub endpoint.
+        """
+        body = json.loads(self.rfile.read(
+            int(self.headers.get("Content-Length", 0))) or b"{}")
+
+        with self.count_lock:
+            type(self).request_count += 1
+            request_number = self.request_count
+        if self.rate_limit_every and request_number % self.rate_limit_every == 0:
+            self._send_json(429, {"error": {"message": "Rate limit reached (stub).",
+                                            "type": "requests", "code": "rate_limit_exceeded"}},
+                            headers={"Retry-After": str(self.retry_after)})
+            return
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.path.rstrip("/").endswith("/embeddings"):
+            self._send_json(200, self._embeddings(body))
+        elif self.path.rstrip("/").endswith("/chat/completions"):
+            self._chat_completion(body)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown endpoint {self.path} (stub).",
+                                            "type": "invalid_request_error"}})
+
+    def _embeddings(self, body):
+        """
+        Builds an embeddings response for the request body.
+        """
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        # Token arrays are hashed by their string representation
+        texts = [text if isinstance(text, str) else json.dumps(text)
+                 for text in inputs]
+        num_tokens = sum(len(text.split()) for text in texts)
+
+        return {
+            "object": "list",
+            "model": body.get("model", "stub"),
+            "data": [{"object": "embedding", "index": index,
+                      "embedding": stub_embedding(text, self.dimensions)}
+                     for index, text in enumerate(texts)],
+            "usage": {"prompt_tokens": num_tokens, "total_tokens": num_tokens},
+        }
+
+    def _chat_completion(self, body):
+        """
+        Sends a chat completion for the request body, as a server-sent event stream if requested.
+        """
+        answer = stub_answer(body.get("messages", []), self.answer_words)
+        prompt_tokens = sum(len(str(message.get("content") or "").split())
+                            for message in body.get("messages", []))
+        words = answer.split(" ")
+        base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": body.get("model", "stub")}
+
+        if not body.get("stream"):
+            self._send_json(200, {
+                **base, "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                          "total_tokens": prompt_tokens + len(words)},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for index, word in enumerate(words):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            delta = {"role": "assistant", "content": word} if index == 0 else {"content": " " + word}
+            self._send_event({**base, "object": "chat.completion.chunk",
+                              "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+        self._send_event({**base, "object": "chat.completion.chunk",
+                          "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_event(self, payload):
+        """
+        Sends one server-sent event of a streamed response.
+        """
+        self.wfile.write(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        """
+        Sends a JSON response.
+        """
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """
+        Silences per-request logging.
+        """
+
+
+def run_server(host="127.0.0.1", port=8089, dimensions=1536, latency=0.0, rate_limit_every=0,
+               retry_after=0.1, answer_words=50, token_delay=0.0, block=True):
+    """
+    Starts the stub OpenAI server.
+
+    Args:
+        host (str): Interface to bind to.
+        port (int): Port to listen on (0 picks a free port).
+        dimensions (int): Number of dimensions of the stub embeddings.
+        latency (float): Artificial latency added to every response, in seconds.
+        rate_limit_every (int): Reject every N-th request with a 429 response (0 disables).
+        retry_after (float): `Retry-After` value sent with 429 responses, in seconds.
+        answer_words (int): Maximum number of words of the stub chat answers.
+        token_delay (float): Delay between the streamed words of a chat answer, in seconds.
+        block (bool): If True, serve forever; otherwise serve from a background thread.
+
+    Returns:
+        ThreadingHTTPServer: The running server (when `block` is False).
+    """
+    handler = type("ConfiguredStubOpenAIHandler", (StubOpenAIHandler,), {
+        "dimensions": dimensions, "latency": latency,
+        "rate_limit_every": rate_limit_every, "retry_after": retry_after,
+        "answer_words": answer_words, "token_delay": token_delay,
+        "request_count": 0, "count_lock": threading.Lock(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+
+    if block:
+        print(
+            f"\n🧪 Stub OpenAI API listening on http://{host}:{server.server_port}/v1\n")
+        server.serve_forever()
+    else:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+if __name__ == "__main__":
+    """
+    Entry point for running the stub server directly, e.g.:
+
+        python stub_openai.py --port 8089 --rate-limit-every 5
+        OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=stub python vectorize.py
+    """
+    parser = argparse.ArgumentParser(
+        description="Deterministic local stub of the OpenAI API for offline testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Artificial latency per response, in seconds.")
+    parser.add_argument("--rate-limit-every", type=int, default=0,
+                        help="Reject every N-th request with a 429 response.")
+    parser.add_argument("--retry-after", type=float, default=0.1,
+                        help="Retry-After value sent with 429 responses, in seconds.")
+    parser.add_argument("--answer-words", type=int, default=50,
+                        help="Maximum number of words of the stub chat answers.")
+    parser.add_argument("--token-delay", type=float, default=0.0,
+                        help="Delay between the streamed words of a chat answer, in seconds.")
+    args = parser.parse_args()
+
+    run_server(args.host, args.port, args.dimensions, args.latency,
+               args.rate_limit_every, args.retry_after, args.answer_words, args.token_delay)
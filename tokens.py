@@ -0,0 +1,74 @@
+from functools import lru_cache
+
+from config import OPENAI_MODEL
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model=OPENAI_MODEL):
+    """
+    Returns the tiktoken encoding used by an OpenAI model.
+
+    Args:
+        model (str): The OpenAI model name (chat or embeddings model).
+
+    Returns:
+        Encoding or None: The tiktoken encoding, or None if tiktoken is not installed or its
+                          encoding files cannot be loaded (e.g., offline on first use).
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Unknown model names fall back to the encoding of current OpenAI models
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken downloads its encoding files on first use, which fails without network access
+        return None
+
+
+def count_tokens(text, model=OPENAI_MODEL):
+    """
+    Counts the number of tokens in a text for an OpenAI model.
+
+    Falls back to an estimate of one token per four characters when no tokenizer is available.
+
+    Args:
+        text (str): The text to measure.
+        model (str): The OpenAI model whose tokenizer is used.
+
+    Returns:
+        int: The number of tokens.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens, model=OPENAI_MODEL):
+    """
+    Truncates a text to at most `max_tokens` tokens for an OpenAI model.
+
+    Args:
+        text (str): The text to truncate.
+        max_tokens (int): Maximum number of tokens to keep.
+        model (str): The OpenAI model whose tokenizer is used.
+
+    Returns:
+        str: The text, truncated if it was longer than `max_tokens`.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[:max_tokens * 4]
+
+    token_ids = encoding.encode(text, disallowed_special=())
+    if len(token_ids) <= max_tokens:
+        return text
+
+    return encoding.decode(token_ids[:max_tokens])
@@ -1,16 +1,41 @@
 import os
+import sys
+import json
+import argparse
+import time
+import shutil
+import hashlib
+import tempfile
+from itertools import islice
+from functools import partial
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dotenv import load_dotenv
 from pathlib import Path
-from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
 from langchain_chroma import Chroma
-from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.vectorstores import Chroma
-
-from config import (KNOWLEDGE_BASE_DIR, CHUNK_SIZE, CHUNK_OVERLAP,
+from embeddings import (CachedEmbeddings, AsyncOpenAIEmbeddings, get_hf_embedding_model,
+                        warm_up_hf_embedding_model)
+from lexical import LexicalIndex, load_lexical_index
+from maintenance import (hnsw_metadata, index_parameters, index_recall, rebuild_index,
+                         recover_interrupted_rebuild, collect_garbage,
+                         store_footprint)
+from quantization import PCAProjection, ProjectedEmbeddings, store_embeddings, projection_recall
+from page_cache import PageTextCache
+from splitters import create_text_splitter, splitter_settings, compare_splitters
+from benchmark import load_questions, evaluate_store
+
+from config import (KNOWLEDGE_BASE_DIR, CHUNK_SIZE, CHUNK_OVERLAP, TEXT_SPLITTER,
                     DB_PATH, VECTORIZE_CLI_TITLE, VECTORIZE_CLI_CHOICES,
-                    HF_EMBEDDINGS_MODEL)
+                    HF_WARMUP_ON_STARTUP, INDEX_MANIFEST_NAME, INGEST_WORKERS,
+                    INGEST_BATCH_SIZE, VECTOR_PCA_DIMENSIONS, VECTOR_PROJECTION_NAME,
+                    CHUNK_SWEEP_CONFIGS, BENCHMARK_QUESTIONS_PATH, BENCHMARK_REPEATS,
+                    PAGE_CACHE_ENABLED, PDF_BACKEND, LEXICAL_INDEX_NAME)
+
+# Page metadata kept from the PDF loaders (see `parse_pdf`)
+PAGE_METADATA_FIELDS = ("source", "page", "page_label")
 
 
 def add_metadata(doc, author_name, book_name):
@@ -31,100 +56,688 @@ def add_metadata(doc, author_name, book_name):
     return doc
 
 
-def load_and_process_documents():
+def list_knowledge_base_files(knowledge_base_dir=KNOWLEDGE_BASE_DIR):
+    """
+    Lists all PDF files in the knowledge base directory together with their author name.
+
+    Each top-level folder in the knowledge base is assumed to be named after an author.
+    Files are returned in a stable (sorted) order so that repeated runs process the
+    books in the same sequence.
+
+    Args:
+        knowledge_base_dir (Path): Root directory of the knowledge base.
+
+    Returns:
+        list: A list of (author_name, pdf_path) tuples.
+    """
+    pdf_files = []
+    for folder_path in sorted(knowledge_base_dir.glob("*")):
+        # Extract author name from the folder name
+        author_name = folder_path.stem.title()
+        # Match all PDF files in the author's folder (including subfolders)
+        for pdf_path in sorted(folder_path.glob("**/*.pdf")):
+            pdf_files.append((author_name, pdf_path))
+
+    return pdf_files
+
+
+def get_pdf_loader(pdf_path, backend=PDF_BACKEND):
+    """
+    Creates the loader of a PDF file for a parsing backend (see PDF_BACKEND in config.py).
+
+    The optional backends are imported only when they are selected.
+
+    Args:
+        pdf_path (Path): Path to the PDF file.
+        backend (str): "pypdf", "pymupdf" or "pypdfium2".
+
+    Returns:
+        BaseLoader: The PDF loader.
+    """
+    if backend == "pypdf":
+        return PyPDFLoader(str(pdf_path))
+    if backend == "pymupdf":
+        from langchain_community.document_loaders import PyMuPDFLoader
+        return PyMuPDFLoader(str(pdf_path))
+    if backend == "pypdfium2":
+        from langchain_community.document_loaders import PyPDFium2Loader
+        return PyPDFium2Loader(str(pdf_path))
+
+    raise ValueError(f"Unknown PDF backend '{backend}' (expected 'pypdf', 'pymupdf' or 'pypdfium2').")
+
+
+def parse_pdf(pdf_path, backend=PDF_BACKEND):
+    """
+    Lazily parses a PDF file page by page.
+
+    Only the `source`, `page` and `page_label` metadata of the loader are kept, so pages
+    have the same metadata whatever the backend (some add the PDF properties to every page).
+
+    Args:
+        pdf_path (Path): Path to the PDF file.
+        backend (str): The PDF backend (see PDF_BACKEND in config.py).
+
+    Yields:
+        Document: The next page document.
+    """
+    for doc in get_pdf_loader(pdf_path, backend).lazy_load():
+        yield Document(page_content=doc.page_content,
+                       metadata={field: doc.metadata[field] for field in PAGE_METADATA_FIELDS
+                                 if field in doc.metadata})
+
+
+def iter_pages(pdf_path, author_name, cache=None, file_hash=None):
+    """
+    Lazily loads a single PDF file page by page and adds the author and book metadata to every page.
+
+    Pages are read from the page-text cache when the file was parsed before (see
+    `PageTextCache`); otherwise the file is parsed one page at a time and its pages are
+    cached once it has been read completely. Cached pages skip parsing entirely, which
+    is the slowest stage of ingestion.
+
+    Args:
+        pdf_path (Path): Path to the PDF file.
+        author_name (str): The name of the author the book belongs to.
+        cache (PageTextCache, optional): The page-text cache (a new one by default; none if
+                                         PAGE_CACHE_ENABLED is False).
+        file_hash (str, optional): SHA-256 hash of the file content, if already known.
+
+    Yields:
+        Document: The next page document with metadata.
+    """
+    # Extract the book name from the file name (without extension)
+    book_name = Path(pdf_path).stem.title()
+
+    if cache is None and PAGE_CACHE_ENABLED:
+        cache = PageTextCache()
+    if cache is not None:
+        file_hash = file_hash or file_fingerprint(pdf_path)["sha256"]
+        pages = cache.get(file_hash)
+        if pages is not None:
+            for page in pages:
+                yield add_metadata(Document(page_content=page.page_content,
+                                            metadata={"source": str(pdf_path), **page.metadata}),
+                                   author_name, book_name)
+            return
+
+    parsed_pages = []
+    for page in parse_pdf(pdf_path):
+        if cache is not None:
+            parsed_pages.append(page)
+        yield add_metadata(Document(page_content=page.page_content, metadata=dict(page.metadata)),
+                           author_name, book_name)
+
+    if cache is not None:
+        cache.put(file_hash, parsed_pages)
+
+
+def load_pdf(pdf_path, author_name, cache=None):
+    """
+    Loads a single PDF file page by page and adds the author and book metadata to every page.
+
+    Args:
+        pdf_path (Path): Path to the PDF file.
+        author_name (str): The name of the author the book belongs to.
+        cache (PageTextCache, optional): The page-text cache (see `iter_pages`).
+
+    Returns:
+        list: A list of page documents with metadata.
+    """
+    return list(iter_pages(pdf_path, author_name, cache))
+
+
+def get_text_splitter(chunk_size=None, chunk_overlap=None):
+    """
+    Creates the text splitter used to split documents into chunks (TEXT_SPLITTER in config.py).
+
+    The splitter records the character offset of each chunk within its page
+    (`start_index` metadata), which is used to derive stable chunk IDs.
+
+    Args:
+        chunk_size (int, optional): Maximum size of a chunk (in tokens for the "token"
+                                    splitter, characters otherwise); defaults to the configuration.
+        chunk_overlap (int, optional): Overlap between consecutive chunks, in the same unit.
+
+    Returns:
+        TextSplitter: The configured text splitter.
+    """
+    return create_text_splitter(TEXT_SPLITTER, chunk_size, chunk_overlap)
+
+
+def chunk_id(chunk):
+    """
+    Derives a stable ID for a chunk from its book, page and offset within the page.
+
+    The same chunk always gets the same ID, so re-indexing a book upserts its chunks
+    in place instead of creating duplicates.
+
+    Args:
+        chunk: A document chunk with `author`, `book`, `page` and `start_index` metadata.
+
+    Returns:
+        str: A hexadecimal chunk ID.
+    """
+    key = "|".join(str(chunk.metadata.get(field, "")) for field in
+                   ("author", "book", "page", "start_index"))
+
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def iter_chunks(pages, text_splitter):
+    """
+    Lazily splits a stream of page documents into chunks.
+
+    Args:
+        pages (iterable): Page documents with metadata.
+        text_splitter: The text splitter used to create the chunks.
+
+    Yields:
+        Document: The next document chunk.
+    """
+    for page in pages:
+        yield from text_splitter.split_documents([page])
+
+
+def batched(iterable, batch_size):
+    """
+    Groups the items of an iterable into lists of at most `batch_size` items.
+
+    Args:
+        iterable (iterable): The items to group.
+        batch_size (int): Maximum number of items per batch.
+
+    Yields:
+        list: The next batch of items.
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def load_and_split_pdf(author_name, pdf_path):
+    """
+    Loads a single PDF file with metadata and splits its pages into chunks.
+
+    This is the unit of work of the ingestion pipeline; it is a module-level function
+    so it can be dispatched to worker processes.
+
+    Args:
+        author_name (str): The name of the author the book belongs to.
+        pdf_path (Path): Path to the PDF file.
+
+    Returns:
+        Tuple:
+            - documents: A list of page documents with metadata.
+            - chunks: A list of document chunks created by splitting the pages.
+            - timing: The file's timing report: source, PDF backend, whether the pages came
+                      from the page-text cache, number of pages and chunks, and the load and
+                      split times in seconds.
+    """
+    cache = PageTextCache() if PAGE_CACHE_ENABLED else None
+    start_time = time.perf_counter()
+    documents = load_pdf(pdf_path, author_name, cache)
+    load_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    chunks = get_text_splitter().split_documents(documents)
+    split_seconds = time.perf_counter() - start_time
+
+    timing = {"source": str(pdf_path), "backend": PDF_BACKEND,
+              "cached": cache is not None and cache.hits > 0, "pages": len(documents),
+              "chunks": len(chunks), "load_seconds": load_seconds, "split_seconds": split_seconds}
+
+    return documents, chunks, timing
+
+
+def load_and_process_documents(workers=INGEST_WORKERS, report=None, knowledge_base_dir=KNOWLEDGE_BASE_DIR):
     """
     Loads documents from the knowledge base directory, adds metadata for the author and book name,
     and splits them into chunks for processing.
 
+    With more than one worker, PDFs are parsed and split across a process pool. Results are
+    collected in file order, so the documents, chunks and their metadata are identical to
+    the serial path.
+
+    Args:
+        workers (int): Number of worker processes to use. Use 1 to load documents serially.
+        report (callable, optional): Called with the timing report of each file, in file
+                                     order (see `load_and_split_pdf`).
+        knowledge_base_dir (Path): Root directory of the knowledge base.
+
     Returns:
         Tuple:
             - documents: A list of document objects with metadata.
             - chunks: A list of document chunks created by splitting the original documents.
     """
-    documents = []
+    documents, chunks = [], []
+    pdf_files = list_knowledge_base_files(knowledge_base_dir)
+    author_names = [author_name for author_name, _ in pdf_files]
+    pdf_paths = [pdf_path for _, pdf_path in pdf_files]
+
+    if workers > 1 and len(pdf_files) > 1:
+        # Parse and split the PDFs in parallel; `map` yields results in submission order
+        with ProcessPoolExecutor(max_workers=min(workers, len(pdf_files))) as executor:
+            for file_documents, file_chunks, timing in executor.map(
+                    load_and_split_pdf, author_names, pdf_paths):
+                documents.extend(file_documents)
+                chunks.extend(file_chunks)
+                if report:
+                    report(timing)
+    else:
+        # Load and split every PDF of every author folder in the current process
+        for file_documents, file_chunks, timing in map(load_and_split_pdf, author_names, pdf_paths):
+            documents.extend(file_documents)
+            chunks.extend(file_chunks)
+            if report:
+                report(timing)
 
-    # Iterate through author folders in the knowledge base directory
-    # Each folder is assumed to be named after an author
-    for folder_path in KNOWLEDGE_BASE_DIR.glob("*"):
-        # Extract author name from the folder name
-        author_name = folder_path.stem.title()
+    return documents, chunks
 
-        # Load all PDF files from the author's folder
-        loader = DirectoryLoader(
-            path=folder_path,
-            glob="**/*.pdf",  # Match all PDF files in the folder
-            loader_cls=PyPDFLoader
-        )
-        folder_docs = loader.load()  # Load documents using the specified loader
-
-        # Add metadata (author and book name) to each loaded document
-        for doc in folder_docs:
-            # Extract the book name from the file name (without extension)
-            book_name = Path(doc.metadata["source"]).stem.title()
-            documents.append(add_metadata(doc, author_name, book_name))
-
-    # Initialize a text splitter for creating chunks from documents
-    text_splitter = CharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,  # Define chunk size for splitting
-        chunk_overlap=CHUNK_OVERLAP  # Define overlap size for context preservation
-    )
 
-    # Split the documents into smaller chunks
-    chunks = text_splitter.split_documents(documents)
+def file_fingerprint(path):
+    """
+    Computes the fingerprint used to detect changes to a knowledge base file.
 
-    return documents, chunks
+    Args:
+        path (Path): Path to the file.
+
+    Returns:
+        dict: The file size, modification time and SHA-256 content hash.
+    """
+    stat = Path(path).stat()
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha256.update(block)
+
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256.hexdigest()}
+
+
+def load_manifest(db_path):
+    """
+    Loads the index manifest of a vector store.
+
+    The manifest maps every indexed file (by its `source` path) to its fingerprint and
+    number of chunks.
+
+    Args:
+        db_path (Path): Directory of the vector store.
+
+    Returns:
+        dict: The manifest, or an empty manifest if none exists yet.
+    """
+    manifest_path = Path(db_path) / INDEX_MANIFEST_NAME
+    if manifest_path.exists():
+        return json.loads(manifest_path.read_text(encoding="utf-8"))
+
+    return {"files": {}}
+
+
+def save_manifest(db_path, manifest):
+    """
+    Persists the index manifest of a vector store.
+
+    The manifest is written to a temporary file first and then moved into place,
+    so an interrupted write never leaves a corrupt manifest behind.
+
+    Args:
+        db_path (Path): Directory of the vector store.
+        manifest (dict): The manifest to save.
+    """
+    manifest_path = Path(db_path) / INDEX_MANIFEST_NAME
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp_path, manifest_path)
+
+
+def build_manifest(chunks):
+    """
+    Builds an index manifest from a list of chunks, counting chunks by source file.
+
+    Args:
+        chunks (list): Document chunks loaded from the knowledge base.
+
+    Returns:
+        dict: The manifest describing the indexed files.
+    """
+    files = {}
+    for chunk in chunks:
+        source = chunk.metadata["source"]
+        if source not in files:
+            files[source] = {**file_fingerprint(source), "chunks": 0,
+                             "splitter": splitter_settings(TEXT_SPLITTER)}
+        files[source]["chunks"] += 1
+
+    return {"files": files}
+
+
+def get_chunk_ids(vector_store, source):
+    """
+    Returns the IDs of all chunks of a source file stored in the vector store.
+
+    Args:
+        vector_store (Chroma): The vector store to query.
+        source (str): The `source` path of the file.
+
+    Returns:
+        list: The chunk IDs of the file.
+    """
+    return vector_store.get(where={"source": source}, include=[])["ids"]
+
+
+def clear_vector_store(vector_store, db_path, batch_size=INGEST_BATCH_SIZE):
+    """
+    Deletes all chunks from a vector store and resets its index manifest.
+
+    Chunks are deleted in batches rather than dropping the collection, so the
+    collection (and its on-disk segment) is reused by the next indexing run.
+
+    Args:
+        vector_store (Chroma): The vector store to clear.
+        db_path (Path): Directory of the vector store (holds the index manifest).
+        batch_size (int): Number of chunks deleted per batch.
+    """
+    for ids in batched(vector_store.get(include=[])["ids"], batch_size):
+        vector_store.delete(ids=ids)
+    LexicalIndex().save(db_path)
+    save_manifest(db_path, {"files": {}})
+
+
+def index_documents(vector_store, db_path, batch_size=INGEST_BATCH_SIZE, progress=None,
+                    knowledge_base_dir=KNOWLEDGE_BASE_DIR, rebuild=False):
+    """
+    Incrementally synchronizes a vector store with the knowledge base directory.
+
+    Only new or changed books are loaded, split and embedded; chunks of books that were
+    removed from the knowledge base are deleted from the collection. Unchanged books are
+    detected from their size and modification time, and a content hash check avoids
+    re-embedding files that were merely touched.
+
+    Books are streamed through the pipeline (load page -> add metadata -> split ->
+    embed batch -> upsert batch), so memory stays flat regardless of corpus size.
+    The manifest is saved after every book, so an interrupted run keeps all completed
+    books and the next run resumes where it stopped. The lexical (BM25) index stored next
+    to the collection is updated chunk for chunk along with it, but saved only once at the
+    end of the run (rewriting it per book would cost O(books x corpus) I/O). While it is
+    unsaved, the manifest is flagged `lexical_index_stale`, so after an interruption the
+    next run rebuilds the lexical index from the collection instead of trusting it.
+
+    Nothing is deleted unless the knowledge base lists at least one book: an empty or
+    unmounted directory raises FileNotFoundError instead of removing every indexed book.
+    A store built before manifests existed (such as the shipped stores) is only cleared
+    when `rebuild` is set; otherwise a ValueError asks for a rebuild.
+
+    Args:
+        vector_store (Chroma): The vector store to update.
+        db_path (Path): Directory of the vector store (holds the index manifest).
+        batch_size (int): Number of chunks embedded and upserted per batch.
+        progress (callable, optional): Called after each processed book with the source
+                                       path, its status and its number of chunks.
+        knowledge_base_dir (Path): Root directory of the knowledge base.
+        rebuild (bool): If True, clear the store first and re-index every book.
+
+    Returns:
+        dict: The number of added, updated, removed and unchanged books.
+    """
+    current_files = {str(pdf_path): (author_name, pdf_path)
+                     for author_name, pdf_path in list_knowledge_base_files(knowledge_base_dir)}
+    if not current_files:
+        raise FileNotFoundError(
+            f"No PDF files found in {knowledge_base_dir}; refusing to update the vector store "
+            f"(it would remove every indexed book).")
+
+    if rebuild:
+        clear_vector_store(vector_store, db_path, batch_size)
+
+    manifest = load_manifest(db_path)
+    indexed_files = manifest["files"]
+    summary = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+
+    # A previous run was interrupted before saving the lexical index: rebuild it below
+    if manifest.pop("lexical_index_stale", False):
+        (Path(db_path) / LEXICAL_INDEX_NAME).unlink(missing_ok=True)
+
+    # A store built before manifests existed has random chunk IDs that cannot be
+    # matched to books, so it can only be updated by rebuilding it with stable IDs
+    if not indexed_files and vector_store._collection.count():
+        raise ValueError(
+            f"The vector store in {db_path} has no index manifest (it was built before "
+            f"incremental updates); rebuild it from scratch to update it.")
+    # The index only holds the term counts of each chunk (not their text), so it is kept
+    # in memory for the whole run and saved at the end
+    lexical_index = load_lexical_index(vector_store, db_path, batch_size)
+
+    # Step 1: Remove the chunks of books that no longer exist
+    for source in sorted(set(indexed_files) - set(current_files)):
+        manifest["lexical_index_stale"] = True
+        for ids in batched(get_chunk_ids(vector_store, source), batch_size):
+            vector_store.delete(ids=ids)
+            lexical_index.remove(ids)
+        del indexed_files[source]
+        save_manifest(db_path, manifest)
+        summary["removed"] += 1
+        if progress:
+            progress(source, "removed", 0)
+
+    # Step 2: Stream new and changed books into the vector store
+    text_splitter = get_text_splitter()
+    settings = splitter_settings(TEXT_SPLITTER)
+    for source, (author_name, pdf_path) in current_files.items():
+        entry = indexed_files.get(source)
+        stat = pdf_path.stat()
+        # Books chunked with other splitter settings are re-indexed (manifests without
+        # splitter settings were written with the character splitter)
+        same_splitter = entry is not None and entry.get("splitter", {
+            "kind": "character", "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP}) == settings
+
+        # Cheap check first: same size and modification time means the book is unchanged
+        if same_splitter and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            summary["unchanged"] += 1
+            continue
+
+        fingerprint = file_fingerprint(pdf_path)
+        # The file was touched but its content is identical: only refresh the fingerprint
+        if same_splitter and entry["sha256"] == fingerprint["sha256"]:
+            entry.update(fingerprint)
+            save_manifest(db_path, manifest)
+            summary["unchanged"] += 1
+            continue
+
+        # Embed and upsert the chunks batch by batch; stable IDs make this idempotent
+        manifest["lexical_index_stale"] = True
+        chunk_ids = set()
+        chunks = iter_chunks(iter_pages(pdf_path, author_name, file_hash=fingerprint["sha256"]),
+                             text_splitter)
+        for batch in batched(chunks, batch_size):
+            batch_ids = [chunk_id(chunk) for chunk in batch]
+            vector_store.add_documents(batch, ids=batch_ids)
+            lexical_index.add(batch_ids, batch)
+            chunk_ids.update(batch_ids)
+
+        # Delete chunks of the previous version that no longer exist in the new one
+        if entry:
+            stale_ids = [id_ for id_ in get_chunk_ids(vector_store, source)
+                         if id_ not in chunk_ids]
+            for ids in batched(stale_ids, batch_size):
+                vector_store.delete(ids=ids)
+                lexical_index.remove(ids)
+
+        status = "updated" if entry else "added"
+        summary[status] += 1
+        # Record the book as soon as it is fully stored, making its progress durable
+        indexed_files[source] = {**fingerprint, "chunks": len(chunk_ids), "splitter": settings}
+        save_manifest(db_path, manifest)
+        if progress:
+            progress(source, status, len(chunk_ids))
+
+    # Save the lexical index once, then clear the flag that would trigger its rebuild
+    if manifest.pop("lexical_index_stale", False):
+        lexical_index.save(db_path)
+    save_manifest(db_path, manifest)
+
+    return summary
+
+
+def get_openai_embeddings():
+    """
+    Creates the OpenAI embeddings used to build and query the vector store.
+
+    Document embeddings go through the persistent embedding cache, so rebuilding the
+    store only pays for chunks that were never embedded before. Cache misses are embedded
+    with the batched, concurrent, rate-limit aware OpenAI client.
+
+    Returns:
+        CachedEmbeddings: OpenAI embeddings backed by the on-disk embedding cache.
+    """
+    return CachedEmbeddings(AsyncOpenAIEmbeddings())
+
+
+def get_hf_embeddings():
+    """
+    Creates the Hugging Face embeddings used to build and query the Hugging Face vector store.
+
+    The underlying model comes from the process-wide registry, so it is loaded only once
+    no matter how many stores or CLI options use it.
+
+    Returns:
+        CachedEmbeddings: Hugging Face embeddings backed by the on-disk embedding cache.
+    """
+    return CachedEmbeddings(get_hf_embedding_model())
+
+
+def prepare_projection(embeddings, chunks, db_path):
+    """
+    Sets up the vector storage of a vector store being created from chunks.
+
+    With VECTOR_PCA_DIMENSIONS, a PCA projection is fitted on the chunk embeddings and saved
+    in the store directory; the embeddings are cached, so the chunks are not embedded twice.
+    Otherwise any projection left by a previous store is removed.
+
+    Args:
+        embeddings (Embeddings): The full-precision embeddings of the store.
+        chunks (list): The chunks the store is created from.
+        db_path (Path): Directory of the vector store.
+
+    Returns:
+        Embeddings: The embedding function to create the store with.
+    """
+    if not VECTOR_PCA_DIMENSIONS:
+        (Path(db_path) / VECTOR_PROJECTION_NAME).unlink(missing_ok=True)
+        return embeddings
+
+    vectors = embeddings.embed_documents([chunk.page_content for chunk in chunks])
+    projection = PCAProjection.fit(vectors, VECTOR_PCA_DIMENSIONS)
+    projection.save(db_path)
+
+    return ProjectedEmbeddings(embeddings, projection)
 
 
-def create_vector_store(chunks):
+def create_vector_store(chunks, db_path=DB_PATH):
     """
     Creates a vector store from the document chunks, embeds them using OpenAI embeddings,
     and persists the store to disk. If an existing vector store is found, it deletes it.
 
     Args:
         chunks: A list of document chunks to be embedded and stored.
+        db_path (Path): Directory of the vector store.
 
     Returns:
         vector_store: The created vector store object.
     """
     # Attempt to load an existing vector store
-    vector_store = load_vector_store()
+    vector_store = load_vector_store(db_path)
 
     # If a vector store exists, delete its contents
     if vector_store:
         vector_store.delete_collection()
 
+    # Fit the dimension reduction of the stored vectors, if enabled
+    embeddings = prepare_projection(get_openai_embeddings(), chunks, db_path)
+
     # Create a new vector store by embedding the document chunks
+    ids = [chunk_id(chunk) for chunk in chunks]  # Stable IDs for incremental updates
     vector_store = Chroma.from_documents(
         documents=chunks,  # Provide the chunks for embedding
-        embedding=OpenAIEmbeddings(),  # Use OpenAI embeddings for vector creation
-        persist_directory=str(DB_PATH)  # Directory to persist the vector store
+        embedding=embeddings,  # Use OpenAI embeddings for vector creation
+        ids=ids,
+        persist_directory=str(db_path),  # Directory to persist the vector store
+        collection_metadata=hnsw_metadata()  # HNSW index parameters from the configuration
     )
 
+    # Build the lexical (BM25) index used by hybrid retrieval next to the collection
+    LexicalIndex.from_documents(ids, chunks).save(db_path)
+
+    # Record the indexed files so later updates only embed what changed
+    save_manifest(db_path, build_manifest(chunks))
+
+    # Remove the segment files of the deleted collection
+    collect_garbage(db_path)
+
     return vector_store
 
 
-def load_vector_store():
+def update_vector_store(rebuild=False, progress=None, db_path=DB_PATH, batch_size=INGEST_BATCH_SIZE,
+                        knowledge_base_dir=KNOWLEDGE_BASE_DIR):
+    """
+    Incrementally updates the OpenAI vector store from the knowledge base directory,
+    embedding only new or changed books and removing the chunks of deleted books.
+    The vector store is created if it does not exist yet.
+
+    Books are streamed into the store in batches, so this is also the bounded-memory,
+    resumable way to build a large store from scratch (`rebuild=True`).
+
+    Args:
+        rebuild (bool): If True, clear the store first and re-index every book.
+        progress (callable, optional): Called after each processed book (see `index_documents`).
+        db_path (Path): Directory of the vector store.
+        batch_size (int): Number of chunks embedded and upserted per batch.
+        knowledge_base_dir (Path): Root directory of the knowledge base.
+
+    Returns:
+        Tuple:
+            - vector_store (Chroma): The updated vector store object.
+            - summary (dict): The number of added, updated, removed and unchanged books.
+    """
+    vector_store = Chroma(
+        persist_directory=str(db_path),
+        embedding_function=store_embeddings(get_openai_embeddings(), db_path),
+        collection_metadata=hnsw_metadata()  # Only used if the collection is created
+    )
+    summary = index_documents(vector_store, db_path, batch_size, progress, knowledge_base_dir, rebuild)
+
+    return vector_store, summary
+
+
+def load_vector_store(db_path=DB_PATH):
     """
     Loads an existing vector store from disk if it exists.
 
+    Args:
+        db_path (Path): Directory of the vector store.
+
     Returns:
         vector_store: The loaded vector store object if it exists, or None otherwise.
     """
     # Check if the vector store directory exists
-    if DB_PATH.exists():
+    if Path(db_path).exists():
         # Load the existing vector store
         vector_store = Chroma(
             # Directory where the vector store is persisted
-            persist_directory=str(DB_PATH),
-            embedding_function=OpenAIEmbeddings()  # Embedding function for consistency
+            persist_directory=str(db_path),
+            embedding_function=store_embeddings(
+                get_openai_embeddings(), db_path),  # Embedding function for consistency
+            collection_metadata=hnsw_metadata()  # Only used if the collection is created
         )
+        # Restore the collection if an index rebuild was interrupted
+        recover_interrupted_rebuild(vector_store)
         return vector_store
     else:
         # Return None if no vector store exists
         return None
 
 
-def create_vector_store_hf(chunks):
+def create_vector_store_hf(chunks, db_path=None):
     """
     Creates a vector store from document chunks using Hugging Face embeddings.
 
@@ -135,31 +748,48 @@ def create_vector_store_hf(chunks):
 
     Args:
         chunks (list): A list of document chunks to be embedded and stored.
+        db_path (Path, optional): Directory of the vector store (default: DB_PATH with an "_hf" suffix).
 
     Returns:
         vector_store (Chroma): The created vector store object.
     """
-    db_path = Path(
-        f"{str(DB_PATH)}_hf")  # Define the path for the Hugging Face vector store
+    # Define the path for the Hugging Face vector store
+    db_path = Path(db_path or f"{str(DB_PATH)}_hf")
 
     # Step 1: Initialize Hugging Face embeddings using the specified model
-    hf_embeddings = HuggingFaceEmbeddings(model_name=HF_EMBEDDINGS_MODEL)
+    hf_embeddings = get_hf_embeddings()
 
     # Step 2: Attempt to load an existing vector store
-    vector_store = load_vector_store_hf()
+    vector_store = load_vector_store_hf(db_path)
 
     # Step 3: If an existing vector store is found, delete its contents
     if vector_store:
         vector_store.delete_collection()
 
-    # Step 4: Create a new vector store using the Hugging Face embeddings
+    # Step 4: Fit the dimension reduction of the stored vectors, if enabled
+    hf_embeddings = prepare_projection(hf_embeddings, chunks, db_path)
+
+    # Step 5: Create a new vector store using the Hugging Face embeddings
+    ids = [chunk_id(chunk) for chunk in chunks]  # Stable IDs for incremental updates
     vector_store = Chroma.from_documents(
         documents=chunks,              # Preprocessed chunks to be embedded
         embedding=hf_embeddings,       # Hugging Face embeddings function
+        ids=ids,
         # Directory for storing the vector store
-        persist_directory=str(db_path)
+        persist_directory=str(db_path),
+        # HNSW index parameters from the configuration
+        collection_metadata=hnsw_metadata()
     )
 
+    # Step 6: Build the lexical (BM25) index used by hybrid retrieval next to the collection
+    LexicalIndex.from_documents(ids, chunks).save(db_path)
+
+    # Step 7: Record the indexed files so later updates only embed what changed
+    save_manifest(db_path, build_manifest(chunks))
+
+    # Step 8: Remove the segment files of the deleted collection
+    collect_garbage(db_path)
+
     return vector_store
     # Notes:
     # - Install `sentence-transformers` if not already installed: pip install sentence-transformers
@@ -169,7 +799,7 @@ def create_vector_store_hf(chunks):
     # - This function is a direct alternative to OpenAI embeddings for cost-effective and offline usage.
 
 
-def load_vector_store_hf():
+def load_vector_store_hf(db_path=None):
     """
     Loads an existing vector store that was created using Hugging Face embeddings.
 
@@ -177,29 +807,224 @@ def load_vector_store_hf():
     directory. If the directory exists, the function initializes the store with 
     Hugging Face embeddings. If no vector store exists, it returns `None`.
 
+    Args:
+        db_path (Path, optional): Directory of the vector store (default: DB_PATH with an "_hf" suffix).
+
     Returns:
         vector_store (Chroma or None): The loaded vector store object, or `None`
                                        if no existing vector store is found.
     """
-    db_path = Path(
-        f"{str(DB_PATH)}_hf")  # Define the path for the Hugging Face vector store
+    # Define the path for the Hugging Face vector store
+    db_path = Path(db_path or f"{str(DB_PATH)}_hf")
 
     # Step 1: Initialize Hugging Face embeddings using the specified model
-    hf_embeddings = HuggingFaceEmbeddings(model_name=HF_EMBEDDINGS_MODEL)
+    hf_embeddings = get_hf_embeddings()
 
     # Step 2: Check if the vector store directory exists
     if db_path.exists():
         # Load the vector store if the directory is found
         vector_store = Chroma(
             persist_directory=str(db_path),
-            embedding_function=hf_embeddings
+            embedding_function=store_embeddings(hf_embeddings, db_path),
+            collection_metadata=hnsw_metadata()  # Only used if the collection is created
         )
+        # Restore the collection if an index rebuild was interrupted
+        recover_interrupted_rebuild(vector_store)
         return vector_store
     else:
         # Return None if no vector store exists
         return None
 
 
+def update_vector_store_hf(rebuild=False, progress=None, db_path=None, batch_size=INGEST_BATCH_SIZE,
+                           knowledge_base_dir=KNOWLEDGE_BASE_DIR):
+    """
+    Incrementally updates the Hugging Face vector store from the knowledge base directory,
+    embedding only new or changed books and removing the chunks of deleted books.
+    The vector store is created if it does not exist yet.
+
+    Args:
+        rebuild (bool): If True, clear the store first and re-index every book.
+        progress (callable, optional): Called after each processed book (see `index_documents`).
+        db_path (Path, optional): Directory of the vector store (default: DB_PATH with an "_hf" suffix).
+        batch_size (int): Number of chunks embedded and upserted per batch.
+        knowledge_base_dir (Path): Root directory of the knowledge base.
+
+    Returns:
+        Tuple:
+            - vector_store (Chroma): The updated vector store object.
+            - summary (dict): The number of added, updated, removed and unchanged books.
+    """
+    # Define the path for the Hugging Face vector store
+    db_path = Path(db_path or f"{str(DB_PATH)}_hf")
+
+    vector_store = Chroma(
+        persist_directory=str(db_path),
+        embedding_function=store_embeddings(get_hf_embeddings(), db_path),
+        collection_metadata=hnsw_metadata()  # Only used if the collection is created
+    )
+    summary = index_documents(vector_store, db_path, batch_size, progress, knowledge_base_dir, rebuild)
+
+    return vector_store, summary
+
+
+def build_sweep_store(pages, chunk_size, chunk_overlap, embeddings, db_path):
+    """
+    Splits pages with one chunk configuration and builds a throwaway vector store from the chunks.
+
+    Args:
+        pages (list): The page documents of the knowledge base.
+        chunk_size (int): Maximum size of a chunk, in the units of the configured splitter.
+        chunk_overlap (int): Overlap between consecutive chunks, in the units of the configured splitter.
+        embeddings (Embeddings): The embeddings of the store (through the embedding cache).
+        db_path (Path): Directory of the throwaway store.
+
+    Returns:
+        Tuple:
+            - vector_store (Chroma): The store, with its lexical index.
+            - chunks (list): The chunks.
+            - timings (dict): Seconds spent splitting and building the store.
+    """
+    start_time = time.perf_counter()
+    chunks = get_text_splitter(chunk_size, chunk_overlap).split_documents(pages)
+    split_seconds = time.perf_counter() - start_time
+
+    ids = [chunk_id(chunk) for chunk in chunks]
+    vector_store = Chroma.from_documents(
+        documents=chunks,
+        embedding=embeddings,
+        ids=ids,
+        persist_directory=str(db_path),
+        collection_metadata=hnsw_metadata()
+    )
+    LexicalIndex.from_documents(ids, chunks).save(db_path)
+
+    return vector_store, chunks, {"split": split_seconds,
+                                  "build": time.perf_counter() - start_time - split_seconds}
+
+
+def sweep_chunking(configurations=CHUNK_SWEEP_CONFIGS, embeddings=None, workers=INGEST_WORKERS,
+                   questions_path=BENCHMARK_QUESTIONS_PATH):
+    """
+    Compares chunk settings by building a throwaway vector store for each and benchmarking its retrieval.
+
+    PDFs are parsed once (through the page-text cache) and re-split with every configuration;
+    chunks are embedded through the embedding cache, so only chunks never seen before cost
+    an embedding call and re-running a sweep is nearly free. The stores are built in
+    parallel, then benchmarked one at a time (see `benchmark.evaluate_store`, without
+    answers) so latencies are not skewed, and finally deleted.
+
+    Args:
+        configurations (list): The (chunk size, chunk overlap) pairs to compare.
+        embeddings (Embeddings, optional): The embeddings to use (the OpenAI embeddings by default).
+        workers (int): Number of worker processes for parsing and threads for building stores.
+        questions_path (Path): The labeled benchmark questions.
+
+    Returns:
+        list: One result per configuration: chunk settings and counts, index size, timings and retrieval metrics.
+    """
+    embeddings = embeddings or get_openai_embeddings()
+    questions = load_questions(questions_path)
+
+    # Step 1: Load the pages of every book, parsing only the books not cached yet
+    pdf_files = list_knowledge_base_files()
+    author_names = [author_name for author_name, _ in pdf_files]
+    pdf_paths = [pdf_path for _, pdf_path in pdf_files]
+    start_time = time.perf_counter()
+    pages = []
+    if workers > 1 and len(pdf_files) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pdf_files))) as executor:
+            for file_pages in executor.map(load_pdf, pdf_paths, author_names):
+                pages.extend(file_pages)
+    else:
+        for file_pages in map(load_pdf, pdf_paths, author_names):
+            pages.extend(file_pages)
+    print(f"   - Loaded {len(pages):,} pages from {len(pdf_files)} books in "
+          f"{time.perf_counter() - start_time:.2f}s")
+
+    # Step 2: Build one throwaway store per configuration, in parallel
+    sweep_dir = Path(tempfile.mkdtemp(prefix="calismind_sweep_"))
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(configurations)))) as executor:
+            builds = list(executor.map(
+                lambda configuration: build_sweep_store(
+                    pages, *configuration, embeddings, sweep_dir / f"{configuration[0]}_{configuration[1]}"),
+                configurations))
+
+        # Step 3: Benchmark the stores one at a time
+        results = []
+        for (chunk_size, chunk_overlap), (vector_store, chunks, timings) in zip(configurations, builds):
+            db_path = sweep_dir / f"{chunk_size}_{chunk_overlap}"
+            metrics = evaluate_store(vector_store, db_path, questions, answers=False)
+            results.append({
+                "splitter": TEXT_SPLITTER,
+                "chunk_size": chunk_size,
+                "chunk_overlap": chunk_overlap,
+                "chunks": len(chunks),
+                "mean_chunk_chars": sum(len(chunk.page_content) for chunk in chunks) / max(len(chunks), 1),
+                "index_bytes": store_footprint(db_path)["total"],
+                "split_seconds": timings["split"],
+                "build_seconds": timings["build"],
+                **{key: metrics[key] for key in ("questions", "recall_at_k", "mrr", "retrieval_ms",
+                                                 "prompt_tokens")},
+            })
+    finally:
+        # Step 4: Delete the throwaway stores
+        shutil.rmtree(sweep_dir, ignore_errors=True)
+
+    return results
+
+
+def print_sweep_results(results):
+    """
+    Prints the results of a chunk settings sweep as a table (see `sweep_chunking`).
+    """
+    print(f"\n   {'Size':>6} {'Overlap':>8} {'Chunks':>8} {'Index MB':>9} {'Build s':>8} "
+          f"{'Recall@k':>9} {'MRR':>6} {'p50 ms':>7} {'p95 ms':>7} {'Prompt tok':>10}")
+    for result in results:
+        if not result["questions"]:
+            quality = f"{'n/a':>9} {'n/a':>6} {'n/a':>7} {'n/a':>7} {'n/a':>10}"
+        else:
+            quality = (f"{result['recall_at_k']:>9.1%} {result['mrr']:>6.3f} "
+                       f"{result['retrieval_ms']['p50']:>7.1f} {result['retrieval_ms']['p95']:>7.1f} "
+                       f"{result['prompt_tokens']['mean']:>10,.0f}")
+        print(f"   {result['chunk_size']:>6} {result['chunk_overlap']:>8} {result['chunks']:>8,} "
+              f"{result['index_bytes'] / 1024 ** 2:>9.2f} {result['build_seconds']:>8.1f} {quality}")
+
+
+def print_load_report(timings):
+    """
+    Prints the per-file timing report of document loading (see `load_and_split_pdf`).
+    """
+    print(f"\n   {'Book':<40} {'Backend':<10} {'Cache':<6} {'Pages':>6} {'Chunks':>7} "
+          f"{'Load (s)':>9} {'Split (s)':>10}")
+    for timing in timings:
+        print(f"   {Path(timing['source']).name[:40]:<40} {timing['backend']:<10} "
+              f"{'hit' if timing['cached'] else 'miss':<6} {timing['pages']:>6,} {timing['chunks']:>7,} "
+              f"{timing['load_seconds']:>9.3f} {timing['split_seconds']:>10.3f}")
+
+    hits = sum(timing["cached"] for timing in timings)
+    print(f"\n   - Total: {sum(timing['pages'] for timing in timings):,} pages in "
+          f"{sum(timing['load_seconds'] for timing in timings):.2f}s of loading and "
+          f"{sum(timing['split_seconds'] for timing in timings):.2f}s of splitting "
+          f"({hits}/{len(timings)} books from the page-text cache)")
+
+
+def print_splitter_comparison(results):
+    """
+    Prints the comparison of the text splitters as a table (see `splitters.compare_splitters`).
+    """
+    print(f"\n   {'Splitter':<12} {'Size':>6} {'Overlap':>8} {'Seconds':>8} {'Pages/s':>9} {'Chunks':>8} "
+          f"{'Mean tok':>9} {'Max tok':>8} {'Total tok':>10} {'Oversized':>10}")
+    for result in results:
+        marker = " *" if result["kind"] == TEXT_SPLITTER else ""
+        print(f"   {result['kind'] + marker:<12} {result['chunk_size']:>6} {result['chunk_overlap']:>8} "
+              f"{result['seconds']:>8.3f} {result['pages_per_sec']:>9,.0f} {result['chunks']:>8,} "
+              f"{result['mean_tokens']:>9,.0f} {result['max_tokens']:>8,} {result['total_tokens']:>10,} "
+              f"{result['oversized']:>10,}")
+    print("\n   * Configured splitter (TEXT_SPLITTER). Sizes are in tokens for \"token\", characters otherwise.")
+
+
 def document_stats(documents, chunks):
     """
     Prints statistics about the loaded documents and their chunks.
@@ -273,9 +1098,263 @@ def vector_store_stats(vector_store):
     print(f"- Number of chunks (processed documents): {count:,}")
     print(f"- Number of vectors in the store: {count:,}")
     print(f"- Vector dimensionality: {dimensions:,}")
+    parameters = index_parameters(vector_store)
+    print(f"- HNSW index: space={parameters['space']}, M={parameters['M']}, "
+          f"construction_ef={parameters['construction_ef']}, search_ef={parameters['search_ef']}")
+
+    # Vector storage footprint (index files and database, shared by the stored vectors)
+    footprint = store_footprint(vector_store._persist_directory)
+    stored_bytes = sum(collection["bytes"] for collection in footprint["collections"].values())
+    print(f"- Vector storage: float32, {dimensions * 4:,} bytes per vector"
+          f" ({(stored_bytes + footprint['database']) / max(count, 1):,.0f} bytes per chunk on disk)")
+
+    # Dimension reduction and its recall impact, if the store keeps reduced vectors
+    embeddings = getattr(vector_store, "_embedding_function", None)
+    if isinstance(embeddings, ProjectedEmbeddings):
+        full_dimensions = embeddings.projection.full_dimensions
+        print(f"- PCA reduction: {full_dimensions:,} -> {dimensions:,} dimensions"
+              f" ({full_dimensions / dimensions:.1f}x fewer bytes per vector)")
+        recall = projection_recall(vector_store, embeddings)
+        if recall:
+            print(f"\tRecall@{recall['k']} vs full precision: {recall['recall']:.1%},"
+                  f" {recall['rescored_recall']:.1%} with rescoring ({recall['queries']} queries)")
+        embeddings = embeddings.embeddings
+
+    # Embedding cache statistics, if the store embeds through the cache
+    if isinstance(embeddings, CachedEmbeddings):
+        cache_stats = embeddings.stats()
+        session_total = cache_stats["hits"] + cache_stats["misses"]
+        all_time_total = cache_stats["total_hits"] + \
+            cache_stats["total_misses"]
+        print(f"- Embedding cache ({cache_stats['model']}):")
+        print(f"\tSession hits/misses: {cache_stats['hits']:,} / {cache_stats['misses']:,}"
+              f" ({cache_stats['hits'] / session_total if session_total else 0:.1%} hit rate)")
+        print(f"\tAll-time hits/misses: {cache_stats['total_hits']:,} / {cache_stats['total_misses']:,}"
+              f" ({cache_stats['total_hits'] / all_time_total if all_time_total else 0:.1%} hit rate)")
+        print(f"\tCached vectors: {cache_stats['entries']:,}"
+              f" ({cache_stats['size_bytes'] / 1024 ** 2:,.1f} MB of {cache_stats['max_bytes'] / 1024 ** 2:,.0f} MB)")
+        embeddings = embeddings.embeddings
+
+    # Embedding throughput, if the store embeds through the batched OpenAI client
+    if isinstance(embeddings, AsyncOpenAIEmbeddings) and embeddings.stats()["last_run"]:
+        throughput = embeddings.stats()["total"]
+        print("- Embedding throughput (this session):")
+        print(f"\t{throughput['chunks']:,} chunks / {throughput['tokens']:,} tokens"
+              f" in {throughput['seconds']:,.1f}s ({throughput['requests']:,} requests,"
+              f" {throughput['rate_limited']:,} rate-limited)")
+        print(f"\t{throughput['chunks_per_sec']:,.1f} chunks/sec,"
+              f" {throughput['tokens_per_sec']:,.0f} tokens/sec")
     print(f"{'=' * 40}\n")
 
 
+def print_index_recall(vector_store):
+    """
+    Prints the recall of a vector store's HNSW index against exact search, and the query latency of both.
+
+    Args:
+        vector_store (Chroma): The vector store.
+    """
+    recall = index_recall(vector_store)
+    if recall is None:
+        print("   - The vector store is empty.")
+        return
+    print(f"   - Recall@{recall['k']} vs exact search: {recall['recall']:.1%} ({recall['queries']} queries)")
+    print(f"   - Query latency: {recall['ann_ms']:.2f} ms (HNSW) vs {recall['exact_ms']:.2f} ms (exact)")
+
+
+def print_store_footprint(footprint):
+    """
+    Prints the on-disk size of a vector store per collection (see `maintenance.store_footprint`).
+
+    Args:
+        footprint (dict): The store footprint.
+    """
+    for name, collection in footprint["collections"].items():
+        print(f"   - Collection '{name}': {collection['records']:,} records, "
+              f"{collection['bytes'] / 1024 ** 2:,.2f} MB of index files")
+    print(f"   - Database (all collections): {footprint['database'] / 1024 ** 2:,.2f} MB")
+    print(f"   - Orphaned segments: {footprint['orphaned'] / 1024 ** 2:,.2f} MB")
+    print(f"   - Total: {footprint['total'] / 1024 ** 2:,.2f} MB")
+
+
+def print_indexing_progress(source, status, num_chunks):
+    """
+    Prints the progress of an indexing run after each processed book.
+
+    Args:
+        source (str): The source path of the book.
+        status (str): What happened to the book ("added", "updated" or "removed").
+        num_chunks (int): Number of chunks stored for the book.
+    """
+    print(f"   - [{status}] {Path(source).stem.title()} ({num_chunks:,} chunks)")
+
+
+def emit_event(stream, event, **fields):
+    """
+    Writes a progress event of the batch CLI as one JSON line.
+
+    Args:
+        stream: The output stream (stdout of the batch CLI).
+        event (str): The event name.
+        **fields: The event data.
+    """
+    stream.write(json.dumps({"event": event, **fields}, default=str) + "\n")
+    stream.flush()
+
+
+def parse_batch_args(argv):
+    """
+    Parses the arguments of the batch CLI (see `run_batch_cli`).
+
+    Args:
+        argv (list): The command-line arguments, starting with the subcommand.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        prog="vectorize.py",
+        description="Build and maintain the CalisMind vector stores without the interactive menu. "
+                    "Progress and timing are written to stdout as JSON lines, messages to stderr. "
+                    "Run without arguments for the interactive menu.")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--backend", choices=["openai", "hf"], default="openai",
+                        help="Embedding backend of the vector store.")
+    common.add_argument("--db-path", type=Path,
+                        help="Vector store directory (default: DB_PATH, with an \"_hf\" suffix for --backend hf).")
+    common.add_argument("--knowledge-base", type=Path, default=KNOWLEDGE_BASE_DIR,
+                        help="Knowledge base directory (one folder per author).")
+    common.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                        help="Worker processes used to parse and split the PDFs.")
+    common.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE,
+                        help="Chunks embedded and upserted per batch by incremental updates.")
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("ingest", parents=[common],
+                          help="Load and split the documents (fills the page-text cache).")
+    subparsers.add_parser("build", parents=[common],
+                          help="Create the vector store from scratch.")
+    update = subparsers.add_parser("update", parents=[common],
+                                   help="Incrementally update the vector store (streamed, resumable).")
+    update.add_argument("--rebuild", action="store_true",
+                        help="Clear the store first and re-index every book.")
+    subparsers.add_parser("stats", parents=[common],
+                          help="Print the vector store statistics.")
+    subparsers.add_parser("gc", parents=[common],
+                          help="Remove orphaned segments and vacuum the vector store.")
+    bench = subparsers.add_parser("bench", parents=[common],
+                                  help="Benchmark retrieval (and answers) of the vector store.")
+    bench.add_argument("--questions", type=Path, default=BENCHMARK_QUESTIONS_PATH,
+                       help="JSON file of questions labeled with their relevant books.")
+    bench.add_argument("--repeats", type=int, default=BENCHMARK_REPEATS,
+                       help="Timed runs per question.")
+    bench.add_argument("--no-answers", action="store_true",
+                       help="Only benchmark retrieval (no chat model calls).")
+
+    return parser.parse_args(argv)
+
+
+def run_batch_command(args, emit):
+    """
+    Runs one command of the batch CLI.
+
+    Args:
+        args (argparse.Namespace): The parsed arguments (see `parse_batch_args`).
+        emit (callable): Writes a progress event (see `emit_event`).
+
+    Returns:
+        dict: The results of the command, reported with the final "done" event.
+    """
+    use_hf = args.backend == "hf"
+    db_path = Path(args.db_path or (f"{str(DB_PATH)}_hf" if use_hf else DB_PATH))
+
+    if args.command in ("ingest", "build"):
+        print(f"🔄 Loading documents from {args.knowledge_base} and splitting them into chunks...")
+        documents, chunks = load_and_process_documents(
+            args.workers, lambda timing: emit("file", **timing), args.knowledge_base)
+        if not documents:
+            raise FileNotFoundError(f"No PDF files found in {args.knowledge_base}")
+        if args.command == "ingest":
+            document_stats(documents, chunks)
+            return {"documents": len(documents), "chunks": len(chunks)}
+
+        print(f"🛠️ Creating the {args.backend} vector store in {db_path}...")
+        start_time = time.perf_counter()
+        (create_vector_store_hf if use_hf else create_vector_store)(chunks, db_path)
+        emit("stored", db_path=db_path, chunks=len(chunks), seconds=time.perf_counter() - start_time)
+        return {"db_path": db_path, "documents": len(documents), "chunks": len(chunks)}
+
+    if args.command == "update":
+        print(f"🔁 Incrementally updating the {args.backend} vector store in {db_path}...")
+        last_time = time.perf_counter()
+
+        def progress(source, status, num_chunks):
+            nonlocal last_time
+            now = time.perf_counter()
+            emit("book", source=source, status=status, chunks=num_chunks, seconds=now - last_time)
+            last_time = now
+
+        _, summary = (update_vector_store_hf if use_hf else update_vector_store)(
+            args.rebuild, progress, db_path, args.batch_size, args.knowledge_base)
+        return {"db_path": db_path, **summary}
+
+    if not (db_path / "chroma.sqlite3").exists():
+        raise FileNotFoundError(f"No vector store found in {db_path}")
+
+    if args.command == "gc":
+        print(f"🧹 Removing orphaned segments and vacuuming {db_path}...")
+        result = collect_garbage(db_path)
+        print_store_footprint(result["after"])
+        return {"db_path": db_path, "removed": result["removed"], "freed": result["freed"],
+                "before": result["before"]["total"], "after": result["after"]["total"]}
+
+    vector_store = (load_vector_store_hf if use_hf else load_vector_store)(db_path)
+    if args.command == "stats":
+        vector_store_stats(vector_store)
+        return {"db_path": db_path, "chunks": vector_store._collection.count(),
+                "index": index_parameters(vector_store), "bytes": store_footprint(db_path)["total"]}
+
+    print(f"📏 Benchmarking the {args.backend} vector store in {db_path}...")
+    results = evaluate_store(vector_store, db_path, load_questions(args.questions),
+                             args.repeats, not args.no_answers)
+    return {"db_path": db_path, **{key: value for key, value in results.items() if key != "results"}}
+
+
+def run_batch_cli(argv):
+    """
+    Non-interactive CLI for scripted runs (cron jobs, containers, build nodes), e.g.:
+
+        python vectorize.py update --backend hf --batch-size 128
+
+    stdout only carries JSON lines: a "start" event, progress events ("file" per loaded
+    PDF, "stored", "book" per indexed book) and a final "done" event with the results and
+    the total time, or an "error" event. Human-readable messages are written to stderr.
+
+    Args:
+        argv (list): The command-line arguments, starting with the subcommand.
+
+    Returns:
+        int: The exit code (1 if the command failed, 0 otherwise).
+    """
+    args = parse_batch_args(argv)
+    emit = partial(emit_event, sys.stdout)
+    start_time = time.perf_counter()
+    emit("start", command=args.command, backend=args.backend)
+
+    # Keep stdout for the JSON lines; all the printed messages go to stderr
+    with redirect_stdout(sys.stderr):
+        try:
+            result = run_batch_command(args, emit)
+        except Exception as error:
+            print(f"\n❌ [Error]: {error}")
+            emit("error", command=args.command, error=str(error), type=type(error).__name__,
+                 seconds=time.perf_counter() - start_time)
+            return 1
+
+    emit("done", command=args.command, seconds=time.perf_counter() - start_time, **result)
+    return 0
+
+
 def main():
     """
     Interactive CLI to let the user choose an action and call the corresponding function.
@@ -294,13 +1373,16 @@ def main():
             print(f"  {idx}. {option}")
 
         # Get the user's choice
-        choice = input("\n\n=> Enter your choice (1-8): ")
+        choice = input(
+            f"\n\n=> Enter your choice (1-{len(VECTORIZE_CLI_CHOICES)}): ")
 
         # Handle the user's choice
         if choice == "1":
             print(
                 "\n\n🔄 Loading documents, adding metadata, and splitting into chunks...")
-            documents, chunks = load_and_process_documents()
+            timings = []
+            documents, chunks = load_and_process_documents(report=timings.append)
+            print_load_report(timings)
             print(
                 "\n✅ [Success]: Documents and chunks successfully loaded and processed!")
 
@@ -371,12 +1453,95 @@ def main():
                 print("\n✅ [Success]: Vector store statistics displayed!")
 
         elif choice == "8":
+            rebuild = input(
+                "\n=> Rebuild the vector store from scratch? (y/N): ").strip().lower() == "y"
+            print("\n\n🔁 Incrementally updating the vector store...\n")
+            try:
+                vector_store, summary = update_vector_store(
+                    rebuild=rebuild, progress=print_indexing_progress)
+            except (FileNotFoundError, ValueError) as error:
+                print(f"\n❌ [Error]: {error}")
+            else:
+                print(
+                    f"\n✅ [Success]: Vector store updated! Books added: {summary['added']}, "
+                    f"updated: {summary['updated']}, removed: {summary['removed']}, "
+                    f"unchanged: {summary['unchanged']}.")
+
+        elif choice == "9":
+            rebuild = input(
+                "\n=> Rebuild the vector store from scratch? (y/N): ").strip().lower() == "y"
+            print(
+                "\n\n🔁 Incrementally updating the vector store using a Hugging Face open-source model...\n")
+            try:
+                vector_store, summary = update_vector_store_hf(
+                    rebuild=rebuild, progress=print_indexing_progress)
+            except (FileNotFoundError, ValueError) as error:
+                print(f"\n❌ [Error]: {error}")
+            else:
+                print(
+                    f"\n✅ [Success]: Hugging Face vector store updated! Books added: {summary['added']}, "
+                    f"updated: {summary['updated']}, removed: {summary['removed']}, "
+                    f"unchanged: {summary['unchanged']}.")
+
+        elif choice == "10":
+            print("\n\n🧱 Rebuilding the HNSW index with the configured parameters...")
+            if vector_store is None:
+                print(
+                    "\n❌ [Error]: Please create or load a vector store first.")
+            else:
+                parameters = index_parameters(vector_store)
+                print(f"\n   Current index ({', '.join(f'{key}={value}' for key, value in parameters.items())}):")
+                print_index_recall(vector_store)
+                vector_store = rebuild_index(vector_store)
+                parameters = index_parameters(vector_store)
+                print(f"\n   Rebuilt index ({', '.join(f'{key}={value}' for key, value in parameters.items())}):")
+                print_index_recall(vector_store)
+                # The old collection's segment files are left on disk by Chroma
+                collect_garbage(vector_store._persist_directory)
+                print("\n✅ [Success]: HNSW index rebuilt and compacted!")
+
+        elif choice == "11":
+            print("\n\n🧹 Removing orphaned segments and vacuuming the vector stores...")
+            db_paths = [path for path in (DB_PATH, Path(f"{str(DB_PATH)}_hf"))
+                        if (path / "chroma.sqlite3").exists()]
+            if not db_paths:
+                print(
+                    "\n❌ [Error]: No vector store found. Please create one first (Option 3 or 5).")
+            for db_path in db_paths:
+                result = collect_garbage(db_path)
+                print(f"\n   {db_path} (before):")
+                print_store_footprint(result["before"])
+                print(f"\n   {db_path} (after):")
+                print_store_footprint(result["after"])
+                print(f"\n   🗑️ Removed {result['removed']} orphaned segments, "
+                      f"freed {result['freed'] / 1024 ** 2:,.2f} MB")
+            if db_paths:
+                print("\n✅ [Success]: Vector stores cleaned up!")
+
+        elif choice == "12":
+            use_hf = input(
+                "\n=> Use the Hugging Face model instead of OpenAI embeddings? (y/N): ").strip().lower() == "y"
+            print(f"\n\n🧪 Sweeping chunk settings {CHUNK_SWEEP_CONFIGS}...\n")
+            results = sweep_chunking(
+                embeddings=get_hf_embeddings() if use_hf else get_openai_embeddings())
+            print_sweep_results(results)
+            print("\n✅ [Success]: Chunk settings compared!")
+
+        elif choice == "13":
+            print("\n\n✂️ Comparing the text splitters...")
+            if documents is None:
+                print("\n❌ [Error]: Please load the documents first (Option 1).")
+            else:
+                print_splitter_comparison(compare_splitters(documents))
+                print("\n✅ [Success]: Text splitters compared!")
+
+        elif choice == "14":
             print("\n\n👋 Exiting the CLI. Goodbye!")
             break
 
         else:
             print(
-                "\n❌ [Error]: Invalid choice. Please enter a number between 1 and 8.")
+                f"\n❌ [Error]: Invalid choice. Please enter a number between 1 and {len(VECTORIZE_CLI_CHOICES)}.")
 
     print(f"\n\n{'=' * 80}\n")
 
@@ -387,9 +1552,18 @@ if __name__ == "__main__":
     Handles the following:
     1. Loads environment variables from a .env file for secure management of sensitive keys.
     2. Validates the presence of the OpenAI API key in the environment.
-    3. Starts the main interactive CLI for document processing and vector store management.
+    3. Optionally warms up the Hugging Face embedding model (see HF_WARMUP_ON_STARTUP).
+    4. Starts the main interactive CLI for document processing and vector store management.
+
+    With arguments (e.g., `python vectorize.py build --backend hf`), runs the batch CLI
+    instead (see `run_batch_cli`).
     """
 
+    # Scripted runs: run one subcommand non-interactively and exit with its status
+    if len(sys.argv) > 1:
+        load_dotenv()
+        sys.exit(run_batch_cli(sys.argv[1:]))
+
     # Step 1: Load environment variables from .env file
     print("\n🔄 Loading environment variables...")
     load_dotenv()
@@ -403,6 +1577,12 @@ if __name__ == "__main__":
     os.environ["OPENAI_API_KEY"] = openai_api_key
     print("✅ OpenAI API key successfully loaded.")
 
-    # Step 3: Start the main CLI
+    # Step 3: Optionally load the Hugging Face embedding model ahead of time
+    if HF_WARMUP_ON_STARTUP:
+        print("\n🔄 Warming up the Hugging Face embedding model...")
+        warm_up_hf_embedding_model()
+        print("✅ Hugging Face embedding model loaded.")
+
+    # Step 4: Start the main CLI
     print("\n🚀 Starting the CLI for document processing...\n")
     main()